@@ -0,0 +1,80 @@
+# Tableau de bord d'un coach suivi de nombreux clients (séances, objectifs, conversations, présence),
+# comparé à l'ancien écran : liste des clients puis /workouts, /stats et /goal pour chacun (1 + 3N requêtes)
+#   python benchmarks/bench_coach_dashboard.py --clients 500
+import argparse
+import random
+
+from common import load_server, measure, report
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--clients', type=int, default=500)
+parser.add_argument('--workouts', type=int, default=40, help='séances par client')
+parser.add_argument('--messages', type=int, default=20, help='messages par conversation')
+parser.add_argument('--online', type=float, default=0.2, help='part des clients connectés')
+parser.add_argument('--runs', type=int, default=50)
+parser.add_argument('--seed', type=int, default=42)
+args = parser.parse_args()
+
+server = load_server()
+random.seed(args.seed)
+with server.db_pool.connection() as conn:
+    coach_id = conn.execute("INSERT INTO users (username, password_hash, name, role) VALUES ('coach', 'x', 'Coach', 'coach')").lastrowid
+    # Un autre coach et ses clients, pour que la requête ne lise pas toute la base
+    other_coach_id = conn.execute("INSERT INTO users (username, password_hash, role) VALUES ('other', 'x', 'coach')").lastrowid
+    client_ids = []
+    for index in range(args.clients * 2):
+        client_ids.append(conn.execute('''
+            INSERT INTO users (username, password_hash, name, role, coach_id, age, weight, height, sport_goal)
+            VALUES (?, 'x', ?, 'user', ?, ?, ?, ?, ?)
+        ''', (f'client{index}', None if index % 50 == 0 else f'Client {random.randint(0, 10 ** 6)}',
+              coach_id if index < args.clients else other_coach_id, random.randint(18, 70),
+              random.randint(50, 110), random.randint(150, 200),
+              random.choice(['Prise de masse', 'Sèche', 'Maintien']))).lastrowid)
+    conn.executemany('INSERT INTO workouts (user_id, date, type, duration, exercises, status) VALUES (?, ?, ?, ?, ?, ?)', [
+        (user_id, f'{random.randint(2022, 2025)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}',
+         random.choice(['Course', 'Musculation', 'Cyclisme']), random.randint(600, 5400), 'Squat 4x8 @ 80kg', 'user')
+        for user_id in client_ids for _ in range(args.workouts)])
+    conn.executemany('INSERT INTO goals (user_id, goal_type, target_date, current_progress) VALUES (?, ?, ?, ?)', [
+        (user_id, random.choice(['Poids', 'Distance', 'Force']),
+         f'{random.randint(2024, 2027)}-{random.randint(1, 12):02d}-01', random.random())
+        for user_id in client_ids for _ in range(3)])
+    cursor = conn.cursor()
+    for user_id in client_ids:
+        coach = coach_id if user_id <= client_ids[args.clients - 1] else other_coach_id
+        for index in range(args.messages):
+            sender, receiver = (user_id, coach) if index % 2 else (coach, user_id)
+            server.record_message(cursor, sender, receiver, 'Séance terminée', f'2025-06-01 10:{index % 60:02d}:00')
+    server.rebuild_user_stats(cursor)
+    conn.execute('ANALYZE')
+with server.db_pool.connection() as conn:
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+for index, user_id in enumerate(random.sample(client_ids, int(len(client_ids) * args.online))):
+    server.presence.connect(user_id, f'sid-{index}')
+
+client = server.app.test_client()
+headers = {'Authorization': f'Bearer {server.issue_session_token(coach_id)}'}
+
+def get(url):
+    response = client.get(url, headers=headers)
+    assert response.status_code in (200, 404), (url, response.status_code)
+    return response.get_json()
+
+def fan_out():
+    for entry in get(f'/coach/clients/{coach_id}'):
+        for url in ('/workouts/{}?limit=1', '/stats/{}', '/goal/{}'):
+            get(url.format(entry['id']))
+
+def dashboard():
+    response = client.get(f'/coach/{coach_id}/dashboard', headers=headers)
+    assert response.status_code == 200, response.status_code
+    return response.get_json()
+
+assert len(dashboard()['clients']) == args.clients
+print(f'{args.clients} clients, {args.workouts} séances et {args.messages} messages chacun')
+report('ancien écran (1 + 3N requêtes)', measure(fan_out, max(3, args.runs // 10), warmup=1))
+report('tableau de bord', measure(dashboard, args.runs))
+with server.db_pool.connection() as conn:
+    report('requête seule', measure(lambda: conn.execute(server.COACH_DASHBOARD_QUERY, {'coach_id': coach_id}).fetchall(),
+                                    args.runs))
+report('présence seule', measure(server.presence.online_users, args.runs))
@@ -0,0 +1,81 @@
+# Connexions en rafale pendant un chat soutenu : p99 de /login et débit des messages,
+# avec le pool de hachage (par défaut) ou le calcul en ligne (--inline) pour comparaison
+#   python benchmarks/bench_login.py --rounds 12 --duration 10
+import argparse
+import os
+import threading
+import time
+
+from common import load_server, percentile
+
+
+def chat(server, user_ids, stop, counts, index):
+    sender, receiver = user_ids[index % len(user_ids)], user_ids[(index + 1) % len(user_ids)]
+    while not stop.is_set():
+        pending = server.message_writer.submit(sender, receiver, 'Bonjour coach')
+        pending.wait(30)
+        counts[index] += 1
+
+
+def login(server, users, stop, latencies, statuses, index):
+    client = server.app.test_client()
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = client.post('/login', json={'username': f'bench{index % users}', 'password': 'secret'})
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+# Tout se passe dans main() : les processus du pool de hachage (forkserver) réimportent ce script
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=12, help='coût bcrypt')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--login-threads', type=int, default=8)
+    parser.add_argument('--chat-threads', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--inline', action='store_true', help='hachage sur le thread de requête')
+    args = parser.parse_args()
+
+    os.environ['BCRYPT_LOG_ROUNDS'] = str(args.rounds)
+    server = load_server()
+    if args.inline:
+        server.password_hasher.workers = 0
+    password_hash = server._hash_password_worker('secret', args.rounds)
+    with server.db_pool.connection() as conn:
+        conn.executemany('INSERT INTO users (username, password_hash, name) VALUES (?, ?, ?)',
+                         [(f'bench{index}', password_hash, f'Bench {index}') for index in range(args.users)])
+        user_ids = [row[0] for row in conn.execute('SELECT id FROM users ORDER BY id')]
+    server.start_background_tasks()
+    # Démarre les processus du pool avant la mesure
+    server.password_hasher.check(password_hash, 'secret')
+
+    def run(with_logins):
+        stop = threading.Event()
+        counts, latencies, statuses = [0] * args.chat_threads, [], {}
+        threads = [threading.Thread(target=chat, args=(server, user_ids, stop, counts, index))
+                   for index in range(args.chat_threads)]
+        if with_logins:
+            threads += [threading.Thread(target=login, args=(server, args.users, stop, latencies, statuses, index))
+                        for index in range(args.login_threads)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return sum(counts) / args.duration, latencies, statuses
+
+    mode = 'en ligne' if args.inline else f'pool de {server.password_hasher.workers} processus'
+    print(f'bcrypt coût {args.rounds}, hachage {mode}, {args.login_threads} threads /login, '
+          f'{args.chat_threads} threads de chat, {args.duration:.0f} s par phase')
+    throughput, _, _ = run(with_logins=False)
+    print(f'chat seul                  {throughput:8.0f} messages/s')
+    throughput, latencies, statuses = run(with_logins=True)
+    print(f'chat pendant les /login    {throughput:8.0f} messages/s')
+    print(f'/login                     {len(latencies) / args.duration:8.1f} req/s'
+          f'   p50 {percentile(latencies, 0.5):.0f} ms   p99 {percentile(latencies, 0.99):.0f} ms   statuts {statuses}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# Plan de repas journalier sur un catalogue de recettes généré (objectif : moins de 50 ms)
+#   python benchmarks/bench_meal_plan.py --recipes 50000
+import argparse
+import random
+import statistics
+
+from common import load_server, measure, report
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--recipes', type=int, default=50000)
+parser.add_argument('--runs', type=int, default=100)
+parser.add_argument('--seed', type=int, default=42)
+parser.add_argument('--target-ms', type=float, default=50.0)
+args = parser.parse_args()
+
+CATEGORIES = ['Petit déjeuner', 'Déjeuner', 'Dîner', 'Collation']
+GOALS = ['Sèche', 'Prise de masse', 'Maintien', 'Déficit calorique', 'Perte de poids']
+PROFILES = [(70, 175, 30, 'Prise de masse'), (62, 165, 45, 'Sèche'), (85, 182, 25, 'Maintien'),
+            (95, 178, 50, 'Perdre du poids'), (58, 160, 35, '55 kg')]
+
+server = load_server()
+random.seed(args.seed)
+with server.db_pool.connection() as conn:
+    conn.executemany('''
+        INSERT INTO nutrition (name, ingredients, preparation_time, calories, category, goal_category)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(f'Recette {index}', 'ingrédients', random.randint(5, 90), random.randint(80, 1500),
+           random.choice(CATEGORIES), random.choice(GOALS)) for index in range(args.recipes)])
+    user_ids = [conn.execute('''
+        INSERT INTO users (username, password_hash, weight, height, age, sport_goal) VALUES (?, 'x', ?, ?, ?, ?)
+    ''', (f'bench{index}', *profile)).lastrowid for index, profile in enumerate(PROFILES)]
+    conn.execute('ANALYZE')
+with server.db_pool.connection() as conn:
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+client = server.app.test_client()
+headers = {user_id: {'Authorization': f'Bearer {server.issue_session_token(user_id)}'} for user_id in user_ids}
+
+def meal_plan(query=''):
+    user_id = random.choice(user_ids)
+    response = client.get(f'/user/{user_id}/meal-plan{query}', headers=headers[user_id])
+    assert response.status_code == 200, response.status_code
+    plan = response.get_json()
+    assert plan['meals'], plan
+    return plan
+
+# Sans aucun cache : candidats recalculés par SQLite puis programmation dynamique
+def cold():
+    server._meal_plan_cache.clear()
+    server._meal_plan_candidates_cache.clear()
+    meal_plan(f'?calories={random.randint(1400, 3600)}')
+
+# Candidats en cache (cas courant : catalogue inchangé), plan calculé pour un nouvel objectif
+def solve():
+    server._meal_plan_cache.clear()
+    meal_plan(f'?calories={random.randint(1400, 3600)}')
+
+print(f'{args.recipes} recettes')
+medians = []
+for label, function in (('sans cache', cold), ('candidats en cache', solve),
+                        ('profil (Mifflin-St Jeor)', lambda: (server._meal_plan_cache.clear(), meal_plan()))):
+    samples = measure(function, args.runs)
+    medians.append(statistics.median(samples))
+    report(label, samples)
+report('plan en cache', measure(meal_plan, args.runs))
+print(f"objectif {args.target_ms} ms : {'atteint' if max(medians) < args.target_ms else 'non atteint'} "
+      f'(pire médiane {max(medians):.2f} ms)')
@@ -0,0 +1,82 @@
+# Débit de /media/<sha256> et /uploads/<nom> contre un send_file nu, sur un vrai serveur HTTP local,
+# plus la latence des requêtes conditionnelles (304) et partielles (Range)
+#   python benchmarks/bench_media.py --size-mb 64 --runs 20
+import argparse
+import hashlib
+import http.client
+import os
+import statistics
+import threading
+
+from flask import send_file
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from common import load_server, measure, report
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--size-mb', type=int, default=64)
+parser.add_argument('--runs', type=int, default=20)
+parser.add_argument('--seed', type=int, default=42)
+args = parser.parse_args()
+
+server = load_server()
+content = hashlib.shake_256(str(args.seed).encode()).digest(args.size_mb * 1024 * 1024)
+sha256 = hashlib.sha256(content).hexdigest()
+os.makedirs(os.path.dirname(server.blob_path(sha256)), exist_ok=True)
+with open(server.blob_path(sha256), 'wb') as target:
+    target.write(content)
+legacy_path = os.path.join(server.UPLOAD_FOLDER, 'video.mp4')
+with open(legacy_path, 'wb') as target:
+    target.write(content)
+with server.db_pool.connection() as conn:
+    user_id = conn.execute("INSERT INTO users (username, password_hash) VALUES ('bench', 'x')").lastrowid
+    server.record_upload(conn.cursor(), 'video.mp4', server.blob_path(sha256), user_id, sha256, len(content),
+                         'video/mp4')
+
+
+# Référence : le même fichier sans ETag, cache ni requête en base
+@server.app.route('/bench/plain', methods=['GET'])
+def plain():
+    return send_file(os.path.abspath(server.blob_path(sha256)), mimetype='video/mp4')
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+
+http_server = make_server('127.0.0.1', 0, server.app, threaded=True, request_handler=QuietHandler)
+threading.Thread(target=http_server.serve_forever, daemon=True).start()
+connection = http.client.HTTPConnection('127.0.0.1', http_server.server_port)
+
+
+def get(url, headers=None, expected=200):
+    connection.request('GET', url, headers=headers or {})
+    response = connection.getresponse()
+    received = 0
+    while True:
+        chunk = response.read(server.UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        received += len(chunk)
+    assert response.status == expected, (url, response.status)
+    return response, received
+
+
+def throughput(label, url):
+    samples = measure(lambda: get(url), args.runs)
+    report(label, samples)
+    print(f'{"":<40} {args.size_mb / (statistics.median(samples) / 1000):8.0f} Mo/s')
+
+
+print(f'fichier de {args.size_mb} Mo')
+throughput('send_file nu', '/bench/plain')
+throughput('/media/<sha256>', f'/media/{sha256}')
+throughput('/uploads/<nom> (ancien dossier)', '/uploads/video.mp4')
+report('/media/<sha256> If-None-Match (304)',
+       measure(lambda: get(f'/media/{sha256}', {'If-None-Match': f'"{sha256}"'}, 304), args.runs * 10))
+report('/uploads/<nom> If-None-Match (304)',
+       measure(lambda: get('/uploads/video.mp4', {'If-None-Match': f'"{sha256}"'}, 304), args.runs * 10))
+report('/media/<sha256> Range 1 Mo',
+       measure(lambda: get(f'/media/{sha256}', {'Range': 'bytes=0-1048575'}, 206), args.runs * 10))
+http_server.shutdown()
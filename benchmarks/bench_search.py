@@ -0,0 +1,71 @@
+# Recherche plein texte sur un catalogue de recettes généré (objectif : moins de 10 ms par requête)
+#   python benchmarks/bench_search.py --recipes 100000
+import argparse
+import random
+import statistics
+
+from common import load_server, measure, report
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--recipes', type=int, default=100000)
+parser.add_argument('--runs', type=int, default=200)
+parser.add_argument('--seed', type=int, default=42)
+parser.add_argument('--target-ms', type=float, default=10.0)
+args = parser.parse_args()
+
+INGREDIENTS = ['poulet', 'riz', 'brocoli', 'saumon', 'quinoa', 'avocat', 'oeuf', 'épinard', 'patate douce',
+               'lentilles', 'tofu', 'flocons d\'avoine', 'banane', 'amandes', 'fromage blanc', 'dinde',
+               'courgette', 'pois chiches', 'thon', 'myrtilles', 'yaourt grec', 'haricots verts', 'boeuf']
+DISHES = ['Bowl', 'Salade', 'Wrap', 'Poêlée', 'Gratin', 'Smoothie', 'Curry', 'Omelette', 'Porridge', 'Soupe']
+CATEGORIES = ['Petit-déjeuner', 'Déjeuner', 'Dîner', 'Collation']
+GOALS = ['Sèche', 'Prise de masse', 'Maintien', 'Déficit calorique']
+
+server = load_server()
+random.seed(args.seed)
+with server.db_pool.connection() as conn:
+    rows = []
+    for index in range(args.recipes):
+        ingredients = random.sample(INGREDIENTS, random.randint(3, 8))
+        rows.append((f'{random.choice(DISHES)} {ingredients[0]} {ingredients[1]} n°{index}',
+                     ', '.join(ingredients), random.randint(5, 90), random.randint(150, 900),
+                     random.choice(CATEGORIES), random.choice(GOALS)))
+    conn.executemany('''
+        INSERT INTO nutrition (name, ingredients, preparation_time, calories, category, goal_category)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.execute("INSERT INTO nutrition_fts (nutrition_fts) VALUES ('optimize')")
+    conn.execute('ANALYZE')
+with server.db_pool.connection() as conn:
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+client = server.app.test_client()
+
+def search(query):
+    response = client.get(f'/search?type=nutrition&q={query}')
+    assert response.status_code == 200, response.status_code
+    return response.get_json()
+
+QUERIES = {
+    'terme rare (nom)': 'gratin myrtilles',
+    'terme courant': 'poulet',
+    'préfixe de 2 lettres': 'sa',
+    'trois termes': 'bowl quinoa avocat',
+    'page profonde (offset 500)': 'riz&offset=500',
+}
+
+print(f'{args.recipes} recettes')
+medians = []
+# Sans cache : chaque requête interroge FTS5 et note toutes les lignes trouvées avec BM25
+server.SEARCH_CACHE_SIZE = 0
+for label, query in QUERIES.items():
+    samples = measure(lambda: search(query), args.runs)
+    medians.append(statistics.median(samples))
+    report(label, samples)
+# Classement borné aux 1000 correspondances les plus récentes (SEARCH_MAX_CANDIDATES, inexact)
+server.SEARCH_MAX_CANDIDATES = 1000
+report('terme courant (borné à 1000)', measure(lambda: search('poulet'), args.runs))
+server.SEARCH_MAX_CANDIDATES = 0
+server.SEARCH_CACHE_SIZE = 256
+report('terme courant (cache)', measure(lambda: search('poulet'), args.runs))
+print(f"objectif {args.target_ms} ms : {'atteint' if max(medians) < args.target_ms else 'non atteint'} "
+      f'(pire médiane sans cache {max(medians):.2f} ms)')
@@ -0,0 +1,58 @@
+# Listage des séances : réponse complète (ancien comportement) contre pages par clé (date, id)
+#   python benchmarks/bench_workouts.py --workouts 10000
+import argparse
+import random
+
+from common import load_server, measure, report
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--workouts', type=int, default=10000)
+parser.add_argument('--limit', type=int, default=50)
+parser.add_argument('--runs', type=int, default=50)
+parser.add_argument('--seed', type=int, default=42)
+args = parser.parse_args()
+
+server = load_server()
+random.seed(args.seed)
+with server.db_pool.connection() as conn:
+    user_id = conn.execute("INSERT INTO users (username, password_hash, name) VALUES ('bench', 'x', 'Bench')").lastrowid
+    conn.executemany('INSERT INTO workouts (user_id, date, type, duration, exercises, status) VALUES (?, ?, ?, ?, ?, ?)', [
+        (user_id,
+         None if random.random() < 0.01 else
+         f'{random.randint(2015, 2025)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}',
+         random.choice(['Course', 'Musculation', 'Cyclisme', 'Natation']),
+         random.randint(600, 7200),
+         ', '.join(random.choice(['Squat 4x8 @ 80kg', 'Développé couché 5x5 @ 70kg', 'Tractions 3x10'])
+                   for _ in range(6)),
+         'user')
+        for _ in range(args.workouts)])
+    conn.execute('ANALYZE')
+
+client = server.app.test_client()
+headers = {'Authorization': f'Bearer {server.issue_session_token(user_id)}'}
+
+def get(url):
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.status_code
+    return response.get_json()
+
+# Curseurs répartis sur tout l'historique, pour mesurer aussi les pages profondes
+cursors, cursor, seen = [], None, 0
+while True:
+    page = get(f'/workouts/{user_id}?limit={args.limit}&fields=id,date,type' + (f'&cursor={cursor}' if cursor else ''))
+    seen += len(page['workouts'])
+    if not page['has_more']:
+        break
+    cursor = page['next_cursor']
+    cursors.append(cursor)
+assert seen == args.workouts, (seen, args.workouts)
+
+print(f'{args.workouts} séances, pages de {args.limit}')
+report('réponse complète', measure(lambda: get(f'/workouts/{user_id}'), max(5, args.runs // 10)))
+report('première page', measure(lambda: get(f'/workouts/{user_id}?limit={args.limit}'), args.runs))
+report('première page, champs id,date,type',
+       measure(lambda: get(f'/workouts/{user_id}?limit={args.limit}&fields=id,date,type'), args.runs))
+report('page au hasard (curseur)', measure(
+    lambda: get(f'/workouts/{user_id}?limit={args.limit}&cursor={random.choice(cursors)}'), args.runs))
+report('dernière page (séances sans date)',
+       measure(lambda: get(f'/workouts/{user_id}?limit={args.limit}&cursor={cursors[-1]}'), args.runs))
@@ -0,0 +1,41 @@
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Charge server.py sur une base vide dans un dossier jetable (jamais sur fitness.db)
+def load_server():
+    workdir = tempfile.mkdtemp(prefix='fitness-bench-')
+    os.environ['FITNESS_DB'] = os.path.join(workdir, 'fitness.db')
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    import server
+    server.init_db()
+    return server
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+# Durées en millisecondes de `runs` appels, après quelques appels de chauffe
+def measure(function, runs, warmup=3):
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(label, samples):
+    print(f'{label:<40} median {statistics.median(samples):8.2f} ms   p95 {percentile(samples, 0.95):8.2f} ms'
+          f'   p99 {percentile(samples, 0.99):8.2f} ms   max {max(samples):8.2f} ms')
@@ -1,18 +1,47 @@
-from flask import Flask, request, jsonify
-from flask_bcrypt import Bcrypt
+from flask import Flask, Request, request, jsonify, g, send_file, stream_with_context
 from flask_cors import CORS
 import datetime
 import sqlite3
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, disconnect
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 from datetime import timedelta
 import random
+import threading
+import time
+import queue
+import argparse
+import base64
+import json
+import multiprocessing
+import re
+import heapq
+import hashlib
+import html
+import gzip
+import mimetypes
+import unicodedata
+import tempfile
+import uuid
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict
+from functools import wraps
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import bcrypt as bcrypt_backend
 
 app = Flask(__name__)
 CORS(app)
-bcrypt = Bcrypt(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Coût bcrypt (les anciens hachages sont recalculés à la connexion quand il change)
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+# File de messages partagée entre processus (redis://, amqp://, kafka://, zmq+tcp://...)
+# indispensable dès que plusieurs workers servent les mêmes clients Socket.IO
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'flask-socketio')
+socketio = SocketIO(app, cors_allowed_origins="*", message_queue=SOCKETIO_MESSAGE_QUEUE, channel=SOCKETIO_CHANNEL)
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
@@ -20,54 +49,759 @@ if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Présence des utilisateurs
+PRESENCE_TTL = float(os.environ.get('PRESENCE_TTL', 90))  # Secondes sans heartbeat avant expiration
+# Un socket n'expire qu'après son premier heartbeat : les clients qui n'en envoient pas
+# restent en ligne jusqu'à leur déconnexion (détectée par le ping engine.io)
+PRESENCE_SWEEP_INTERVAL = float(os.environ.get('PRESENCE_SWEEP_INTERVAL', 15))
+LAST_ACTIVITY_FLUSH_INTERVAL = float(os.environ.get('LAST_ACTIVITY_FLUSH_INTERVAL', 5))
+PRESENCE_REDIS_URL = os.environ.get('PRESENCE_REDIS_URL')
+
+# Stockage de présence en mémoire, propre au processus (et utilisé pour les tests)
+class LocalPresenceBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}  # user_id -> {'name': ..., 'sids': {sid: last_seen ou None sans heartbeat}}
+
+    def add(self, user_id, name, sid):
+        with self._lock:
+            entry = self._users.setdefault(user_id, {'name': name, 'sids': {}})
+            entry['name'] = name
+            entry['sids'].setdefault(sid, None)
+
+    def touch(self, user_id, sid, now):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry and sid in entry['sids']:
+                entry['sids'][sid] = now
+
+    def remove(self, user_id, sid):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if not entry:
+                return
+            entry['sids'].pop(sid, None)
+            if not entry['sids']:
+                del self._users[user_id]
+
+    def online_users(self):
+        with self._lock:
+            return [{'id': user_id, 'name': entry['name']} for user_id, entry in self._users.items()]
+
+    def expire(self, deadline):
+        expired = []
+        with self._lock:
+            for user_id, entry in list(self._users.items()):
+                for sid, last_seen in list(entry['sids'].items()):
+                    if last_seen is not None and last_seen < deadline:
+                        del entry['sids'][sid]
+                        expired.append((user_id, sid))
+                if not entry['sids']:
+                    del self._users[user_id]
+        return expired
+
+
+# Stockage de présence partagé entre plusieurs processus serveur (dépendance optionnelle redis)
+class RedisPresenceBackend:
+    def __init__(self, url, prefix='presence'):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._users_key = f'{prefix}:users'
+        self._names_key = f'{prefix}:names'
+        self._prefix = prefix
+
+    def _sids_key(self, user_id):
+        return f'{self._prefix}:sids:{user_id}'
+
+    def add(self, user_id, name, sid):
+        pipe = self._redis.pipeline()
+        pipe.hsetnx(self._sids_key(user_id), sid, '')
+        pipe.hset(self._names_key, user_id, name or '')
+        pipe.sadd(self._users_key, user_id)
+        pipe.execute()
+
+    def touch(self, user_id, sid, now):
+        if self._redis.hexists(self._sids_key(user_id), sid):
+            self._redis.hset(self._sids_key(user_id), sid, now)
+
+    def remove(self, user_id, sid):
+        self._redis.hdel(self._sids_key(user_id), sid)
+        if not self._redis.hlen(self._sids_key(user_id)):
+            self._redis.srem(self._users_key, user_id)
+
+    def online_users(self):
+        user_ids = sorted(self._redis.smembers(self._users_key), key=int)
+        names = self._redis.hmget(self._names_key, user_ids) if user_ids else []
+        return [{'id': int(user_id), 'name': name} for user_id, name in zip(user_ids, names)]
+
+    def expire(self, deadline):
+        expired = []
+        for user_id in self._redis.smembers(self._users_key):
+            for sid, last_seen in self._redis.hgetall(self._sids_key(user_id)).items():
+                if last_seen and float(last_seen) < deadline:
+                    expired.append((int(user_id), sid))
+        for user_id, sid in expired:
+            self.remove(user_id, sid)
+        return expired
+
+
+# Registre de présence : user_id -> sockets connectés, avec écriture différée de last_activity
+class PresenceRegistry:
+    def __init__(self, backend, ttl=PRESENCE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sid_users = {}  # Sockets de ce processus : sid -> user_id
+        self._pending_activity = {}  # user_id -> dernière activité à écrire en base
+
+    def _mark_active(self, user_id):
+        with self._lock:
+            self._pending_activity[user_id] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def connect(self, user_id, sid, name=None):
+        with self._lock:
+            previous = self._sid_users.get(sid)
+            self._sid_users[sid] = user_id
+        if previous is not None and previous != user_id:
+            self.backend.remove(previous, sid)
+        self.backend.add(user_id, name, sid)
+        self._mark_active(user_id)
+
+    def heartbeat(self, sid):
+        with self._lock:
+            user_id = self._sid_users.get(sid)
+        if user_id is not None:
+            self.backend.touch(user_id, sid, time.time())
+            self._mark_active(user_id)
+        return user_id
+
+    def disconnect(self, sid):
+        with self._lock:
+            user_id = self._sid_users.pop(sid, None)
+        if user_id is not None:
+            self.backend.remove(user_id, sid)
+            self._mark_active(user_id)
+        return user_id
+
+    def user_for_sid(self, sid):
+        with self._lock:
+            return self._sid_users.get(sid)
+
+    def online_users(self):
+        return self.backend.online_users()
+
+    def expire(self):
+        expired = self.backend.expire(time.time() - self.ttl)
+        with self._lock:
+            for user_id, sid in expired:
+                if self._sid_users.get(sid) == user_id:
+                    del self._sid_users[sid]
+        return expired
+
+    # Écrit en un seul lot les last_activity accumulés depuis le dernier passage
+    def flush_last_activity(self):
+        with self._lock:
+            pending, self._pending_activity = self._pending_activity, {}
+        if not pending:
+            return 0
+        with db_pool.connection() as conn:
+            conn.executemany('UPDATE users SET last_activity = ? WHERE id = ?',
+                             [(timestamp, user_id) for user_id, timestamp in pending.items()])
+        return len(pending)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'local_sockets': len(self._sid_users),
+                'pending_activity_writes': len(self._pending_activity),
+                'backend': type(self.backend).__name__
+            }
+
+
+presence = PresenceRegistry(RedisPresenceBackend(PRESENCE_REDIS_URL) if PRESENCE_REDIS_URL else LocalPresenceBackend())
+
+def _presence_loop():
+    last_sweep = time.monotonic()
+    while True:
+        socketio.sleep(LAST_ACTIVITY_FLUSH_INTERVAL)
+        try:
+            if time.monotonic() - last_sweep >= PRESENCE_SWEEP_INTERVAL:
+                presence.expire()
+                last_sweep = time.monotonic()
+            presence.flush_last_activity()
+        except Exception as e:
+            print('Erreur présence:', e)
+
+# Tâches de fond démarrées une seule fois par processus
+_background_tasks_started = False
+_background_tasks_lock = threading.Lock()
+
+def start_background_tasks():
+    global _background_tasks_started
+    if _background_tasks_started:
+        return
+    with _background_tasks_lock:
+        if _background_tasks_started:
+            return
+        _background_tasks_started = True
+    socketio.start_background_task(_presence_loop)
+    socketio.start_background_task(message_writer.run)
+    socketio.start_background_task(_ban_loop)
+    socketio.start_background_task(_notification_retention_loop)
+    socketio.start_background_task(_upload_session_retention_loop)
+
+# Socket -> utilisateur vérifié par le jeton de connexion (ou annoncé, avec LEGACY_CLIENT_IDS)
+socket_users = {}
+
 # Gestion des événements Socket.IO
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
+    start_background_tasks()
+    # Le jeton lie le socket à son utilisateur ; un utilisateur banni est refusé d'emblée
+    if isinstance(auth, dict) and auth.get('token'):
+        user_id = verify_session_token(auth['token'])
+        user = auth_cache.get(user_id) if user_id is not None else None
+        if user is None:
+            raise ConnectionRefusedError('Jeton invalide ou expiré')
+        if ban_status(user):
+            raise ConnectionRefusedError('Utilisateur banni')
+        socket_users[request.sid] = user_id
+    elif not LEGACY_CLIENT_IDS:
+        raise ConnectionRefusedError('Authentification requise')
     print('Client connecté:', request.sid)
     emit('welcome', {'data': 'Connecté au serveur'})
 
 @socketio.on('disconnect')
-def handle_disconnect():
+def handle_disconnect(reason=None):
     print('Client déconnecté:', request.sid)
+    socket_users.pop(request.sid, None)
+    presence.disconnect(request.sid)
 
+# L'identifiant envoyé par le client doit être celui du jeton de connexion
 @socketio.on('userConnected')
-def handle_user_connected(user_id):
+def handle_user_connected(user_id=None):
+    verified_id = socket_users.get(request.sid)
+    if verified_id is None and not LEGACY_CLIENT_IDS:
+        return {'error': 'Authentification requise'}
+    try:
+        user_id = verified_id if user_id is None else int(user_id)
+    except (TypeError, ValueError):
+        return {'error': 'User not found'}
+    if verified_id is not None and user_id != verified_id:
+        return {'error': 'Accès refusé'}
     print(f'Utilisateur {user_id} est en ligne')
-    # Ajoutez la logique pour gérer les utilisateurs en ligne
+    conn = get_db_connection()
+    user = conn.execute('SELECT name FROM users WHERE id = ?', (user_id,)).fetchone()
+    conn.close()
+    if not user:
+        return {'error': 'User not found'}
+    status = ban_status(auth_cache.get(user_id))
+    if status:
+        disconnect()
+        return status
+    # Room personnelle : reçoit les messages adressés à cet utilisateur
+    socket_users[request.sid] = user_id
+    join_room(str(user_id))
+    presence.connect(user_id, request.sid, user['name'])
+
+@socketio.on('heartbeat')
+def handle_heartbeat(data=None):
+    presence.heartbeat(request.sid)
 
 @socketio.on('sendMessage')
 def handle_send_message(data):
-    print('Message reçu:', data)
-    # Enregistrez le message en base de données
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO messages (sender_id, receiver_id, message, timestamp)
-        VALUES (?, ?, ?, ?)
-    ''', (data['sender_id'], data['receiver_id'], data['message'], datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-    conn.commit()
-    message_id = cursor.lastrowid
-    conn.close()
-    
-    # Récupérez le message complet pour l'envoyer
-    message = {
-        'id': message_id,
-        'sender_id': data['sender_id'],
-        'receiver_id': data['receiver_id'],
-        'message': data['message'],
-        'timestamp': datetime.datetime.now().isoformat(),
-        'is_read': False
-    }
-    
-    # Émettez le message aux concernés
-    emit('newMessage', message, room=str(data['receiver_id']))
-    emit('newMessage', message, room=str(data['sender_id']))
+    # L'expéditeur est l'utilisateur lié au socket, jamais celui annoncé dans le message
+    sender_id = socket_users.get(request.sid)
+    if sender_id is None:
+        return {'status': 'error', 'error': 'Authentification requise'}
+    # Le message passe par la file d'écriture ; l'accusé de réception est renvoyé
+    # à l'expéditeur une fois le lot validé en base
+    try:
+        if data.get('sender_id') is not None and int(data['sender_id']) != sender_id:
+            return {'status': 'error', 'error': 'Expéditeur invalide'}
+        pending = message_writer.submit(sender_id, data['receiver_id'], data['message'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return {'status': 'error', 'error': 'Message invalide'}
+    if not pending.wait(MESSAGE_ACK_TIMEOUT):
+        return {'status': 'error', 'error': 'Délai dépassé'}
+    if pending.error:
+        return {'status': 'error', 'error': str(pending.error)}
+    return {'status': 'ok', 'message': pending.payload}
+
+# File d'écriture des messages
+MESSAGE_BATCH_WINDOW = float(os.environ.get('MESSAGE_BATCH_WINDOW', 0.005))  # Secondes
+MESSAGE_BATCH_SIZE = int(os.environ.get('MESSAGE_BATCH_SIZE', 500))
+MESSAGE_ACK_TIMEOUT = float(os.environ.get('MESSAGE_ACK_TIMEOUT', 10))
+
+class PendingMessage:
+    def __init__(self, sender_id, receiver_id, message, timestamp):
+        self.sender_id = sender_id
+        self.receiver_id = receiver_id
+        self.message = message
+        self.timestamp = timestamp
+        self.payload = None
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def resolve(self, message_id=None, error=None):
+        if error is None:
+            self.payload = {
+                'id': message_id,
+                'sender_id': self.sender_id,
+                'receiver_id': self.receiver_id,
+                'message': self.message,
+                'timestamp': self.timestamp,
+                'is_read': False
+            }
+        self.error = error
+        self._done.set()
+
+
+# Écrivain unique : regroupe les messages reçus pendant quelques millisecondes
+# et les valide en une seule transaction, puis les diffuse aux rooms concernées
+class MessageWriter:
+    def __init__(self, window=MESSAGE_BATCH_WINDOW, max_batch=MESSAGE_BATCH_SIZE):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {'messages': 0, 'batches': 0, 'largest_batch': 0, 'errors': 0}
+
+    def submit(self, sender_id, receiver_id, message):
+        sender_id, receiver_id = int(sender_id), int(receiver_id)
+        if not isinstance(message, str) or not message:
+            raise ValueError('message')
+        start_background_tasks()
+        pending = PendingMessage(sender_id, receiver_id, message,
+                                 datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        self._queue.put(pending)
+        return pending
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            return [record_message(cursor, item.sender_id, item.receiver_id, item.message, item.timestamp)
+                    for item in batch]
+
+    def _publish(self, item, message_id):
+        item.resolve(message_id)
+        socketio.emit('newMessage', item.payload, to=str(item.receiver_id))
+        if item.sender_id != item.receiver_id:
+            socketio.emit('newMessage', item.payload, to=str(item.sender_id))
+
+    def process(self, batch):
+        try:
+            message_ids = self._write(batch)
+        except Exception:
+            # Un message fautif ne doit pas faire échouer tout le lot : on les rejoue un par un
+            for item in batch:
+                try:
+                    message_id, = self._write([item])
+                except Exception as e:
+                    with self._lock:
+                        self._stats['errors'] += 1
+                    item.resolve(error=e)
+                else:
+                    self._publish(item, message_id)
+        else:
+            for item, message_id in zip(batch, message_ids):
+                self._publish(item, message_id)
+        with self._lock:
+            self._stats['messages'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self.process(batch)
+            except Exception as e:
+                print("Erreur d'écriture des messages:", e)
+                for item in batch:
+                    if not item.wait(0):
+                        item.resolve(error=e)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['average_batch'] = stats['messages'] / stats['batches'] if stats['batches'] else 0
+        return stats
+
+
+message_writer = MessageWriter()
+
+# Configuration de la base de données
+DATABASE = os.environ.get('FITNESS_DB', 'fitness.db')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 16))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_CONN_MAX_AGE = float(os.environ.get('DB_CONN_MAX_AGE', 3600))
+
+# Pragmas appliqués à chaque nouvelle connexion (WAL + cache de pages et mmap plus larges)
+DB_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+class DatabasePoolTimeout(Exception):
+    pass
+
+
+# Connexion SQLite dont close() rend la connexion au pool au lieu de la fermer
+class PooledConnection(sqlite3.Connection):
+    pool = None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+
+# Pool de connexions SQLite : une connexion par thread (ou greenlet) à la fois,
+# réutilisée entre les requêtes pour éviter l'ouverture et le préchauffage du cache.
+# La connexion courante est une ContextVar et non un threading.local : greenlet donne à chaque
+# greenlet son propre contexte, alors qu'un threading.local non patché est partagé par tous les
+# greenlets d'un même thread (eventlet / gevent)
+class ConnectionPool:
+    def __init__(self, database, max_size=16, timeout=10.0, max_age=3600.0, cached_statements=256):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.cached_statements = cached_statements
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._current = contextvars.ContextVar(f'db_connection_{id(self)}', default=None)
+        self._stats = {
+            'checkouts': 0,
+            'reentrant_checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'recycled': 0,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements, factory=PooledConnection)
+        conn.row_factory = sqlite3.Row
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        conn.pool = self
+        conn.created_at = time.monotonic()
+        conn.depth = 0
+        return conn
+
+    def _discard(self, conn):
+        conn.pool = None
+        conn.close()
+        self._size -= 1
+
+    def acquire(self):
+        # Connexion déjà détenue par ce thread : on la réutilise (appels imbriqués)
+        conn = self._current.get()
+        if conn is not None:
+            conn.depth += 1
+            with self._cond:
+                self._stats['reentrant_checkouts'] += 1
+            return conn
+
+        started = time.monotonic()
+        waited = False
+        conn = None
+        with self._cond:
+            while True:
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if started - candidate.created_at > self.max_age:
+                        self._discard(candidate)
+                        self._stats['recycled'] += 1
+                        continue
+                    conn = candidate
+                    break
+                if conn is not None:
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise DatabasePoolTimeout('No database connection available')
+                waited = True
+                self._cond.wait(remaining)
+
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time'] += time.monotonic() - started
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats['created'] += 1
+
+        conn.depth = 1
+        self._current.set(conn)
+        return conn
+
+    def release(self, conn):
+        conn.depth -= 1
+        if conn.depth > 0:
+            return
+        if self._current.get() is conn:
+            self._current.set(None)
+        # Une transaction laissée ouverte ne doit pas fuir vers la requête suivante
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    # Connexion détenue par le thread (ou greenlet) courant, None sinon
+    def current(self):
+        return self._current.get()
+
+    # Rend la connexion du thread courant, quel que soit le niveau d'imbrication
+    def release_current(self):
+        conn = self.current()
+        if conn is not None:
+            conn.depth = 1
+            self.release(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+            if conn.depth == 1 and conn.in_transaction:
+                conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop())
+
+    def stats(self):
+        now = time.monotonic()
+        with self._cond:
+            ages = [now - conn.created_at for conn in self._idle]
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'max_size': self.max_size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'oldest_idle_age': max(ages) if ages else 0,
+                'average_idle_age': sum(ages) / len(ages) if ages else 0,
+                'average_wait_time': stats['wait_time'] / stats['waits'] if stats['waits'] else 0,
+            })
+        return stats
+
+
+db_pool = ConnectionPool(DATABASE, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, max_age=DB_CONN_MAX_AGE)
 
 # Connexion à la base de données SQLite
 def get_db_connection():
-    conn = sqlite3.connect('fitness.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.acquire()
+
+# Rend au pool la connexion oubliée par une route (ou un handler Socket.IO)
+@app.teardown_appcontext
+def release_db_connection(exception):
+    db_pool.release_current()
+
+@app.errorhandler(DatabasePoolTimeout)
+def handle_pool_timeout(error):
+    return jsonify({'message': 'Base de données surchargée, réessayez plus tard'}), 503
+
+# Authentification : jetons de session signés et cache des droits par utilisateur
+# SECRET_KEY doit être identique sur tous les workers pour qu'un jeton reste valable partout
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or os.urandom(32).hex()
+SESSION_TOKEN_MAX_AGE = int(os.environ.get('SESSION_TOKEN_MAX_AGE', 7 * 24 * 3600))
+# Sans jeton, seules les routes publiques répondent et un socket est refusé dès la connexion.
+# LEGACY_CLIENT_IDS=1 ouvre une période de transition pour les anciens clients : l'identifiant qu'ils
+# envoient (URL, corps, userConnected) est cru sur parole. Migration : déployer avec LEGACY_CLIENT_IDS=1,
+# passer les clients au jeton renvoyé par /login (en-tête Authorization: Bearer, auth={'token': ...}
+# à la connexion Socket.IO), puis retirer la variable
+LEGACY_CLIENT_IDS = os.environ.get('LEGACY_CLIENT_IDS', '0') == '1'
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 10000))
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', 300))
+PUBLIC_ENDPOINTS = {'login', 'register'}
+
+token_serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='session')
+
+def issue_session_token(user_id):
+    return token_serializer.dumps({'user_id': user_id})
+
+def verify_session_token(token):
+    try:
+        return token_serializer.loads(token, max_age=SESSION_TOKEN_MAX_AGE)['user_id']
+    except (BadSignature, SignatureExpired, KeyError, TypeError):
+        return None
+
+
+# Cache LRU avec expiration : user_id -> rôle, statut de bannissement, coach.
+# Invalidé par les routes qui modifient ces champs ; le TTL borne le décalage
+# entre plusieurs workers
+USER_AUTH_QUERY = '''
+    SELECT id, role, coach_id, status, ban_raison, ban_count, ban_until
+    FROM users WHERE id = ?
+'''
+
+class UserAuthCache:
+    def __init__(self, max_size=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _load(self, user_id):
+        conn = get_db_connection()
+        user = conn.execute(USER_AUTH_QUERY, (user_id,)).fetchone()
+        conn.close()
+        return dict(user) if user else None
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self._stats['hits'] += 1
+                return entry[1]
+            self._stats['misses'] += 1
+        info = self._load(user_id)
+        if info is not None:
+            with self._lock:
+                self._entries[user_id] = (now + self.ttl, info)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return info
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        return stats
+
+
+auth_cache = UserAuthCache()
+
+# Vérifie le jeton Bearer de chaque requête ; l'utilisateur est ensuite lu dans le cache
+@app.before_request
+def authenticate_request():
+    g.user = None
+    start_background_tasks()
+    if request.method == 'OPTIONS' or request.endpoint in PUBLIC_ENDPOINTS:
+        return None
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        user_id = verify_session_token(header[len('Bearer '):].strip())
+        user = auth_cache.get(user_id) if user_id is not None else None
+        if user is None:
+            return jsonify({'message': 'Jeton invalide ou expiré'}), 401
+        status = ban_status(user)
+        if status and request.endpoint != 'check_ban':
+            return jsonify(status), 403
+        g.user = user
+    return None
+
+# Restreint une route à certains rôles ; une requête sans jeton est toujours refusée
+def role_required(*roles):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if g.get('user') is None:
+                return jsonify({'message': 'Authentification requise'}), 401
+            if g.user['role'] not in roles:
+                return jsonify({'message': 'Accès refusé'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Données d'un utilisateur : lui-même ou un administrateur, et son coach si allow_coach
+def can_access_user(user_id, allow_coach=False):
+    user = g.get('user')
+    if user is None:
+        return False
+    if user['role'] == 'admin' or user['id'] == user_id:
+        return True
+    if allow_coach and user['role'] == 'coach':
+        target = auth_cache.get(user_id)
+        return target is not None and target['coach_id'] == user['id']
+    return False
+
+# Vérifie les identifiants d'utilisateur de l'URL (user_id par défaut) contre le jeton : l'accès à
+# l'un d'eux suffit. Sans jeton, la requête n'est acceptée que pendant la transition LEGACY_CLIENT_IDS
+def user_access_required(*arguments, allow_coach=False):
+    arguments = arguments or ('user_id',)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if g.get('user') is None:
+                if not LEGACY_CLIENT_IDS:
+                    return jsonify({'message': 'Authentification requise'}), 401
+            elif not any(can_access_user(kwargs[argument], allow_coach) for argument in arguments):
+                return jsonify({'message': 'Accès refusé'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Même règle pour un identifiant lu dans le corps de la requête ou dans la ligne modifiée :
+# renvoie la réponse d'erreur (401 sans jeton, 403 sans accès), None si l'accès est permis
+def user_access_error(user_id, allow_coach=False):
+    if g.get('user') is None:
+        if not LEGACY_CLIENT_IDS:
+            return jsonify({'message': 'Authentification requise'}), 401
+    elif not can_access_user(user_id, allow_coach):
+        return jsonify({'message': 'Accès refusé'}), 403
+    return None
 
 # Initialisation de la base de données
 def init_db():
@@ -101,8 +835,10 @@ def init_db():
             sport_goal TEXT,
             role TEXT DEFAULT 'user',
             coach_id INTEGER,
-            is_banned BOOLEAN DEFAULT 0,
-            ban_reason TEXT,
+            status TEXT DEFAULT 'active',  -- 'active' ou 'ban'
+            ban_raison TEXT,
+            ban_count INTEGER DEFAULT 0,  -- Nombre de bannissements reçus
+            ban_until DATETIME,  -- Fin d'un bannissement temporaire
             last_activity DATETIME  -- Dernière activité de l'utilisateur
         )
     ''')
@@ -210,46 +946,564 @@ def init_db():
         ''')
     
     conn.commit()
+    run_migrations(conn)
     conn.close()
 
+# Migrations du schéma : chaque migration met à niveau une base existante
+# et la version atteinte est enregistrée dans PRAGMA user_version
+def _column_exists(cursor, table, column):
+    cursor.execute(f'PRAGMA table_info({table})')
+    return any(row['name'] == column for row in cursor.fetchall())
+
+def _add_column(cursor, table, column, definition):
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+# Colonnes lues par les routes mais absentes du schéma d'origine
+def _migration_add_missing_columns(cursor):
+    _add_column(cursor, 'users', 'status', "TEXT DEFAULT 'active'")
+    _add_column(cursor, 'users', 'ban_raison', 'TEXT')
+    _add_column(cursor, 'users', 'ban_count', 'INTEGER DEFAULT 0')
+    _add_column(cursor, 'users', 'ban_until', 'DATETIME')
+    _add_column(cursor, 'users', 'last_activity', 'DATETIME')
+    _add_column(cursor, 'messages', 'is_read', 'BOOLEAN DEFAULT 0')
+    _add_column(cursor, 'workouts', 'status', 'TEXT')
+    _add_column(cursor, 'exercices', 'image', 'TEXT')
+    _add_column(cursor, 'subscriptions', 'user_id', 'INTEGER REFERENCES users (id)')
+    _add_column(cursor, 'nutrition', 'image', 'TEXT')
+    _add_column(cursor, 'nutrition', 'preparation', 'TEXT')
+
+# Index secondaires (couvrants quand c'est peu coûteux) pour les requêtes des routes
+def _migration_secondary_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_workouts_user_date ON workouts (user_id, date, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_pair ON messages (sender_id, receiver_id, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_coach ON users (coach_id, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users (role, id, name, username)')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_banned ON users (id) WHERE status = 'ban'")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications (user_id, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_goals_user ON goals (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_subscriptions_name ON subscriptions (name)')
+
+# Index d'une conversation indépendamment du sens des messages
+def _migration_conversation_index(cursor):
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation
+        ON messages (min(sender_id, receiver_id), max(sender_id, receiver_id), id)
+    ''')
+
+# Une ligne par paire d'utilisateurs : dernier message et compteurs de non-lus
+def _migration_conversations(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            user_low INTEGER NOT NULL,
+            user_high INTEGER NOT NULL,
+            last_message_id INTEGER,
+            last_sender_id INTEGER,
+            last_message TEXT,
+            last_timestamp DATETIME,
+            unread_low INTEGER NOT NULL DEFAULT 0,  -- Messages non lus par user_low
+            unread_high INTEGER NOT NULL DEFAULT 0,  -- Messages non lus par user_high
+            PRIMARY KEY (user_low, user_high),
+            FOREIGN KEY (user_low) REFERENCES users (id),
+            FOREIGN KEY (user_high) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversations_low ON conversations (user_low, last_timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversations_high ON conversations (user_high, last_timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_unread ON messages (receiver_id, sender_id) WHERE is_read = 0')
+
+    # Reconstruction à partir des messages existants
+    cursor.execute('''
+        INSERT OR REPLACE INTO conversations (user_low, user_high, last_message_id, unread_low, unread_high)
+        SELECT min(sender_id, receiver_id), max(sender_id, receiver_id), max(id),
+               sum(CASE WHEN is_read = 0 AND receiver_id = min(sender_id, receiver_id) THEN 1 ELSE 0 END),
+               sum(CASE WHEN is_read = 0 AND receiver_id != min(sender_id, receiver_id) THEN 1 ELSE 0 END)
+        FROM messages
+        GROUP BY min(sender_id, receiver_id), max(sender_id, receiver_id)
+    ''')
+    cursor.execute('''
+        UPDATE conversations
+        SET (last_sender_id, last_message, last_timestamp) = (
+            SELECT sender_id, message, timestamp FROM messages WHERE messages.id = conversations.last_message_id
+        )
+    ''')
+
+# Agrégats d'entraînement par utilisateur, totaux et par semaine / mois
+def _migration_user_stats(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            total_workouts INTEGER NOT NULL DEFAULT 0,
+            total_duration INTEGER NOT NULL DEFAULT 0,
+            calories_burned INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats_periods (
+            user_id INTEGER NOT NULL,
+            granularity TEXT NOT NULL,  -- 'week' ou 'month'
+            period TEXT NOT NULL,  -- '2025-W12' ou '2025-03'
+            workouts INTEGER NOT NULL DEFAULT 0,
+            duration INTEGER NOT NULL DEFAULT 0,
+            calories_burned INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, granularity, period),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    rebuild_user_stats(cursor)
+
+# Exercices d'une séance stockés ligne par ligne (séries, répétitions, charge)
+def _migration_workout_exercises(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS workout_exercises (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            workout_id INTEGER NOT NULL,
+            user_id INTEGER,
+            exercise_id INTEGER,  -- NULL si le nom ne correspond à aucun exercice du catalogue
+            name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            sets INTEGER,
+            reps INTEGER,
+            load REAL,  -- Charge en kg
+            FOREIGN KEY (workout_id) REFERENCES workouts (id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (exercise_id) REFERENCES exercices (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_workout_exercises_workout ON workout_exercises (workout_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_workout_exercises_user ON workout_exercises (user_id, exercise_id, load)')
+    backfill_workout_exercises(cursor)
+
+# Un seul schéma de bannissement (status / ban_raison / ban_count / ban_until)
+def _migration_ban_schema(cursor):
+    if _column_exists(cursor, 'users', 'is_banned'):
+        cursor.execute('''
+            UPDATE users SET status = 'ban', ban_raison = coalesce(ban_raison, ban_reason)
+            WHERE is_banned = 1 AND coalesce(status, 'active') != 'ban'
+        ''')
+    cursor.execute("UPDATE users SET status = 'active' WHERE status IS NULL")
+    cursor.execute('UPDATE users SET ban_count = 0 WHERE ban_count IS NULL')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_ban_until ON users (ban_until)
+        WHERE status = 'ban' AND ban_until IS NOT NULL
+    ''')
+
+# Empreinte et taille des fichiers uploadés, sessions d'upload reprenable
+def _migration_uploads(cursor):
+    _add_column(cursor, 'uploaded_files', 'sha256', 'TEXT')
+    _add_column(cursor, 'uploaded_files', 'size', 'INTEGER')
+    _add_column(cursor, 'uploaded_files', 'content_type', 'TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_uploaded_files_sha256 ON uploaded_files (sha256)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            uploader_id INTEGER,
+            content_type TEXT,
+            size INTEGER NOT NULL,
+            received INTEGER NOT NULL DEFAULT 0,
+            temp_path TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (uploader_id) REFERENCES users (id)
+        )
+    ''')
+
+# Les anciens fichiers n'ont pas d'empreinte : l'index ne couvre que les fichiers adressés par
+# contenu, sinon les statistiques d'ANALYZE le rendent inutile pour /media/<sha256>
+def _migration_media_index(cursor):
+    cursor.execute('DROP INDEX IF EXISTS idx_uploaded_files_sha256')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_uploaded_files_sha256 ON uploaded_files (sha256)
+        WHERE sha256 IS NOT NULL
+    ''')
+
+# Variantes redimensionnées d'une image, rattachées à l'empreinte de l'original
+def _migration_upload_derivatives(cursor):
+    _add_column(cursor, 'uploaded_files', 'variant_of', 'TEXT')
+    _add_column(cursor, 'uploaded_files', 'width', 'INTEGER')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_uploaded_files_variants ON uploaded_files (variant_of, width)
+        WHERE variant_of IS NOT NULL
+    ''')
+
+# Index plein texte à contenu externe, tenus à jour par triggers
+FTS_TABLES = {
+    'nutrition': ['name', 'ingredients', 'category', 'goal_category'],
+    'exercices': ['name', 'description', 'category'],
+}
+
+def _migration_full_text_search(cursor):
+    for table, columns in FTS_TABLES.items():
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+                {column_list}, content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {table}_fts (rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {table}_fts (rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+        cursor.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+# Index composites pour les filtres de recettes (intervalle de calories par catégorie / objectif)
+def _migration_nutrition_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_nutrition_calories ON nutrition (calories)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_nutrition_preparation_time ON nutrition (preparation_time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_nutrition_category_calories ON nutrition (category, calories)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_nutrition_goal_calories ON nutrition (goal_category, calories)')
+
+# État lu / non lu et date de création des notifications (purge)
+def _migration_notification_state(cursor):
+    _add_column(cursor, 'notifications', 'is_read', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(cursor, 'notifications', 'created_at', 'DATETIME')
+    cursor.execute("UPDATE notifications SET created_at = datetime('now') WHERE created_at IS NULL")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_created ON notifications (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_unread ON notifications (user_id, id) WHERE is_read = 0')
+
+# Recherche par début d'identifiant ou de nom dans l'annuaire (LIKE 'abc%' sans casse)
+def _migration_user_directory_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_username_nocase ON users (username COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_name_nocase ON users (name COLLATE NOCASE)')
+
+# Fenêtre de dates des séances à venir (vue administrateur)
+def _migration_workouts_date_index(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_workouts_date ON workouts (date)')
+
+# idx_messages_pair fait doublon avec idx_messages_conversation (migration 3) et idx_messages_unread
+def _migration_drop_messages_pair_index(cursor):
+    cursor.execute('DROP INDEX IF EXISTS idx_messages_pair')
+
+# Séances analysées avant la prise en charge de la virgule décimale (« 62,5kg ») : reconstruites
+def _migration_reparse_decimal_loads(cursor):
+    cursor.execute('''
+        DELETE FROM workout_exercises WHERE workout_id IN (
+            SELECT id FROM workouts WHERE exercises GLOB '*[0-9],[0-9]*'
+        )
+    ''')
+    backfill_workout_exercises(cursor)
+
+# Sessions d'upload : dernière activité (expiration) et comptage des sessions ouvertes par utilisateur
+def _migration_upload_session_expiry(cursor):
+    _add_column(cursor, 'upload_sessions', 'updated_at', 'DATETIME')
+    cursor.execute('UPDATE upload_sessions SET updated_at = created_at WHERE updated_at IS NULL')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_sessions_uploader ON upload_sessions (uploader_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated ON upload_sessions (updated_at)')
+
+# Candidats du plan de repas : meilleur plat par tranche de calories lu dans l'ordre de l'index,
+# sans tri temporaire ni accès à la table (l'expression suit MEAL_PLAN_BUCKET)
+def _migration_meal_plan_index(cursor):
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_nutrition_meal_plan
+        ON nutrition (category, calories / 10, goal_category, preparation_time, calories)
+    ''')
+
+# Tri de l'annuaire par nom : les noms absents valent '' (l'index du nom sert encore aux préfixes)
+def _migration_user_name_sort_index(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_name_sort ON users (coalesce(name, '') COLLATE NOCASE, id)")
+
+MIGRATIONS = [
+    (1, _migration_add_missing_columns),
+    (2, _migration_secondary_indexes),
+    (3, _migration_conversation_index),
+    (4, _migration_conversations),
+    (5, _migration_user_stats),
+    (6, _migration_workout_exercises),
+    (7, _migration_ban_schema),
+    (8, _migration_uploads),
+    (9, _migration_media_index),
+    (10, _migration_upload_derivatives),
+    (11, _migration_full_text_search),
+    (12, _migration_nutrition_indexes),
+    (13, _migration_notification_state),
+    (14, _migration_user_directory_indexes),
+    (15, _migration_workouts_date_index),
+    (16, _migration_drop_messages_pair_index),
+    (17, _migration_reparse_decimal_loads),
+    (18, _migration_upload_session_expiry),
+    (19, _migration_meal_plan_index),
+    (20, _migration_user_name_sort_index),
+]
+
+def run_migrations(conn):
+    cursor = conn.cursor()
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+    for target, migration in MIGRATIONS:
+        if target <= version:
+            continue
+        # Chaque migration et sa version sont appliquées dans une seule transaction
+        cursor.execute('BEGIN')
+        try:
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {target}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    cursor.execute('ANALYZE')
+    return version
+
 # Routes Flask
 
+# Bannissements : statut 'ban' permanent, ou temporaire jusqu'à ban_until
+BAN_PERMANENT_AFTER = int(os.environ.get('BAN_PERMANENT_AFTER', 3))  # Nombre de bannissements avant le définitif
+BAN_SWEEP_INTERVAL = float(os.environ.get('BAN_SWEEP_INTERVAL', 15))
+BAN_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Renvoie l'état de bannissement d'un utilisateur du cache, ou None s'il n'est pas banni
+def ban_status(user, now=None):
+    if not user or user['status'] != 'ban':
+        return None
+    if not user['ban_until']:
+        return {'banned': True, 'permanent': True, 'reason': user['ban_raison']}
+    now = now or datetime.datetime.now()
+    try:
+        ban_until = datetime.datetime.strptime(user['ban_until'], BAN_DATE_FORMAT)
+    except ValueError:
+        return {'banned': True, 'permanent': True, 'reason': user['ban_raison']}
+    # Bannissement expiré mais pas encore levé par le planificateur
+    if ban_until <= now:
+        return None
+    return {
+        'banned': True,
+        'permanent': False,
+        'remaining_time': int((ban_until - now).total_seconds() // 60),
+        'reason': user['ban_raison']
+    }
+
+
+PENDING_BANS_QUERY = "SELECT id, ban_until FROM users WHERE status = 'ban' AND ban_until IS NOT NULL"
+
+# Tas des fins de bannissements temporaires ; les bannissements échus sont levés en lot
+class BanScheduler:
+    def __init__(self):
+        self._heap = []
+        self._lock = threading.Lock()
+        self._stats = {'scheduled': 0, 'lifted': 0}
+
+    def schedule(self, user_id, ban_until):
+        with self._lock:
+            heapq.heappush(self._heap, (ban_until, user_id))
+            self._stats['scheduled'] += 1
+
+    def load(self):
+        with db_pool.connection() as conn:
+            rows = conn.execute(PENDING_BANS_QUERY).fetchall()
+        with self._lock:
+            self._heap = [(row['ban_until'], row['id']) for row in rows]
+            heapq.heapify(self._heap)
+
+    def lift_expired(self):
+        now = datetime.datetime.now().strftime(BAN_DATE_FORMAT)
+        user_ids = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                user_ids.append(heapq.heappop(self._heap)[1])
+        if not user_ids:
+            return []
+        # La condition sur ban_until ignore les entrées périmées (débanni ou rebanni entre-temps)
+        with db_pool.connection() as conn:
+            conn.execute(f'''
+                UPDATE users SET status = 'active', ban_raison = NULL, ban_until = NULL
+                WHERE id IN ({', '.join('?' * len(user_ids))}) AND status = 'ban' AND ban_until <= ?
+            ''', user_ids + [now])
+        for user_id in user_ids:
+            auth_cache.invalidate(user_id)
+        user_counts.invalidate()
+        with self._lock:
+            self._stats['lifted'] += len(user_ids)
+        return user_ids
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._heap)
+            stats['next_expiry'] = self._heap[0][0] if self._heap else None
+        return stats
+
+
+ban_scheduler = BanScheduler()
+
+def _ban_loop():
+    # Chargement réessayé à chaque tour tant qu'il échoue (base verrouillée au démarrage...)
+    loaded = False
+    while True:
+        try:
+            if not loaded:
+                ban_scheduler.load()
+                loaded = True
+            ban_scheduler.lift_expired()
+        except Exception as e:
+            print('Erreur bannissements:', e)
+        socketio.sleep(BAN_SWEEP_INTERVAL)
+
 # Route pour vérifier le statut de bannissement
 @app.route('/check-ban/<int:user_id>', methods=['GET'])
+@user_access_required()
 def check_ban(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT is_banned, ban_count, ban_until, ban_reason FROM users WHERE id = ?', (user_id,))
-    user = cursor.fetchone()
-    conn.close()
+    user = auth_cache.get(user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    if user['is_banned'] and user['ban_count'] >= 3:
-        return jsonify({
-            'banned': True,
-            'permanent': True,
-            'reason': user['ban_reason']
-        }), 403
-    
-    if user['ban_until'] and datetime.now() < datetime.strptime(user['ban_until'], '%Y-%m-%d %H:%M:%S'):
-        remaining = (datetime.strptime(user['ban_until'], '%Y-%m-%d %H:%M:%S') - datetime.now()).seconds // 60
-        return jsonify({
-            'banned': True,
-            'permanent': False,
-            'remaining_time': remaining,
-            'reason': user['ban_reason']
-        }), 403
+    status = ban_status(user)
+    if status:
+        return jsonify(status), 403
     
     return jsonify({'banned': False}), 200
 
 
+# Annuaire des utilisateurs pour l'administration : filtres (rôle, bannissement, coach, début du
+# nom ou de l'identifiant), tri et pagination par clé. Sans paramètre, l'ancienne liste complète
+USER_DIRECTORY_ARGS = ('role', 'banned', 'coach_id', 'q', 'sort', 'limit', 'cursor')
+USER_DIRECTORY_SORTS = {
+    'id': [],
+    'username': ['username COLLATE NOCASE'],
+    # Les utilisateurs sans nom sont classés comme un nom vide : un curseur ne peut pas contenir NULL
+    'name': ["coalesce(name, '') COLLATE NOCASE"],
+}
+USERS_PAGE_SIZE = 50
+USERS_MAX_PAGE_SIZE = 500
+USER_COUNT_CACHE_TTL = float(os.environ.get('USER_COUNT_CACHE_TTL', 60))
+
+
+# Totaux par combinaison de filtres, vidés à chaque écriture sur les utilisateurs
+class CountCache:
+    def __init__(self, ttl=USER_COUNT_CACHE_TTL, max_size=256):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._stats['hits'] += 1
+                return entry[1]
+            self._stats['misses'] += 1
+        count = loader()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, count)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return count
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._entries))
+
+
+user_counts = CountCache()
+
+def _user_directory_query(fields, where, params, keys, descending, position, limit):
+    where, params = list(where), list(params)
+    if position:
+        # Borne sur la première clé en plus de la comparaison de lignes : sans elle, SQLite parcourt
+        # l'index sur expression (coalesce(name, '')) depuis le début au lieu de s'y positionner
+        if len(keys) > 1:
+            where.append(f"{keys[0]} {'<=' if descending else '>='} ?")
+            params.append(position[0])
+        where.append(f"({', '.join(keys)}) {'<' if descending else '>'} ({', '.join('?' * len(keys))})")
+        params += position
+    direction = 'DESC' if descending else 'ASC'
+    columns = list(dict.fromkeys(fields + ['username', 'name']))
+    columns += [f'{key} AS sort_key_{index}' for index, key in enumerate(keys)]
+    query = f"""
+        SELECT {', '.join(columns)} FROM users WHERE {' AND '.join(where) or '1 = 1'}
+        ORDER BY {', '.join(f'{key} {direction}' for key in keys)} LIMIT ?
+    """
+    return query, params + [limit + 1]
+
+def _user_directory_page(fields, where, params):
+    roles = _list_arg('role')
+    if roles:
+        where.append(f"role IN ({', '.join('?' * len(roles))})")
+        params += roles
+    banned = request.args.get('banned')
+    if banned == '1':
+        where.append("status = 'ban'")
+    elif banned == '0':
+        where.append("coalesce(status, 'active') != 'ban'")
+    coach_id = request.args.get('coach_id')
+    if coach_id == 'none':
+        where.append('coach_id IS NULL')
+    elif coach_id is not None:
+        where.append('coach_id = ?')
+        params.append(request.args.get('coach_id', type=int))
+    prefix = request.args.get('q', '').strip()
+    if prefix:
+        pattern = re.sub(r'([\\%_])', r'\\\1', prefix) + '%'
+        where.append("(username LIKE ? ESCAPE '\\' OR name LIKE ? ESCAPE '\\')")
+        params += [pattern, pattern]
+
+    sort = request.args.get('sort', 'id')
+    descending = sort.startswith('-')
+    if sort.lstrip('-') not in USER_DIRECTORY_SORTS:
+        return jsonify({'message': f'Tri inconnu: {sort}'}), 400
+    keys = USER_DIRECTORY_SORTS[sort.lstrip('-')] + ['id']
+    filter_sql = ' AND '.join(where) or '1 = 1'
+    filter_params = list(params)
+
+    cursor_token = request.args.get('cursor')
+    position = None
+    if cursor_token:
+        position = _decode_cursor(cursor_token)
+        if not isinstance(position, list) or len(position) != len(keys):
+            return jsonify({'message': 'Curseur invalide'}), 400
+    limit = _int_arg('limit', USERS_PAGE_SIZE, minimum=1, maximum=USERS_MAX_PAGE_SIZE)
+
+    conn = get_db_connection()
+    users = conn.execute(*_user_directory_query(fields, where, params, keys, descending, position, limit)).fetchall()
+    total = user_counts.get((filter_sql, tuple(filter_params)), lambda: conn.execute(
+        f'SELECT count(*) FROM users WHERE {filter_sql}', filter_params).fetchone()[0])
+    conn.close()
+
+    has_more = len(users) > limit
+    users = users[:limit]
+    last = users[-1] if users else None
+    return jsonify({
+        'users': [{field: user[field] for field in fields} for user in users],
+        'next_cursor': _encode_cursor(*[last[f'sort_key_{index}'] for index in range(len(keys))]) if has_more else None,
+        'has_more': has_more,
+        'total': total
+    }), 200
+
+ADMIN_USER_FIELDS = ['id', 'username', 'name', 'age', 'weight', 'height', 'sport_goal', 'role', 'coach_id']
+BANNED_USERS_QUERY = "SELECT * FROM users WHERE status = 'ban'"
+
 @app.route('/admin/banned-users', methods=['GET'])
+@role_required('admin')
 def get_banned_users():
+    if any(arg in request.args for arg in USER_DIRECTORY_ARGS):
+        return _user_directory_page(ADMIN_USER_FIELDS + ['status', 'ban_raison', 'ban_until'], ["status = 'ban'"], [])
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE status = "ban"')
+    cursor.execute(BANNED_USERS_QUERY)
     banned_users = cursor.fetchall()
     conn.close()
 
@@ -271,53 +1525,165 @@ def get_banned_users():
 
     return jsonify(user_list), 200
 
+# Listage des séances : filtres, pagination par clé (date, id) et sélection de champs
+WORKOUT_FIELDS = ('id', 'date', 'type', 'duration', 'exercises', 'status')
+WORKOUTS_PAGE_SIZE = 50
+WORKOUTS_MAX_PAGE_SIZE = 500
+
+def _encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def _decode_cursor(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+
+def _list_arg(name):
+    value = request.args.get(name)
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+def _workouts_query(user_id, columns, date_from=None, date_to=None, filters=None, position=None, limit=None):
+    query = f"SELECT {', '.join(columns)} FROM workouts WHERE user_id = ?"
+    params = [user_id]
+    if date_from:
+        query += ' AND date >= ?'
+        params.append(date_from)
+    if date_to:
+        query += ' AND date <= ?'
+        params.append(date_to)
+    for column, values in (filters or {}).items():
+        if values:
+            query += f" AND {column} IN ({', '.join('?' * len(values))})"
+            params += values
+    # Les séances sans date viennent en dernier (NULL est le plus petit en SQLite) mais la comparaison
+    # de lignes les écarte : sans bornes de dates (qui les excluent déjà), elles sont lues dans une
+    # seconde partie, chaque partie restant sur l'index
+    if position and position[0] is None:
+        query += ' AND date IS NULL AND id < ?'
+        params.append(position[1])
+    elif position and (date_from or date_to):
+        query += ' AND (date, id) < (?, ?)'
+        params += position
+    elif position:
+        query = (f'SELECT * FROM ({query} AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?) '
+                 f'UNION ALL SELECT * FROM ({query} AND date IS NULL ORDER BY id DESC LIMIT ?)')
+        params = params + position + [limit + 1] + params + [limit + 1]
+    query += ' ORDER BY date DESC, id DESC'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit + 1)
+    return query, params
+
 @app.route('/workouts/<int:user_id>', methods=['GET'])
+@user_access_required(allow_coach=True)
 def get_user_workouts(user_id):
+    fields = _list_arg('fields') or list(WORKOUT_FIELDS)
+    unknown = [field for field in fields if field not in WORKOUT_FIELDS]
+    if unknown:
+        return jsonify({'message': f"Champs inconnus: {', '.join(unknown)}"}), 400
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    # date et id sont toujours lus : ils forment la clé de pagination
+    columns = sorted(set(fields) | {'id', 'date'}, key=WORKOUT_FIELDS.index)
+
+    cursor_token = request.args.get('cursor')
+    limit = _int_arg('limit', minimum=1, maximum=WORKOUTS_MAX_PAGE_SIZE)
+    paginate = cursor_token is not None or limit is not None
+    position = None
+    if cursor_token:
+        position = _decode_cursor(cursor_token)
+        if not isinstance(position, list) or len(position) != 2:
+            return jsonify({'message': 'Curseur invalide'}), 400
+    if paginate:
+        limit = limit or WORKOUTS_PAGE_SIZE
+    query, params = _workouts_query(user_id, columns, request.args.get('from'), request.args.get('to'),
+                                    {column: _list_arg(column) for column in ('type', 'status')},
+                                    position, limit if paginate else None)
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM workouts WHERE user_id = ? ORDER BY date DESC', (user_id,))
+    cursor.execute(query, params)
     workouts = cursor.fetchall()
     conn.close()
 
-    workout_list = []
-    for workout in workouts:
-        workout_list.append({
-            'id': workout['id'],
-            'date': workout['date'],
-            'type': workout['type'],
-            'duration': workout['duration'],
-            'exercises': workout['exercises'],
-            'status': workout['status']
-        })
+    has_more = paginate and len(workouts) > limit
+    if paginate:
+        workouts = workouts[:limit]
+    workout_list = [{field: workout[field] for field in fields} for workout in workouts]
 
-    return jsonify(workout_list), 200
+    if not paginate:
+        return jsonify(workout_list), 200
+    last = workouts[-1] if workouts else None
+    return jsonify({
+        'workouts': workout_list,
+        'next_cursor': _encode_cursor(last['date'], last['id']) if has_more else None,
+        'has_more': has_more
+    }), 200
 
 # Route pour bannir un utilisateur
 @app.route('/admin/ban-user/<int:user_id>', methods=['PUT'])
+@role_required('admin')
 def ban_user(user_id):
     data = request.get_json()
     reason = data.get('reason')
+    duration_minutes = data.get('duration_minutes')
+    # Durée en minutes (nombre strictement positif) ; absente ou vide : bannissement permanent
+    if duration_minutes in (None, ''):
+        duration = None
+    else:
+        try:
+            duration = timedelta(minutes=float(duration_minutes))
+        except (TypeError, ValueError, OverflowError):
+            duration = None
+        if duration is None or duration <= timedelta(0):
+            return jsonify({'message': 'duration_minutes doit être un nombre de minutes positif'}), 400
     
     conn = get_db_connection()
     cursor = conn.cursor()
-    
+    cursor.execute('SELECT ban_count FROM users WHERE id = ?', (user_id,))
+    user = cursor.fetchone()
+    if not user:
+        conn.close()
+        return jsonify({'message': 'User not found'}), 404
+    ban_count = (user['ban_count'] or 0) + 1
+
+    # Bannissement temporaire si une durée est donnée, permanent sinon ou après trop de récidives
+    ban_until = None
+    if duration and ban_count < BAN_PERMANENT_AFTER:
+        try:
+            ban_until = (datetime.datetime.now() + duration).strftime(BAN_DATE_FORMAT)
+        except OverflowError:
+            conn.close()
+            return jsonify({'message': 'duration_minutes doit être un nombre de minutes positif'}), 400
 
-    # Bannissement permanent
     cursor.execute('''
         UPDATE users 
         SET status = 'ban', 
-            ban_raison = ?
+            ban_raison = ?,
+            ban_count = ?,
+            ban_until = ?
         WHERE id = ?
-    ''', (reason, user_id))
+    ''', (reason, ban_count, ban_until, user_id))
     
     
     conn.commit()
     conn.close()
-    return jsonify({'message': 'User banned successfully'}), 200
+    auth_cache.invalidate(user_id)
+    user_counts.invalidate()
+    if ban_until:
+        ban_scheduler.schedule(user_id, ban_until)
+    return jsonify({
+        'message': 'User banned successfully',
+        'permanent': ban_until is None,
+        'ban_until': ban_until,
+        'ban_count': ban_count
+    }), 200
 
 
 # Route pour débannir un utilisateur
 @app.route('/admin/unban-user/<int:user_id>', methods=['PUT'])
+@role_required('admin')
 def unban_user(user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -325,17 +1691,21 @@ def unban_user(user_id):
     cursor.execute('''
         UPDATE users 
         SET status = 'active', 
-            ban_raison = NULL
+            ban_raison = NULL,
+            ban_until = NULL
         WHERE id = ?
-    ''', (user_id))
+    ''', (user_id,))
     
     
     conn.commit()
     conn.close()
+    auth_cache.invalidate(user_id)
+    user_counts.invalidate()
     return jsonify({'message': 'User unbanned successfully'}), 200
 
 # Route pour obtenir les informations du coach d'un utilisateur
 @app.route('/user/coach/<int:user_id>', methods=['GET'])
+@user_access_required(allow_coach=True)
 def get_user_coach_info(user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -368,6 +1738,8 @@ def get_user_coach_info(user_id):
         conn.close()
 
 # Route pour obtenir l'utilisateur admin
+ADMIN_USER_QUERY = "SELECT id, name, username FROM users WHERE role = 'admin' LIMIT 1"
+
 @app.route('/users/admin', methods=['GET'])
 def get_admin_user():
     conn = get_db_connection()
@@ -375,12 +1747,7 @@ def get_admin_user():
     
     try:
         # Récupérer le premier admin trouvé
-        cursor.execute('''
-            SELECT id, name, username 
-            FROM users 
-            WHERE role = 'admin' 
-            LIMIT 1
-        ''')
+        cursor.execute(ADMIN_USER_QUERY)
         admin = cursor.fetchone()
         
         if admin:
@@ -397,15 +1764,14 @@ def get_admin_user():
         conn.close()
 
 # Route pour obtenir les clients assignés à un coach
+COACH_CLIENTS_QUERY = 'SELECT id, username, name, age, weight, height, sport_goal FROM users WHERE coach_id = ?'
+
 @app.route('/coach/clients/<int:coach_id>', methods=['GET'])
+@user_access_required('coach_id')
 def get_coach_clients(coach_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, username, name, age, weight, height, sport_goal 
-        FROM users 
-        WHERE coach_id = ?
-    ''', (coach_id,))
+    cursor.execute(COACH_CLIENTS_QUERY, (coach_id,))
     clients = cursor.fetchall()
     conn.close()
 
@@ -423,8 +1789,85 @@ def get_coach_clients(coach_id):
 
     return jsonify(client_list), 200
 
+# Tableau de bord du coach : chaque client avec sa dernière séance, ses statistiques, son objectif
+# en cours et les messages non lus par le coach, en une seule requête quel que soit le nombre de clients
+COACH_DASHBOARD_QUERY = '''
+    SELECT u.id, u.username, u.name, u.age, u.weight, u.height, u.sport_goal, u.last_activity,
+           s.total_workouts, s.total_duration, s.calories_burned,
+           w.id AS workout_id, w.date AS workout_date, w.type AS workout_type,
+           w.duration AS workout_duration, w.status AS workout_status,
+           g.goal_type, g.target_date, g.current_progress,
+           CASE WHEN u.id > :coach_id THEN c.unread_low ELSE c.unread_high END AS unread_messages,
+           c.last_message, c.last_sender_id, c.last_timestamp
+    FROM users u
+    LEFT JOIN user_stats s ON s.user_id = u.id
+    LEFT JOIN workouts w ON w.id = (
+        SELECT id FROM workouts WHERE user_id = u.id ORDER BY date DESC, id DESC LIMIT 1
+    )
+    LEFT JOIN goals g ON g.id = (
+        SELECT id FROM goals WHERE user_id = u.id
+        ORDER BY (target_date IS NULL OR target_date >= date('now')) DESC, id DESC LIMIT 1
+    )
+    LEFT JOIN conversations c ON c.user_low = min(u.id, :coach_id) AND c.user_high = max(u.id, :coach_id)
+    WHERE u.coach_id = :coach_id
+    ORDER BY u.name COLLATE NOCASE, u.id
+'''
+
+@app.route('/coach/<int:coach_id>/dashboard', methods=['GET'])
+@role_required('coach', 'admin')
+@user_access_required('coach_id')
+def get_coach_dashboard(coach_id):
+    conn = get_db_connection()
+    clients = conn.execute(COACH_DASHBOARD_QUERY, {'coach_id': coach_id}).fetchall()
+    conn.close()
+    online = {entry['id'] for entry in presence.online_users()}
+
+    client_list = []
+    for client in clients:
+        client_list.append({
+            'id': client['id'],
+            'username': client['username'],
+            'name': client['name'],
+            'age': client['age'],
+            'weight': client['weight'],
+            'height': client['height'],
+            'sport_goal': client['sport_goal'],
+            'last_activity': client['last_activity'],
+            'online': client['id'] in online,
+            'stats': {
+                'total_workouts': client['total_workouts'] or 0,
+                'total_duration': client['total_duration'] or 0,
+                'calories_burned': client['calories_burned'] or 0
+            },
+            'latest_workout': {
+                'id': client['workout_id'],
+                'date': client['workout_date'],
+                'type': client['workout_type'],
+                'duration': client['workout_duration'],
+                'status': client['workout_status']
+            } if client['workout_id'] is not None else None,
+            'goal': {
+                'goal_type': client['goal_type'],
+                'target_date': client['target_date'],
+                'current_progress': client['current_progress']
+            } if client['goal_type'] is not None else None,
+            'unread_messages': client['unread_messages'] or 0,
+            'last_message': {
+                'message': client['last_message'],
+                'sender_id': client['last_sender_id'],
+                'timestamp': client['last_timestamp']
+            } if client['last_timestamp'] is not None else None
+        })
+
+    return jsonify({
+        'coach_id': coach_id,
+        'clients': client_list,
+        'unread_messages': sum(client['unread_messages'] for client in client_list)
+    }), 200
+
 # Route pour supprimer un client avec raison
 @app.route('/coach/remove-client/<int:client_id>', methods=['DELETE'])
+@user_access_required('client_id', allow_coach=True)
 def remove_client(client_id):
     data = request.get_json()
     reason = data.get('reason')
@@ -455,37 +1898,62 @@ def remove_client(client_id):
     
     conn.commit()
     conn.close()
+    auth_cache.invalidate(client_id)
+    user_counts.invalidate()
 
     return jsonify({'message': 'Client supprimé avec succès'}), 200
 
-# Route pour envoyer un message
-@app.route('/messages', methods=['POST'])
-def send_message():
-    data = request.get_json()
-    sender_id = data['sender_id']
-    receiver_id = data['receiver_id']
-    message = data['message']
-    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
+# Enregistre un message et met à jour la conversation dans la même transaction
+def record_message(cursor, sender_id, receiver_id, message, timestamp):
     cursor.execute('''
         INSERT INTO messages (sender_id, receiver_id, message, timestamp)
         VALUES (?, ?, ?, ?)
     ''', (sender_id, receiver_id, message, timestamp))
-    conn.commit()
-    conn.close()
+    message_id = cursor.lastrowid
+
+    user_low, user_high = min(sender_id, receiver_id), max(sender_id, receiver_id)
+    unread_column = 'unread_low' if receiver_id == user_low else 'unread_high'
+    cursor.execute(f'''
+        INSERT INTO conversations (user_low, user_high, last_message_id, last_sender_id, last_message, last_timestamp, {unread_column})
+        VALUES (?, ?, ?, ?, ?, ?, 1)
+        ON CONFLICT (user_low, user_high) DO UPDATE SET
+            last_message_id = excluded.last_message_id,
+            last_sender_id = excluded.last_sender_id,
+            last_message = excluded.last_message,
+            last_timestamp = excluded.last_timestamp,
+            {unread_column} = {unread_column} + 1
+    ''', (user_low, user_high, message_id, sender_id, message, timestamp))
+    return message_id
 
-    return jsonify({'message': 'Message sent successfully'}), 201
+# Route pour envoyer un message
+@app.route('/messages', methods=['POST'])
+def send_message():
+    data = request.get_json(silent=True) or {}
+    # L'expéditeur est l'utilisateur du jeton, comme pour sendMessage ; sender_id n'est cru
+    # sur parole que pendant la transition LEGACY_CLIENT_IDS
+    user = g.get('user')
+    if user is None and not LEGACY_CLIENT_IDS:
+        return jsonify({'message': 'Authentification requise'}), 401
+
+    try:
+        sender_id = user['id'] if user is not None else data.get('sender_id')
+        if data.get('sender_id') is not None and int(data['sender_id']) != int(sender_id):
+            return jsonify({'message': 'Expéditeur invalide'}), 403
+        pending = message_writer.submit(sender_id, data.get('receiver_id'), data.get('message'))
+    except (TypeError, ValueError):
+        return jsonify({'message': 'Message invalide'}), 400
+    if not pending.wait(MESSAGE_ACK_TIMEOUT):
+        return jsonify({'message': 'Délai dépassé'}), 503
+    if pending.error:
+        return jsonify({'message': f'Erreur: {pending.error}'}), 500
+
+    return jsonify({'message': 'Message sent successfully', 'id': pending.payload['id']}), 201
 
 # Route pour obtenir le rôle d'un utilisateur
 @app.route('/user/<int:user_id>/role', methods=['GET'])
+@user_access_required(allow_coach=True)
 def get_user_role(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT role FROM users WHERE id = ?', (user_id,))
-    user = cursor.fetchone()
-    conn.close()
+    user = auth_cache.get(user_id)
 
     if user:
         return jsonify({'role': user['role']}), 200
@@ -493,11 +1961,13 @@ def get_user_role(user_id):
         return jsonify({'message': 'User not found'}), 404
 
 # Route pour obtenir les coachs disponibles
+COACHES_QUERY = "SELECT id, name FROM users WHERE role = 'coach'"
+
 @app.route('/coaches', methods=['GET'])
 def get_coaches():
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT id, name FROM users WHERE role = "coach"')
+    cursor.execute(COACHES_QUERY)
     coaches = cursor.fetchall()
     conn.close()
 
@@ -505,140 +1975,688 @@ def get_coaches():
     return jsonify(coach_list), 200
 
 
-# Route pour vérifier les utilisateurs en ligne
+# Route pour consulter les métriques internes du serveur
+@app.route('/admin/metrics', methods=['GET'])
+@role_required('admin')
+def get_metrics():
+    return jsonify({
+        'db_pool': db_pool.stats(),
+        'presence': presence.stats(),
+        'message_writer': message_writer.stats(),
+        'password_hasher': password_hasher.stats(),
+        'auth_cache': auth_cache.stats(),
+        'ban_scheduler': ban_scheduler.stats(),
+        'derivatives': derivative_worker.stats(),
+        'catalog_cache': catalog_cache.stats(),
+        'notification_broadcasts': notification_broadcaster.stats(),
+        'user_counts': user_counts.stats()
+    }), 200
+
+# Route pour vérifier les utilisateurs en ligne (registre de présence, sans requête SQL)
 @app.route('/users/online', methods=['GET'])
 def get_online_users():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    # Solution temporaire - à remplacer par une vraie logique de présence
-    cursor.execute('SELECT id, name FROM users LIMIT 10')  # Exemple basique
-    online_users = cursor.fetchall()
-    conn.close()
-    
-    return jsonify([dict(user) for user in online_users]), 200
+    return jsonify(presence.online_users()), 200
 
 @app.route('/user/<int:user_id>/coach', methods=['GET'])
+@user_access_required(allow_coach=True)
 def get_user_coach(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT coach_id FROM users WHERE id = ?', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    
+    result = auth_cache.get(user_id)
+
     if result and result['coach_id']:
         return jsonify({'coach_id': result['coach_id']}), 200
     else:
         return jsonify({'message': 'No coach assigned'}), 404
 
 # Route pour marquer les messages comme lus
+MARK_MESSAGES_READ_QUERY = 'UPDATE messages SET is_read = 1 WHERE receiver_id = ? AND sender_id = ? AND is_read = 0'
+
 @app.route('/messages/mark-read', methods=['POST'])
 def mark_messages_as_read():
-    data = request.get_json()
-    user_id = data['user_id']
-    sender_id = data['sender_id']
-    
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id')
+    sender_id = data.get('sender_id')
+    # Identifiants entiers uniquement : ils choisissent la ligne de conversation et le compteur à remettre à zéro
+    if not all(isinstance(value, int) and not isinstance(value, bool) for value in (user_id, sender_id)):
+        return jsonify({'message': 'Identifiants invalides'}), 400
+    # Seul le destinataire marque ses messages comme lus
+    error = user_access_error(user_id)
+    if error:
+        return error
+
+    user_low, user_high = min(user_id, sender_id), max(user_id, sender_id)
+    unread_column = 'unread_low' if user_id == user_low else 'unread_high'
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE messages SET is_read = 1 
-        WHERE receiver_id = ? AND sender_id = ? AND is_read = 0
-    ''', (user_id, sender_id))
-    conn.commit()
+    cursor.execute(f'SELECT {unread_column} FROM conversations WHERE user_low = ? AND user_high = ?',
+                   (user_low, user_high))
+    conversation = cursor.fetchone()
+
+    # Rien à marquer : on évite de parcourir les messages
+    if conversation and conversation[0]:
+        cursor.execute(MARK_MESSAGES_READ_QUERY, (user_id, sender_id))
+        cursor.execute(f'UPDATE conversations SET {unread_column} = 0 WHERE user_low = ? AND user_high = ?',
+                       (user_low, user_high))
+        conn.commit()
     conn.close()
     
     return jsonify({'message': 'Messages marqués comme lus'}), 200
 
+# Stockage des fichiers par contenu : uploads/objects/ab/cd/<sha256>, un seul exemplaire par contenu
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 20 * 1024 * 1024))
+UPLOAD_MAX_RESUMABLE_BYTES = int(os.environ.get('UPLOAD_MAX_RESUMABLE_BYTES', 2 * 1024 * 1024 * 1024))
+UPLOAD_OBJECTS_FOLDER = os.path.join(UPLOAD_FOLDER, 'objects')
+UPLOAD_TMP_FOLDER = os.path.join(UPLOAD_FOLDER, 'tmp')
+
+def blob_path(sha256):
+    return os.path.join(UPLOAD_OBJECTS_FOLDER, sha256[:2], sha256[2:4], sha256)
+
+# Déplace un fichier temporaire vers son emplacement définitif ; supprimé si le contenu existe déjà
+def store_blob(temp_path, sha256):
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        os.remove(temp_path)
+        return path, True
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(temp_path, path)
+    return path, False
+
+def record_upload(cursor, filename, filepath, uploader_id, sha256, size, content_type):
+    cursor.execute('''
+        INSERT INTO uploaded_files (filename, filepath, uploader_id, upload_date, sha256, size, content_type)
+        VALUES (?, ?, ?, datetime('now'), ?, ?, ?)
+    ''', (filename, filepath, uploader_id, sha256, size, content_type))
+    return cursor.lastrowid
+
+def _content_type(filename, declared=None):
+    if declared and declared != 'application/octet-stream':
+        return declared
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+# Miniatures et variantes WebP des images uploadées, générées en arrière-plan (dépendance
+# optionnelle Pillow) et rangées à côté de l'original : <sha256>.<largeur>.<jpg|webp>
+DERIVATIVE_WIDTHS = [int(width) for width in os.environ.get('DERIVATIVE_WIDTHS', '160,320,640,1280').split(',')]
+DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', 2))
+DERIVATIVE_MAX_PENDING = int(os.environ.get('DERIVATIVE_MAX_PENDING', 64))
+DERIVATIVE_QUALITY = int(os.environ.get('DERIVATIVE_QUALITY', 80))
+DERIVATIVE_SOURCE_TYPES = {'image/jpeg', 'image/png', 'image/webp'}
+DERIVATIVE_FORMATS = [('JPEG', 'jpg', 'image/jpeg'), ('WEBP', 'webp', 'image/webp')]
+
+def derivative_path(sha256, width, extension):
+    return f'{blob_path(sha256)}.{width}.{extension}'
+
+
+class DerivativeWorker:
+    def __init__(self, widths=DERIVATIVE_WIDTHS, workers=DERIVATIVE_WORKERS, max_pending=DERIVATIVE_MAX_PENDING):
+        self.widths = sorted(widths)
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stats = {'queued': 0, 'generated': 0, 'skipped': 0, 'rejected': 0, 'failed': 0}
+        try:
+            from PIL import Image, ImageOps
+            self._image, self._image_ops = Image, ImageOps
+        except ImportError:
+            self._image = self._image_ops = None
+
+    @property
+    def available(self):
+        return self._image is not None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='derivatives')
+            return self._executor
+
+    # Met en file la génération des variantes ; renvoie False si rien n'a été mis en file
+    def submit(self, sha256, content_type, uploader_id=None):
+        if not self.available or content_type not in DERIVATIVE_SOURCE_TYPES:
+            return False
+        with self._lock:
+            if sha256 in self._pending:
+                return True
+            if len(self._pending) >= self.max_pending:
+                self._stats['rejected'] += 1
+                return False
+            self._pending.add(sha256)
+            self._stats['queued'] += 1
+        self._get_executor().submit(self._run, sha256, uploader_id)
+        return True
+
+    def _run(self, sha256, uploader_id):
+        try:
+            self.generate(sha256, uploader_id)
+        except Exception as error:
+            with self._lock:
+                self._stats['failed'] += 1
+            print(f'Erreur de génération des variantes {sha256}: {error}')
+        finally:
+            with self._lock:
+                self._pending.discard(sha256)
+
+    def generate(self, sha256, uploader_id=None):
+        with db_pool.connection() as conn:
+            done = conn.execute('SELECT 1 FROM uploaded_files WHERE variant_of = ? LIMIT 1', (sha256,)).fetchone()
+        if done:
+            with self._lock:
+                self._stats['skipped'] += 1
+            return 0
+
+        rows = []
+        with self._image.open(blob_path(sha256)) as source:
+            # Décodage JPEG directement à une résolution réduite quand c'est possible
+            source.draft('RGB', (self.widths[-1], self.widths[-1]))
+            image = self._image_ops.exif_transpose(source)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+            widths = [width for width in self.widths if width < image.width] or [image.width]
+            # Du plus grand au plus petit : chaque réduction part de la précédente
+            for width in reversed(widths):
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), self._image.LANCZOS)
+                for image_format, extension, content_type in DERIVATIVE_FORMATS:
+                    path = derivative_path(sha256, width, extension)
+                    temp_path = f'{path}.tmp'
+                    output = image.convert('RGB') if image_format == 'JPEG' and image.mode != 'RGB' else image
+                    output.save(temp_path, image_format, quality=DERIVATIVE_QUALITY, optimize=True)
+                    os.replace(temp_path, path)
+                    rows.append((os.path.basename(path), path, uploader_id, os.path.getsize(path), content_type,
+                                 sha256, width))
+
+        with db_pool.connection() as conn:
+            conn.executemany('''
+                INSERT INTO uploaded_files (filename, filepath, uploader_id, upload_date, size, content_type,
+                                            variant_of, width)
+                VALUES (?, ?, ?, datetime('now'), ?, ?, ?, ?)
+            ''', rows)
+        with self._lock:
+            self._stats['generated'] += len(rows)
+        return len(rows)
+
+    # Variante la plus adaptée : la plus petite au moins aussi large que demandé, WebP si accepté
+    def pick(self, variants, width, accept_webp):
+        content_type = 'image/webp' if accept_webp else 'image/jpeg'
+        candidates = [variant for variant in variants if variant['content_type'] == content_type]
+        if not candidates:
+            return None
+        for variant in candidates:
+            if variant['width'] >= width:
+                return variant
+        return candidates[-1]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, available=self.available, pending=len(self._pending))
+
+
+derivative_worker = DerivativeWorker()
+
+
+# Fichier temporaire dans lequel Werkzeug écrit la partie multipart au fil de l'eau :
+# le SHA-256 est calculé pendant l'écriture et la taille limitée en cours de flux
+class HashingUploadFile:
+    def __init__(self, max_bytes=None):
+        os.makedirs(UPLOAD_TMP_FOLDER, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=UPLOAD_TMP_FOLDER)
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self.max_bytes = max_bytes or UPLOAD_MAX_BYTES
+        self.size = 0
+        self.stored_path = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.close()
+            raise RequestEntityTooLarge()
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def persist(self):
+        self._file.close()
+        self.stored_path, deduplicated = store_blob(self.path, self.hexdigest())
+        return self.stored_path, deduplicated
+
+    def close(self):
+        self._file.close()
+        if self.stored_path is None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingUploadFile()
+
+
+app.request_class = UploadRequest
+
+@app.errorhandler(RequestEntityTooLarge)
+def handle_upload_too_large(error):
+    return jsonify({'error': 'Fichier trop volumineux'}), 413
+
 # Route pour uploader des fichiers
 @app.route('/upload', methods=['POST'])
 def upload_file():
+    # Refusé avant de lire le corps : un appel anonyme n'écrit rien sur le disque
+    uploader_id = g.user['id'] if g.get('user') else None
+    if uploader_id is None and not LEGACY_CLIENT_IDS:
+        return jsonify({'message': 'Authentification requise'}), 401
     if 'file' not in request.files:
         return jsonify({'error': 'Aucun fichier envoyé'}), 400
     
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'Nom de fichier vide'}), 400
+    if uploader_id is None:
+        # Transition : l'ancien client annonce son identifiant, comme pour create_upload_session
+        try:
+            uploader_id = int(request.form['user_id'])
+        except (KeyError, ValueError):
+            return jsonify({'message': 'Authentification requise'}), 401
     
-    # Sauvegarder le fichier (à adapter selon votre configuration)
+    # Le contenu a déjà été écrit et haché pendant la réception
     filename = secure_filename(file.filename)
-    filepath = os.path.join('uploads', filename)
-    file.save(filepath)
+    upload = file.stream
+    filepath, deduplicated = upload.persist()
+    sha256 = upload.hexdigest()
     
     # Enregistrer en base de données
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO uploaded_files (filename, filepath, uploader_id, upload_date)
-        VALUES (?, ?, ?, datetime('now'))
-    ''', (filename, filepath, request.form.get('user_id')))
+    content_type = _content_type(filename, file.mimetype)
+    file_id = record_upload(cursor, filename, filepath, uploader_id, sha256, upload.size, content_type)
     conn.commit()
     conn.close()
+    derivatives = derivative_worker.submit(sha256, content_type, uploader_id)
     
     return jsonify({
         'message': 'Fichier uploadé avec succès',
+        'id': file_id,
+        'filepath': filepath,
+        'filename': filename,
+        'sha256': sha256,
+        'size': upload.size,
+        'url': f'/media/{sha256}',
+        'deduplicated': deduplicated,
+        'derivatives': derivatives
+    }), 200
+
+# Service des fichiers uploadés : ETag fort issu du SHA-256, requêtes conditionnelles (304)
+# et partielles (Range, pour avancer dans une vidéo). send_file passe par wsgi.file_wrapper
+# (sendfile sous gunicorn / eventlet) ou délègue au serveur frontal avec USE_X_SENDFILE=1
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '0') == '1'
+MEDIA_MAX_AGE = 365 * 24 * 3600
+LEGACY_UPLOAD_MAX_AGE = 24 * 3600
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+_legacy_etags = {}
+_legacy_etags_lock = threading.Lock()
+
+# Empreinte d'un fichier de l'ancien dossier plat, recalculée seulement s'il a changé
+def _file_sha256(path):
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _legacy_etags_lock:
+        if key in _legacy_etags:
+            return _legacy_etags[key]
+    sha = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    with _legacy_etags_lock:
+        _legacy_etags[key] = sha.hexdigest()
+    return _legacy_etags[key]
+
+MEDIA_QUERY = 'SELECT filename, content_type FROM uploaded_files WHERE sha256 = ? LIMIT 1'
+MEDIA_VARIANTS_QUERY = 'SELECT filepath, content_type, width FROM uploaded_files WHERE variant_of = ? ORDER BY width'
+
+# Route pour servir un fichier par son empreinte (contenu immuable) ; ?w= choisit une miniature
+@app.route('/media/<sha256>', methods=['GET'])
+def get_media(sha256):
+    if not SHA256_PATTERN.match(sha256):
+        return jsonify({'error': 'Empreinte invalide'}), 400
+    path = blob_path(sha256)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Fichier introuvable'}), 404
+    width = request.args.get('w', type=int)
+
+    conn = get_db_connection()
+    upload = conn.execute(MEDIA_QUERY, (sha256,)).fetchone()
+    variants = []
+    if width and upload and upload['content_type'] in DERIVATIVE_SOURCE_TYPES:
+        variants = conn.execute(MEDIA_VARIANTS_QUERY, (sha256,)).fetchall()
+    conn.close()
+    mimetype = upload['content_type'] if upload else 'application/octet-stream'
+    download_name = upload['filename'] if upload else sha256
+
+    if width and upload and upload['content_type'] in DERIVATIVE_SOURCE_TYPES:
+        variant = derivative_worker.pick(variants, width, request.accept_mimetypes['image/webp'] > 0)
+        if variant is None:
+            # Variantes pas encore générées : l'original, sans cache long pour cette URL
+            response = send_file(os.path.abspath(path), mimetype=mimetype, conditional=True, etag=sha256,
+                                 max_age=60, download_name=download_name)
+        else:
+            extension = variant['filepath'].rsplit('.', 1)[1]
+            response = send_file(os.path.abspath(variant['filepath']), mimetype=variant['content_type'],
+                                 conditional=True, etag=f"{sha256}.{variant['width']}.{extension}",
+                                 max_age=MEDIA_MAX_AGE, download_name=f"{variant['width']}-{download_name}")
+            response.cache_control.immutable = True
+        response.vary.add('Accept')
+        return response
+
+    response = send_file(os.path.abspath(path), mimetype=mimetype, conditional=True, etag=sha256,
+                         max_age=MEDIA_MAX_AGE, download_name=download_name)
+    response.cache_control.immutable = True
+    return response
+
+# Route pour les fichiers de l'ancien dossier plat (uploads/image.jpg) : un nom sans sous-dossier,
+# le stockage par contenu (objects/) et les envois en cours (tmp/) ne sont pas servis ici
+@app.route('/uploads/<filename>', methods=['GET'])
+def get_legacy_upload(filename):
+    path = safe_join(os.path.abspath(UPLOAD_FOLDER), filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify({'error': 'Fichier introuvable'}), 404
+    return send_file(path, conditional=True, etag=_file_sha256(path), max_age=LEGACY_UPLOAD_MAX_AGE)
+
+# Génère les variantes manquantes des images déjà uploadées
+@app.cli.command('build-derivatives')
+def build_derivatives_command():
+    init_db()
+    if not derivative_worker.available:
+        raise SystemExit('Pillow est nécessaire pour générer les variantes')
+    conn = get_db_connection()
+    uploads = conn.execute(f'''
+        SELECT DISTINCT sha256, uploader_id FROM uploaded_files
+        WHERE sha256 IS NOT NULL AND content_type IN ({', '.join('?' for _ in DERIVATIVE_SOURCE_TYPES)})
+    ''', sorted(DERIVATIVE_SOURCE_TYPES)).fetchall()
+    conn.close()
+    total = sum(derivative_worker.generate(upload['sha256'], upload['uploader_id']) for upload in uploads)
+    print(f'{total} variantes générées')
+
+# Upload reprenable pour les gros fichiers (vidéos) : création de session puis envoi par morceaux.
+# Une session appartient à l'utilisateur du jeton, qui ne peut en garder que quelques-unes ouvertes ;
+# les sessions sans activité depuis UPLOAD_SESSION_TTL_HOURS sont purgées avec leur fichier temporaire
+UPLOAD_MAX_OPEN_SESSIONS = int(os.environ.get('UPLOAD_MAX_OPEN_SESSIONS', 3))
+UPLOAD_SESSION_TTL_HOURS = float(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 24))
+UPLOAD_SESSION_SWEEP_INTERVAL = float(os.environ.get('UPLOAD_SESSION_SWEEP_INTERVAL', 3600))
+UPLOAD_SESSION_SWEEP_BATCH = 100
+
+# Insertion refusée (aucune ligne) si l'utilisateur a déjà trop de sessions ouvertes
+CREATE_UPLOAD_SESSION_QUERY = '''
+    INSERT INTO upload_sessions (id, filename, uploader_id, content_type, size, received, temp_path, updated_at)
+    SELECT ?, ?, ?, ?, ?, 0, ?, CURRENT_TIMESTAMP
+    WHERE (SELECT count(*) FROM upload_sessions WHERE uploader_id = ?) < ?
+'''
+UPLOAD_SESSION_QUERY = 'SELECT * FROM upload_sessions WHERE id = ?'
+# Avance conditionnelle : un autre envoi concurrent ou la purge ont pu passer entre-temps
+UPLOAD_SESSION_PROGRESS_QUERY = '''
+    UPDATE upload_sessions SET received = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND received = ?
+'''
+EXPIRED_UPLOAD_SESSIONS_QUERY = 'SELECT id, temp_path FROM upload_sessions WHERE updated_at < ? LIMIT ?'
+
+def _upload_session_allowed(session):
+    user = g.get('user')
+    if user is None:
+        return LEGACY_CLIENT_IDS
+    return user['role'] == 'admin' or user['id'] == session['uploader_id']
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def purge_upload_sessions():
+    cutoff = datetime.datetime.utcnow() - timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    deleted = 0
+    while True:
+        with db_pool.connection() as conn:
+            sessions = conn.execute(EXPIRED_UPLOAD_SESSIONS_QUERY,
+                                    (cutoff.strftime(BAN_DATE_FORMAT), UPLOAD_SESSION_SWEEP_BATCH)).fetchall()
+            conn.executemany('DELETE FROM upload_sessions WHERE id = ?', [(session['id'],) for session in sessions])
+        for session in sessions:
+            _remove_file(session['temp_path'])
+        deleted += len(sessions)
+        if len(sessions) < UPLOAD_SESSION_SWEEP_BATCH:
+            break
+        socketio.sleep(0)
+
+    # Fichiers temporaires orphelins (session jamais enregistrée, arrêt brutal) plus vieux que la durée de vie
+    if os.path.isdir(UPLOAD_TMP_FOLDER):
+        with db_pool.connection() as conn:
+            known = {row['temp_path'] for row in conn.execute('SELECT temp_path FROM upload_sessions')}
+        for entry in os.scandir(UPLOAD_TMP_FOLDER):
+            if (entry.name.startswith('session-') and entry.path not in known
+                    and entry.stat().st_mtime < time.time() - UPLOAD_SESSION_TTL_HOURS * 3600):
+                _remove_file(entry.path)
+                deleted += 1
+    return deleted
+
+def _upload_session_retention_loop():
+    while True:
+        try:
+            purge_upload_sessions()
+        except Exception as e:
+            print('Erreur purge sessions upload:', e)
+        socketio.sleep(UPLOAD_SESSION_SWEEP_INTERVAL)
+
+@app.route('/upload/sessions', methods=['POST'])
+def create_upload_session():
+    data = request.get_json()
+    uploader_id = g.user['id'] if g.get('user') else None
+    if uploader_id is None:
+        # Transition : l'ancien client annonce son identifiant
+        if not LEGACY_CLIENT_IDS or not isinstance(data.get('user_id'), int):
+            return jsonify({'message': 'Authentification requise'}), 401
+        uploader_id = data['user_id']
+    filename = secure_filename(data.get('filename') or '')
+    size = data.get('size')
+    if not filename or not isinstance(size, int) or size <= 0:
+        return jsonify({'error': 'Nom de fichier et taille requis'}), 400
+    if size > UPLOAD_MAX_RESUMABLE_BYTES:
+        return jsonify({'error': 'Fichier trop volumineux'}), 413
+
+    upload_id = uuid.uuid4().hex
+    os.makedirs(UPLOAD_TMP_FOLDER, exist_ok=True)
+    temp_path = os.path.join(UPLOAD_TMP_FOLDER, f'session-{upload_id}')
+    open(temp_path, 'wb').close()
+
+    with db_pool.connection() as conn:
+        created = conn.execute(CREATE_UPLOAD_SESSION_QUERY, (
+            upload_id, filename, uploader_id, _content_type(filename, data.get('content_type')), size, temp_path,
+            uploader_id, UPLOAD_MAX_OPEN_SESSIONS)).rowcount
+    if not created:
+        _remove_file(temp_path)
+        return jsonify({'error': "Trop de sessions d'upload ouvertes"}), 429
+
+    return jsonify({'upload_id': upload_id, 'received': 0, 'size': size, 'chunk_size': UPLOAD_CHUNK_SIZE}), 201
+
+@app.route('/upload/sessions/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    conn = get_db_connection()
+    session = conn.execute(UPLOAD_SESSION_QUERY, (upload_id,)).fetchone()
+    conn.close()
+    if not session:
+        return jsonify({'error': 'Session inconnue'}), 404
+    if not _upload_session_allowed(session):
+        return jsonify({'message': 'Accès refusé'}), 403
+    return jsonify({'upload_id': upload_id, 'received': session['received'], 'size': session['size']}), 200
+
+# Ajoute le morceau envoyé dans le corps de la requête à la position ?offset= (par défaut, la suite).
+# Aucune connexion du pool n'est gardée pendant la réception ni pendant le hachage du fichier complet
+@app.route('/upload/sessions/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    conn = get_db_connection()
+    session = conn.execute(UPLOAD_SESSION_QUERY, (upload_id,)).fetchone()
+    conn.close()
+    if not session:
+        return jsonify({'error': 'Session inconnue'}), 404
+    if not _upload_session_allowed(session):
+        return jsonify({'message': 'Accès refusé'}), 403
+
+    offset = request.args.get('offset', session['received'], type=int)
+    if offset != session['received']:
+        return jsonify({'error': 'Position invalide', 'received': session['received']}), 409
+
+    # Copie par blocs, en s'arrêtant dès que la taille annoncée serait dépassée
+    remaining = session['size'] - offset
+    written = 0
+    with open(session['temp_path'], 'r+b') as target:
+        target.seek(offset)
+        while True:
+            chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > remaining:
+                target.truncate(offset)
+                return jsonify({'error': 'Morceau plus grand que la taille annoncée'}), 413
+            target.write(chunk)
+    received = offset + written
+    with db_pool.connection() as conn:
+        advanced = conn.execute(UPLOAD_SESSION_PROGRESS_QUERY, (received, upload_id, offset)).rowcount
+        current = None if advanced else conn.execute(UPLOAD_SESSION_QUERY, (upload_id,)).fetchone()
+    if not advanced:
+        if current is None:
+            return jsonify({'error': 'Session inconnue'}), 404
+        return jsonify({'error': 'Position invalide', 'received': current['received']}), 409
+
+    if received < session['size']:
+        return jsonify({'upload_id': upload_id, 'received': received, 'size': session['size']}), 200
+
+    # Fichier complet : hachage, stockage par contenu puis enregistrement
+    sha = hashlib.sha256()
+    with open(session['temp_path'], 'rb') as source:
+        for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    sha256 = sha.hexdigest()
+    filepath, deduplicated = store_blob(session['temp_path'], sha256)
+    with db_pool.connection() as conn:
+        file_id = record_upload(conn.cursor(), session['filename'], filepath, session['uploader_id'], sha256,
+                                session['size'], session['content_type'])
+        conn.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+    derivatives = derivative_worker.submit(sha256, session['content_type'], session['uploader_id'])
+
+    return jsonify({
+        'message': 'Fichier uploadé avec succès',
+        'id': file_id,
         'filepath': filepath,
-        'filename': filename
+        'filename': session['filename'],
+        'sha256': sha256,
+        'size': session['size'],
+        'url': f'/media/{sha256}',
+        'deduplicated': deduplicated,
+        'derivatives': derivatives
+    }), 201
+
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
+
+# Messages d'une conversation, servis par idx_messages_conversation
+CONVERSATION_QUERY = '''
+    SELECT id, sender_id, receiver_id, message, timestamp, is_read FROM messages
+    WHERE min(sender_id, receiver_id) = ? AND max(sender_id, receiver_id) = ?
+'''
+
+def _message_to_dict(message):
+    return {
+        'id': message['id'],
+        'sender_id': message['sender_id'],
+        'receiver_id': message['receiver_id'],
+        'message': message['message'],
+        'timestamp': message['timestamp'],
+        'is_read': bool(message['is_read'])
+    }
+
+def _int_arg(name, default=None, minimum=None, maximum=None):
+    value = request.args.get(name, default, type=int)
+    if value is not None and minimum is not None:
+        value = max(value, minimum)
+    if value is not None and maximum is not None:
+        value = min(value, maximum)
+    return value
+
+# Identifiant lu dans un corps JSON : un entier, pas un booléen (True est un int en Python)
+def _is_json_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+# Renvoie la conversation entière (ancien format) ou une page si un curseur
+# (before_id / after_id) ou une limite est demandé
+def _conversation_response(cursor, user_a, user_b):
+    pair = (min(user_a, user_b), max(user_a, user_b))
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+    limit = _int_arg('limit', minimum=1, maximum=MESSAGES_MAX_PAGE_SIZE)
+
+    if before_id is None and after_id is None and limit is None:
+        cursor.execute(CONVERSATION_QUERY + ' ORDER BY id ASC', pair)
+        return jsonify([_message_to_dict(message) for message in cursor.fetchall()]), 200
+
+    limit = limit or MESSAGES_PAGE_SIZE
+    if after_id is not None:
+        # Messages plus récents que le curseur : on lit dans l'ordre croissant
+        # pour ne rien sauter, puis on renvoie du plus récent au plus ancien
+        cursor.execute(CONVERSATION_QUERY + ' AND id > ? ORDER BY id ASC LIMIT ?', pair + (after_id, limit + 1))
+        rows = cursor.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit][::-1]
+        next_cursor = rows[0]['id'] if rows else after_id
+    else:
+        if before_id is None:
+            cursor.execute(CONVERSATION_QUERY + ' ORDER BY id DESC LIMIT ?', pair + (limit + 1,))
+        else:
+            cursor.execute(CONVERSATION_QUERY + ' AND id < ? ORDER BY id DESC LIMIT ?', pair + (before_id, limit + 1))
+        rows = cursor.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = rows[-1]['id'] if rows and has_more else None
+
+    return jsonify({
+        'messages': [_message_to_dict(message) for message in rows],
+        'next_cursor': next_cursor,
+        'has_more': has_more
     }), 200
 
 # Route pour récupérer les messages entre deux utilisateurs
 @app.route('/messages/<int:sender_id>/<int:receiver_id>', methods=['GET'])
+@user_access_required('sender_id', 'receiver_id')
 def get_messages(sender_id, receiver_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM messages
-        WHERE (sender_id = ? AND receiver_id = ?)
-           OR (sender_id = ? AND receiver_id = ?)
-        ORDER BY timestamp ASC
-    ''', (sender_id, receiver_id, receiver_id, sender_id))
-    messages = cursor.fetchall()
-    conn.close()
-
-    message_list = []
-    for message in messages:
-        message_list.append({
-            'id': message['id'],
-            'sender_id': message['sender_id'],
-            'receiver_id': message['receiver_id'],
-            'message': message['message'],
-            'timestamp': message['timestamp']
-        })
-
-    return jsonify(message_list), 200
+    try:
+        return _conversation_response(cursor, sender_id, receiver_id)
+    finally:
+        conn.close()
 
 # Route pour récupérer les messages d'un utilisateur avec son coach
 @app.route('/messages/coach/<int:user_id>', methods=['GET'])
+@user_access_required()
 def get_messages_with_coach(user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    # Récupérer l'ID du coach de l'utilisateur
-    cursor.execute('SELECT coach_id FROM users WHERE id = ?', (user_id,))
-    coach_id = cursor.fetchone()['coach_id']
-
-    if not coach_id:
-        return jsonify({'message': 'Aucun coach assigné'}), 404
-
-    # Récupérer les messages entre l'utilisateur et son coach
-    cursor.execute('''
-        SELECT * FROM messages
-        WHERE (sender_id = ? AND receiver_id = ?)
-           OR (sender_id = ? AND receiver_id = ?)
-        ORDER BY timestamp ASC
-    ''', (user_id, coach_id, coach_id, user_id))
-    messages = cursor.fetchall()
-    conn.close()
+    try:
+        # Récupérer l'ID du coach de l'utilisateur
+        cursor.execute('SELECT coach_id FROM users WHERE id = ?', (user_id,))
+        user = cursor.fetchone()
 
-    message_list = []
-    for message in messages:
-        message_list.append({
-            'id': message['id'],
-            'sender_id': message['sender_id'],
-            'receiver_id': message['receiver_id'],
-            'message': message['message'],
-            'timestamp': message['timestamp']
-        })
+        if not user or not user['coach_id']:
+            return jsonify({'message': 'Aucun coach assigné'}), 404
 
-    return jsonify(message_list), 200
+        # Récupérer les messages entre l'utilisateur et son coach
+        return _conversation_response(cursor, user_id, user['coach_id'])
+    finally:
+        conn.close()
 
 @app.route('/messages/<int:message_id>', methods=['PUT'])
 def update_message(message_id):
@@ -647,11 +2665,26 @@ def update_message(message_id):
 
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute('SELECT sender_id, receiver_id FROM messages WHERE id = ?', (message_id,))
+    existing = cursor.fetchone()
+    # Seul l'auteur du message (ou un administrateur) peut le modifier
+    error = user_access_error(existing['sender_id'] if existing else None)
+    if error:
+        conn.close()
+        return error
     cursor.execute('''
         UPDATE messages
         SET message = ?
         WHERE id = ?
     ''', (new_message, message_id))
+
+    # Aperçu de la conversation si le message modifié est le dernier
+    if existing:
+        cursor.execute('''
+            UPDATE conversations SET last_message = ?
+            WHERE user_low = ? AND user_high = ? AND last_message_id = ?
+        ''', (new_message, min(existing['sender_id'], existing['receiver_id']),
+              max(existing['sender_id'], existing['receiver_id']), message_id))
     conn.commit()
     conn.close()
 
@@ -661,45 +2694,146 @@ def update_message(message_id):
 def delete_message(message_id):
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute('SELECT sender_id, receiver_id, is_read FROM messages WHERE id = ?', (message_id,))
+    existing = cursor.fetchone()
+    error = user_access_error(existing['sender_id'] if existing else None)
+    if error:
+        conn.close()
+        return error
     cursor.execute('DELETE FROM messages WHERE id = ?', (message_id,))
+
+    if existing:
+        user_low = min(existing['sender_id'], existing['receiver_id'])
+        user_high = max(existing['sender_id'], existing['receiver_id'])
+        pair = (user_low, user_high)
+        if not existing['is_read']:
+            unread_column = 'unread_low' if existing['receiver_id'] == user_low else 'unread_high'
+            cursor.execute(f'''
+                UPDATE conversations SET {unread_column} = max({unread_column} - 1, 0)
+                WHERE user_low = ? AND user_high = ?
+            ''', pair)
+
+        # Le dernier message supprimé : on remonte au précédent via l'index de conversation
+        cursor.execute('SELECT last_message_id FROM conversations WHERE user_low = ? AND user_high = ?', pair)
+        conversation = cursor.fetchone()
+        if conversation and conversation['last_message_id'] == message_id:
+            cursor.execute(CONVERSATION_QUERY + ' ORDER BY id DESC LIMIT 1', pair)
+            previous = cursor.fetchone()
+            if previous:
+                cursor.execute('''
+                    UPDATE conversations
+                    SET last_message_id = ?, last_sender_id = ?, last_message = ?, last_timestamp = ?
+                    WHERE user_low = ? AND user_high = ?
+                ''', (previous['id'], previous['sender_id'], previous['message'], previous['timestamp']) + pair)
+            else:
+                cursor.execute('DELETE FROM conversations WHERE user_low = ? AND user_high = ?', pair)
     conn.commit()
     conn.close()
 
     return jsonify({'message': 'Message deleted successfully'}), 200
 
-# Routes existantes (non modifiées)
-@app.route('/admin/workouts', methods=['GET'])
-def get_all_workouts():
+# Route pour la boîte de réception : une ligne par conversation, la plus récente d'abord
+INBOX_QUERY = '''
+    SELECT inbox.*, users.name, users.username FROM (
+        SELECT user_high AS other_id, last_message_id, last_sender_id, last_message, last_timestamp,
+               unread_low AS unread_count
+        FROM conversations WHERE user_low = ?
+        UNION ALL
+        SELECT user_low, last_message_id, last_sender_id, last_message, last_timestamp,
+               unread_high
+        FROM conversations WHERE user_high = ? AND user_low != ?
+    ) AS inbox
+    LEFT JOIN users ON users.id = inbox.other_id
+    ORDER BY inbox.last_timestamp DESC
+'''
+
+@app.route('/conversations/<int:user_id>', methods=['GET'])
+@user_access_required()
+def get_conversations(user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
+    cursor.execute(INBOX_QUERY, (user_id, user_id, user_id))
+    conversations = cursor.fetchall()
+    conn.close()
+
+    conversation_list = []
+    for conversation in conversations:
+        conversation_list.append({
+            'user_id': conversation['other_id'],
+            'name': conversation['name'],
+            'username': conversation['username'],
+            'last_message_id': conversation['last_message_id'],
+            'last_sender_id': conversation['last_sender_id'],
+            'last_message': conversation['last_message'],
+            'last_timestamp': conversation['last_timestamp'],
+            'unread_count': conversation['unread_count']
+        })
+
+    return jsonify(conversation_list), 200
+
+# Routes existantes (non modifiées)
+# Séances à venir pour l'administration, envoyées au fil de la lecture du curseur : tableau JSON
+# (par défaut) ou NDJSON (?format=ndjson ou Accept: application/x-ndjson). La mémoire reste
+# constante quel que soit le nombre de lignes ; fenêtre de dates et coach en option
+ADMIN_WORKOUTS_BATCH_SIZE = 500
+ADMIN_WORKOUT_FIELDS = ('id', 'date', 'type', 'duration', 'exercises', 'status',
+                        'user_id', 'user_name', 'sport_goal', 'coach_id')
+
+def _admin_workouts_query(date_from=None, date_to=None, coach_id=None):
+    query = '''
         SELECT workouts.id, workouts.date, workouts.type, workouts.duration, workouts.exercises, workouts.status,
                users.id as user_id, users.name as user_name, users.sport_goal, users.coach_id
         FROM workouts
         JOIN users ON workouts.user_id = users.id
-        WHERE workouts.date >= date('now')
-    ''')
-    workouts = cursor.fetchall()
-    conn.close()
+        WHERE workouts.date >= coalesce(?, date('now'))
+    '''
+    params = [date_from]
+    if date_to:
+        query += ' AND workouts.date <= ?'
+        params.append(date_to)
+    if coach_id is not None:
+        query += ' AND users.coach_id = ?'
+        params.append(coach_id)
+    return query + ' ORDER BY workouts.date, workouts.id', params
 
-    workout_list = []
-    for workout in workouts:
-        workout_list.append({
-            'id': workout['id'],
-            'date': workout['date'],
-            'type': workout['type'],
-            'duration': workout['duration'],
-            'exercises': workout['exercises'],
-            'status': workout['status'],
-            'user_id': workout['user_id'],
-            'user_name': workout['user_name'],
-            'sport_goal': workout['sport_goal'],
-            'coach_id': workout['coach_id']
-        })
-
-    return jsonify(workout_list), 200
+@app.route('/admin/workouts', methods=['GET'])
+@role_required('admin')
+def get_all_workouts():
+    if request.args.get('coach_id') is not None and request.args.get('coach_id', type=int) is None:
+        return jsonify({'message': 'coach_id invalide'}), 400
+    query, params = _admin_workouts_query(request.args.get('from'), request.args.get('to'),
+                                          request.args.get('coach_id', type=int))
+
+    ndjson = (request.args.get('format') == 'ndjson'
+              or request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson')
+
+    def generate():
+        conn = get_db_connection()
+        try:
+            cursor = conn.execute(query, params)
+            first = True
+            if not ndjson:
+                yield '['
+            while True:
+                rows = cursor.fetchmany(ADMIN_WORKOUTS_BATCH_SIZE)
+                if not rows:
+                    break
+                lines = [app.json.dumps({field: row[field] for field in ADMIN_WORKOUT_FIELDS}) for row in rows]
+                if ndjson:
+                    yield '\n'.join(lines) + '\n'
+                else:
+                    yield ('' if first else ',') + ','.join(lines)
+                first = False
+            if not ndjson:
+                yield ']\n'
+        finally:
+            conn.close()
+
+    return app.response_class(stream_with_context(generate()),
+                              mimetype='application/x-ndjson' if ndjson else 'application/json'), 200
 
 @app.route('/admin/change-role/<int:user_id>', methods=['PUT'])
+@role_required('admin')
 def change_user_role(user_id):
     data = request.get_json()
     new_role = data.get('role')
@@ -712,10 +2846,13 @@ def change_user_role(user_id):
     cursor.execute('UPDATE users SET role = ? WHERE id = ?', (new_role, user_id))
     conn.commit()
     conn.close()
+    auth_cache.invalidate(user_id)
+    user_counts.invalidate()
 
     return jsonify({'message': 'Rôle mis à jour avec succès'}), 200
 
 @app.route('/admin/assign-coach/<int:user_id>', methods=['PUT'])
+@role_required('admin')
 def assign_coach(user_id):
     data = request.get_json()
     coach_id = data.get('coach_id')
@@ -725,11 +2862,16 @@ def assign_coach(user_id):
     cursor.execute('UPDATE users SET coach_id = ? WHERE id = ?', (coach_id, user_id))
     conn.commit()
     conn.close()
+    auth_cache.invalidate(user_id)
+    user_counts.invalidate()
 
     return jsonify({'message': 'Coach assigné avec succès'}), 200
 
 @app.route('/admin/users', methods=['GET'])
+@role_required('admin')
 def get_all_users():
+    if any(arg in request.args for arg in USER_DIRECTORY_ARGS):
+        return _user_directory_page(list(ADMIN_USER_FIELDS), [], [])
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT id, username, name, age, weight, height, sport_goal, role, coach_id FROM users')
@@ -752,7 +2894,112 @@ def get_all_users():
 
     return jsonify(user_list), 200
 
+# Hachage des mots de passe hors du thread de requête, dans un pool de processus borné
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))  # 0 : calcul en ligne
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+PASSWORD_HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', 1))
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def _hash_password_worker(password, rounds):
+    return bcrypt_backend.hashpw(password.encode('utf-8'), bcrypt_backend.gensalt(rounds)).decode('utf-8')
+
+def _check_password_worker(password_hash, password):
+    try:
+        return bcrypt_backend.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+class PasswordHasher:
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stats = {'hashes': 0, 'checks': 0, 'rehashes': 0, 'rejected': 0}
+
+    # Le pool est créé à la première connexion, quand les threads du serveur tournent déjà :
+    # forker ce processus multi-thread pourrait copier un verrou tenu. Les workers partent
+    # donc d'un processus serveur neuf (forkserver, ou spawn hors POSIX)
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context(method))
+            return self._executor
+
+    def _run(self, function, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise PasswordHasherBusy()
+            self._pending += 1
+        try:
+            if self.workers <= 0:
+                return function(*args)
+            future = self._get_executor().submit(function, *args)
+            # Avec eventlet / gevent, attendre sans bloquer la boucle d'événements
+            if socketio.async_mode in ('eventlet', 'gevent'):
+                while not future.done():
+                    socketio.sleep(0.005)
+            return future.result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    @property
+    def rounds(self):
+        return app.config['BCRYPT_LOG_ROUNDS']
+
+    def hash(self, password):
+        with self._lock:
+            self._stats['hashes'] += 1
+        return self._run(_hash_password_worker, password, self.rounds)
+
+    def check(self, password_hash, password):
+        with self._lock:
+            self._stats['checks'] += 1
+        return self._run(_check_password_worker, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    # Recalcule le hachage au coût courant ; ignoré si le pool est saturé
+    def rehash(self, password):
+        try:
+            password_hash = self.hash(password)
+        except PasswordHasherBusy:
+            return None
+        with self._lock:
+            self._stats['rehashes'] += 1
+        return password_hash
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'pending': self._pending, 'max_pending': self.max_pending,
+                          'workers': self.workers, 'rounds': self.rounds})
+        return stats
+
+
+password_hasher = PasswordHasher()
+
+@app.errorhandler(PasswordHasherBusy)
+def handle_password_hasher_busy(error):
+    response = jsonify({'message': 'Trop de requêtes, réessayez dans un instant'})
+    response.headers['Retry-After'] = str(PASSWORD_HASH_RETRY_AFTER)
+    return response, 429
+
 @app.route('/user/<int:user_id>/change-password', methods=['PUT'])
+@user_access_required()
 def change_password(user_id):
     data = request.get_json()
     old_password = data.get('old_password')
@@ -763,16 +3010,19 @@ def change_password(user_id):
 
     cursor.execute('SELECT password_hash FROM users WHERE id = ?', (user_id,))
     user = cursor.fetchone()
+    # Pas de connexion gardée pendant le hachage
+    conn.close()
 
     if not user:
-        conn.close()
         return jsonify({'message': 'Utilisateur non trouvé'}), 404
 
-    if not bcrypt.check_password_hash(user['password_hash'], old_password):
-        conn.close()
+    if not password_hasher.check(user['password_hash'], old_password):
         return jsonify({'message': 'Ancien mot de passe incorrect'}), 401
 
-    new_password_hash = bcrypt.generate_password_hash(new_password).decode('utf-8')
+    new_password_hash = password_hasher.hash(new_password)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
 
     cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_password_hash, user_id))
     conn.commit()
@@ -781,6 +3031,7 @@ def change_password(user_id):
     return jsonify({'message': 'Mot de passe mis à jour avec succès'}), 200
 
 @app.route('/user/<int:user_id>', methods=['PUT'])
+@user_access_required()
 def update_user_profile(user_id):
     data = request.get_json()
     username = data.get('username')
@@ -799,6 +3050,7 @@ def update_user_profile(user_id):
     ''', (username, name, age, weight, height, sport_goal, user_id))
     conn.commit()
     conn.close()
+    user_counts.invalidate()
 
     return jsonify({'message': 'User profile updated successfully'}), 200
 
@@ -813,7 +3065,7 @@ def register():
     height = data['height']
     sport_goal = data['sport_goal']
 
-    password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+    password_hash = password_hasher.hash(password)
 
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -821,9 +3073,12 @@ def register():
                    (username, password_hash, name, age, weight, height, sport_goal))
     conn.commit()
     conn.close()
+    user_counts.invalidate()
 
     return jsonify({'message': 'User registered successfully'}), 201
 
+LOGIN_QUERY = 'SELECT * FROM users WHERE username = ?'
+
 @app.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
@@ -832,16 +3087,30 @@ def login():
 
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
+    cursor.execute(LOGIN_QUERY, (username,))
     user = cursor.fetchone()
     conn.close()
 
-    if user and bcrypt.check_password_hash(user['password_hash'], password):
-        return jsonify({'message': 'Login successful', 'user_id': user['id']}), 200
+    if user and password_hasher.check(user['password_hash'], password):
+        # Hachage créé avec un autre coût : on le remplace pendant qu'on a le mot de passe en clair
+        if password_hasher.needs_rehash(user['password_hash']):
+            new_password_hash = password_hasher.rehash(password)
+            if new_password_hash:
+                conn = get_db_connection()
+                conn.execute('UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                             (new_password_hash, user['id'], user['password_hash']))
+                conn.commit()
+                conn.close()
+        return jsonify({
+            'message': 'Login successful',
+            'user_id': user['id'],
+            'token': issue_session_token(user['id'])
+        }), 200
     else:
         return jsonify({'message': 'Invalid credentials'}), 401
 
 @app.route('/user/<int:user_id>', methods=['GET'])
+@user_access_required(allow_coach=True)
 def get_user_profile(user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -866,10 +3135,169 @@ def get_user_profile(user_id):
     else:
         return jsonify({'message': 'User not found'}), 404
 
+# Statistiques d'entraînement
+CALORIES_PER_DURATION_UNIT = 10
+STATS_PERIOD_FORMATS = {
+    'week': '%Y-W%W',
+    'month': '%Y-%m',
+}
+
+# Ajoute (sign=1) ou retire (sign=-1) une séance des agrégats de l'utilisateur
+def apply_workout_stats(cursor, user_id, date, duration, sign=1):
+    if user_id is None:
+        return
+    duration = int(duration or 0) * sign
+    calories = duration * CALORIES_PER_DURATION_UNIT
+    cursor.execute('''
+        INSERT INTO user_stats (user_id, total_workouts, total_duration, calories_burned)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_workouts = total_workouts + excluded.total_workouts,
+            total_duration = total_duration + excluded.total_duration,
+            calories_burned = calories_burned + excluded.calories_burned
+    ''', (user_id, sign, duration, calories))
+    for granularity, period_format in STATS_PERIOD_FORMATS.items():
+        cursor.execute('''
+            INSERT INTO user_stats_periods (user_id, granularity, period, workouts, duration, calories_burned)
+            SELECT ?, ?, strftime(?, ?), ?, ?, ? WHERE strftime(?, ?) IS NOT NULL
+            ON CONFLICT (user_id, granularity, period) DO UPDATE SET
+                workouts = workouts + excluded.workouts,
+                duration = duration + excluded.duration,
+                calories_burned = calories_burned + excluded.calories_burned
+        ''', (user_id, granularity, period_format, date, sign, duration, calories, period_format, date))
+    if sign < 0:
+        cursor.execute('DELETE FROM user_stats_periods WHERE user_id = ? AND workouts <= 0', (user_id,))
+
+# Recalcule les agrégats depuis la table workouts (tous les utilisateurs ou un seul)
+def rebuild_user_stats(cursor, user_id=None):
+    where, params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('WHERE user_id IS NOT NULL', ())
+    cursor.execute(f'DELETE FROM user_stats {where}', params)
+    cursor.execute(f'DELETE FROM user_stats_periods {where}', params)
+    cursor.execute(f'''
+        INSERT INTO user_stats (user_id, total_workouts, total_duration, calories_burned)
+        SELECT user_id, count(*), coalesce(sum(duration), 0), coalesce(sum(duration), 0) * ?
+        FROM workouts {where}
+        GROUP BY user_id
+    ''', (CALORIES_PER_DURATION_UNIT,) + params)
+    for granularity, period_format in STATS_PERIOD_FORMATS.items():
+        cursor.execute(f'''
+            INSERT INTO user_stats_periods (user_id, granularity, period, workouts, duration, calories_burned)
+            SELECT user_id, ?, strftime(?, date) AS period, count(*), coalesce(sum(duration), 0),
+                   coalesce(sum(duration), 0) * ?
+            FROM workouts {where} AND strftime(?, date) IS NOT NULL
+            GROUP BY user_id, period
+        ''', (granularity, period_format, CALORIES_PER_DURATION_UNIT) + params + (period_format,))
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    init_db()
+    with db_pool.connection() as conn:
+        rebuild_user_stats(conn.cursor())
+        count = conn.execute('SELECT count(*) FROM user_stats').fetchone()[0]
+    print(f'Statistiques recalculées pour {count} utilisateurs')
+
+# Exercices structurés : "Squat 4x8 @ 60kg, Tractions 3x10" ou liste JSON
+# [{"name": ..., "sets": ..., "reps": ..., "load": ...}]
+EXERCISE_ENTRY_PATTERN = re.compile(
+    r'^(?P<name>.*?)\s*(?:(?P<sets>\d+)\s*[xX×*]\s*(?P<reps>\d+))?\s*(?:[@à]\s*)?'
+    r'(?:(?P<load>\d+(?:[.,]\d+)?)\s*kg)?\s*$'
+)
+EXERCISE_BACKFILL_BATCH = 1000
+
+def _to_number(value, cast):
+    try:
+        return cast(str(value).replace(',', '.')) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+def parse_exercises(text):
+    if not text:
+        return []
+    try:
+        entries = json.loads(text)
+    except (TypeError, ValueError):
+        entries = None
+    if isinstance(entries, list):
+        return [{
+            'name': str(entry.get('name', '')).strip(),
+            'sets': _to_number(entry.get('sets'), int),
+            'reps': _to_number(entry.get('reps'), int),
+            'load': _to_number(entry.get('load'), float)
+        } for entry in entries if isinstance(entry, dict) and str(entry.get('name', '')).strip()]
+
+    # Une virgule entre deux chiffres est décimale (« 62,5kg ») : elle ne sépare pas les exercices
+    parsed = []
+    for part in re.split(r'(?:(?<!\d),|,(?!\d)|[;\n])+', str(text)):
+        match = EXERCISE_ENTRY_PATTERN.match(part.strip())
+        if not match or not match.group('name'):
+            continue
+        parsed.append({
+            'name': match.group('name'),
+            'sets': _to_number(match.group('sets'), int),
+            'reps': _to_number(match.group('reps'), int),
+            'load': _to_number(match.group('load'), float)
+        })
+    return parsed
+
+def _exercise_rows(cursor, workout_id, user_id, exercises_text):
+    entries = parse_exercises(exercises_text)
+    if not entries:
+        return []
+    names = sorted({entry['name'] for entry in entries})
+    cursor.execute(f"SELECT id, name FROM exercices WHERE name IN ({', '.join('?' * len(names))})", names)
+    catalog = {row['name']: row['id'] for row in cursor.fetchall()}
+    return [(workout_id, user_id, catalog.get(entry['name']), entry['name'], position,
+             entry['sets'], entry['reps'], entry['load'])
+            for position, entry in enumerate(entries)]
+
+# Remplace les exercices structurés d'une séance (insertion en lot)
+def save_workout_exercises(cursor, workout_id, user_id, exercises_text):
+    cursor.execute('DELETE FROM workout_exercises WHERE workout_id = ?', (workout_id,))
+    rows = _exercise_rows(cursor, workout_id, user_id, exercises_text)
+    if rows:
+        cursor.executemany('''
+            INSERT INTO workout_exercises (workout_id, user_id, exercise_id, name, position, sets, reps, load)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+# Analyse une seule fois le texte des séances qui n'ont pas encore d'exercices structurés
+def backfill_workout_exercises(cursor):
+    last_id = 0
+    total = 0
+    while True:
+        cursor.execute('''
+            SELECT id, user_id, exercises FROM workouts
+            WHERE id > ? AND NOT EXISTS (SELECT 1 FROM workout_exercises WHERE workout_id = workouts.id)
+            ORDER BY id LIMIT ?
+        ''', (last_id, EXERCISE_BACKFILL_BATCH))
+        workouts = cursor.fetchall()
+        if not workouts:
+            return total
+        rows = []
+        for workout in workouts:
+            rows += _exercise_rows(cursor, workout['id'], workout['user_id'], workout['exercises'])
+        cursor.executemany('''
+            INSERT INTO workout_exercises (workout_id, user_id, exercise_id, name, position, sets, reps, load)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        total += len(rows)
+        last_id = workouts[-1]['id']
+
+@app.cli.command('backfill-exercises')
+def backfill_exercises_command():
+    init_db()
+    with db_pool.connection() as conn:
+        total = backfill_workout_exercises(conn.cursor())
+    print(f'{total} exercices structurés ajoutés')
+
 @app.route('/workout', methods=['POST'])
 def add_workout():
     data = request.get_json()
     user_id = data['user_id']
+    # Séance ajoutée par l'utilisateur lui-même ou par son coach
+    error = user_access_error(user_id, allow_coach=True)
+    if error:
+        return error
     date = data['date']
     workout_type = data['type']
     duration = data['duration']
@@ -879,6 +3307,8 @@ def add_workout():
     cursor = conn.cursor()
     cursor.execute('INSERT INTO workouts (user_id, date, type, duration, exercises) VALUES (?, ?, ?, ?, ?)',
                    (user_id, date, workout_type, duration, exercises))
+    save_workout_exercises(cursor, cursor.lastrowid, user_id, exercises)
+    apply_workout_stats(cursor, user_id, date, duration)
     conn.commit()
     conn.close()
 
@@ -894,8 +3324,18 @@ def update_workout(workout_id):
 
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute('SELECT user_id, date, duration FROM workouts WHERE id = ?', (workout_id,))
+    previous = cursor.fetchone()
+    error = user_access_error(previous['user_id'] if previous else None, allow_coach=True)
+    if error:
+        conn.close()
+        return error
     cursor.execute('UPDATE workouts SET date = ?, type = ?, duration = ?, exercises = ? WHERE id = ?',
                    (date, workout_type, duration, exercises, workout_id))
+    if previous:
+        save_workout_exercises(cursor, workout_id, previous['user_id'], exercises)
+        apply_workout_stats(cursor, previous['user_id'], previous['date'], previous['duration'], sign=-1)
+        apply_workout_stats(cursor, previous['user_id'], date, duration)
     conn.commit()
     conn.close()
 
@@ -905,36 +3345,28 @@ def update_workout(workout_id):
 def delete_workout(workout_id):
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute('SELECT user_id, date, duration FROM workouts WHERE id = ?', (workout_id,))
+    previous = cursor.fetchone()
+    error = user_access_error(previous['user_id'] if previous else None, allow_coach=True)
+    if error:
+        conn.close()
+        return error
     cursor.execute('DELETE FROM workouts WHERE id = ?', (workout_id,))
+    cursor.execute('DELETE FROM workout_exercises WHERE workout_id = ?', (workout_id,))
+    if previous:
+        apply_workout_stats(cursor, previous['user_id'], previous['date'], previous['duration'], sign=-1)
     conn.commit()
     conn.close()
 
     return jsonify({'message': 'Workout deleted successfully'}), 200
 
-@app.route('/workouts/<int:user_id>', methods=['GET'])
-def get_workouts(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM workouts WHERE user_id = ?', (user_id,))
-    workouts = cursor.fetchall()
-    conn.close()
-
-    workout_list = []
-    for workout in workouts:
-        workout_list.append({
-            'id': workout['id'],
-            'date': workout['date'],
-            'type': workout['type'],
-            'duration': workout['duration'],
-            'exercises': workout['exercises']
-        })
-
-    return jsonify(workout_list), 200
-
 @app.route('/goal', methods=['POST'])
 def set_goal():
     data = request.get_json()
     user_id = data['user_id']
+    error = user_access_error(user_id, allow_coach=True)
+    if error:
+        return error
     goal_type = data['goal_type']
     target_date = data['target_date']
     current_progress = data['current_progress']
@@ -948,11 +3380,14 @@ def set_goal():
 
     return jsonify({'message': 'Goal set successfully'}), 201
 
+GOAL_QUERY = 'SELECT * FROM goals WHERE user_id = ?'
+
 @app.route('/goal/<int:user_id>', methods=['GET'])
+@user_access_required(allow_coach=True)
 def get_goal(user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM goals WHERE user_id = ?', (user_id,))
+    cursor.execute(GOAL_QUERY, (user_id,))
     goal = cursor.fetchone()
     conn.close()
 
@@ -966,57 +3401,463 @@ def get_goal(user_id):
     else:
         return jsonify({'message': 'No goal set'}), 404
 
+STATS_TOTALS_QUERY = 'SELECT total_workouts, total_duration, calories_burned FROM user_stats WHERE user_id = ?'
+
+# Série temporelle : bornes converties en clés de période (même format que les agrégats)
+def _stats_series_query(user_id, granularity, date_from=None, date_to=None):
+    period_format = STATS_PERIOD_FORMATS[granularity]
+    query = 'SELECT period, workouts, duration, calories_burned FROM user_stats_periods WHERE user_id = ? AND granularity = ?'
+    params = [user_id, granularity]
+    if date_from:
+        query += ' AND period >= strftime(?, ?)'
+        params += [period_format, date_from]
+    if date_to:
+        query += ' AND period <= strftime(?, ?)'
+        params += [period_format, date_to]
+    return query + ' ORDER BY period', params
+
 @app.route('/stats/<int:user_id>', methods=['GET'])
+@user_access_required(allow_coach=True)
 def get_stats(user_id):
+    granularity = request.args.get('granularity')
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    if granularity is None and (date_from or date_to):
+        granularity = 'month'
+    if granularity is not None and granularity not in STATS_PERIOD_FORMATS:
+        return jsonify({'message': 'Granularité invalide (week ou month)'}), 400
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM workouts WHERE user_id = ?', (user_id,))
-    workouts = cursor.fetchall()
-    conn.close()
+    cursor.execute(STATS_TOTALS_QUERY, (user_id,))
+    totals = cursor.fetchone()
 
     stats = {
-        'total_workouts': len(workouts),
-        'total_duration': sum(workout['duration'] for workout in workouts),
-        'calories_burned': sum(workout['duration'] * 10 for workout in workouts)
+        'total_workouts': totals['total_workouts'] if totals else 0,
+        'total_duration': totals['total_duration'] if totals else 0,
+        'calories_burned': totals['calories_burned'] if totals else 0
     }
 
+    if granularity is not None:
+        cursor.execute(*_stats_series_query(user_id, granularity, date_from, date_to))
+        stats['granularity'] = granularity
+        stats['series'] = [{
+            'period': row['period'],
+            'workouts': row['workouts'],
+            'duration': row['duration'],
+            'calories_burned': row['calories_burned']
+        } for row in cursor.fetchall()]
+    conn.close()
+
     return jsonify(stats), 200
 
+# Route pour le volume et les records personnels par exercice
+EXERCISE_STATS_QUERY = '''
+    SELECT exercise_id, name, count(DISTINCT workout_id) AS sessions,
+           sum(sets) AS total_sets, sum(sets * reps) AS total_reps,
+           sum(sets * reps * load) AS volume, max(load) AS best_load
+    FROM workout_exercises
+    WHERE user_id = ?
+    GROUP BY exercise_id, name
+    ORDER BY sessions DESC, name
+'''
+# Date du record : la séance où la charge maximale a été atteinte
+EXERCISE_RECORDS_QUERY = '''
+    SELECT exercise_id, name, max(load) AS best_load, workouts.date
+    FROM workout_exercises
+    JOIN workouts ON workouts.id = workout_exercises.workout_id
+    WHERE workout_exercises.user_id = ? AND load IS NOT NULL
+    GROUP BY exercise_id, name
+'''
+
+@app.route('/stats/<int:user_id>/exercises', methods=['GET'])
+@user_access_required(allow_coach=True)
+def get_exercise_stats(user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(EXERCISE_STATS_QUERY, (user_id,))
+    exercises = cursor.fetchall()
+    cursor.execute(EXERCISE_RECORDS_QUERY, (user_id,))
+    record_dates = {(row['exercise_id'], row['name']): row['date'] for row in cursor.fetchall()}
+    conn.close()
+
+    exercise_list = []
+    for exercise in exercises:
+        exercise_list.append({
+            'exercise_id': exercise['exercise_id'],
+            'name': exercise['name'],
+            'sessions': exercise['sessions'],
+            'total_sets': exercise['total_sets'] or 0,
+            'total_reps': exercise['total_reps'] or 0,
+            'volume': exercise['volume'] or 0,
+            'best_load': exercise['best_load'],
+            'best_load_date': record_dates.get((exercise['exercise_id'], exercise['name']))
+        })
+
+    return jsonify(exercise_list), 200
+
+# Notifications : envoyées en direct dans la room de l'utilisateur, état lu / non lu et
+# synchronisation incrémentale (?since_id=) sur l'index (user_id, id)
+NOTIFICATIONS_PAGE_SIZE = 100
+NOTIFICATIONS_MAX_PAGE_SIZE = 500
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 30))  # notifications lues
+NOTIFICATION_MAX_AGE_DAYS = int(os.environ.get('NOTIFICATION_MAX_AGE_DAYS', 180))  # toutes
+NOTIFICATION_RETENTION_INTERVAL = float(os.environ.get('NOTIFICATION_RETENTION_INTERVAL', 3600))
+NOTIFICATION_RETENTION_BATCH = 1000
+
+def _notification_to_dict(notification):
+    return {
+        'id': notification['id'],
+        'message': notification['message'],
+        'date': notification['date'],
+        'is_read': bool(notification['is_read']),
+        'created_at': notification['created_at']
+    }
+
+def create_notification(cursor, user_id, message, date):
+    cursor.execute('''
+        INSERT INTO notifications (user_id, message, date, is_read, created_at)
+        VALUES (?, ?, ?, 0, datetime('now'))
+    ''', (user_id, message, date))
+    cursor.execute('SELECT * FROM notifications WHERE id = ?', (cursor.lastrowid,))
+    return _notification_to_dict(cursor.fetchone())
+
+# À appeler après le commit : les clients connectés n'ont plus besoin d'interroger le serveur
+def push_notification(user_id, notification):
+    socketio.emit('notification', notification, to=str(user_id))
+
 @app.route('/notification', methods=['POST'])
+@role_required('admin', 'coach')
 def add_notification():
     data = request.get_json()
     user_id = data['user_id']
     message = data['message']
     date = data['date']
+    # Comme pour la diffusion : un coach n'écrit qu'à ses propres clients
+    if not _is_json_id(user_id) or not can_access_user(user_id, allow_coach=True):
+        return jsonify({'message': 'Accès refusé'}), 403
 
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('INSERT INTO notifications (user_id, message, date) VALUES (?, ?, ?)',
-                   (user_id, message, date))
+    notification = create_notification(cursor, user_id, message, date)
     conn.commit()
     conn.close()
-
-    return jsonify({'message': 'Notification added successfully'}), 201
-
+    push_notification(user_id, notification)
+
+    return jsonify({'message': 'Notification added successfully', 'id': notification['id']}), 201
+
+UNREAD_NOTIFICATIONS_QUERY = 'SELECT count(*) FROM notifications WHERE user_id = ? AND is_read = 0'
+
+def _notifications_query(user_id, since_id=None, unread_only=False, limit=None):
+    query = 'SELECT * FROM notifications WHERE user_id = ?'
+    params = [user_id]
+    if since_id is not None:
+        query += ' AND id > ?'
+        params.append(since_id)
+    if unread_only:
+        query += ' AND is_read = 0'
+    query += ' ORDER BY id'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit + 1)
+    return query, params
+
+# Sans paramètre : toutes les notifications (ancien format, enrichi de l'id et de l'état lu) ;
+# avec since_id / limit : uniquement les nouvelles, par pages
 @app.route('/notifications/<int:user_id>', methods=['GET'])
+@user_access_required()
 def get_notifications(user_id):
+    since_id = request.args.get('since_id', type=int)
+    limit = _int_arg('limit', minimum=1, maximum=NOTIFICATIONS_MAX_PAGE_SIZE)
+    unread_only = request.args.get('unread') == '1'
+    paginate = since_id is not None or limit is not None
+    if paginate:
+        limit = limit or NOTIFICATIONS_PAGE_SIZE
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM notifications WHERE user_id = ?', (user_id,))
+    cursor.execute(*_notifications_query(user_id, since_id, unread_only, limit))
     notifications = cursor.fetchall()
+    if paginate:
+        cursor.execute(UNREAD_NOTIFICATIONS_QUERY, (user_id,))
+        unread_count = cursor.fetchone()[0]
     conn.close()
 
-    notification_list = []
-    for notification in notifications:
-        notification_list.append({
-            'message': notification['message'],
-            'date': notification['date']
-        })
+    if not paginate:
+        return jsonify([_notification_to_dict(notification) for notification in notifications]), 200
+    has_more = len(notifications) > limit
+    notifications = notifications[:limit]
+    return jsonify({
+        'notifications': [_notification_to_dict(notification) for notification in notifications],
+        'last_id': notifications[-1]['id'] if notifications else since_id,
+        'has_more': has_more,
+        'unread_count': unread_count
+    }), 200
 
-    return jsonify(notification_list), 200
+def _mark_notifications_query(user_id, ids=None, up_to_id=None):
+    query = 'UPDATE notifications SET is_read = 1 WHERE user_id = ? AND is_read = 0'
+    params = [user_id]
+    if ids:
+        query += f" AND id IN ({', '.join('?' * len(ids))})"
+        params += ids
+    elif up_to_id is not None:
+        query += ' AND id <= ?'
+        params.append(up_to_id)
+    return query, params
+
+# Marque comme lues les notifications indiquées (ids), jusqu'à un id (up_to_id) ou toutes
+@app.route('/notifications/<int:user_id>/mark-read', methods=['POST'])
+@user_access_required()
+def mark_notifications_as_read(user_id):
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    up_to_id = data.get('up_to_id')
+    if ids is not None and (not isinstance(ids, list) or len(ids) > NOTIFICATIONS_MAX_PAGE_SIZE
+                            or not all(_is_json_id(value) for value in ids)):
+        return jsonify({'message': f'ids doit être une liste d\'au plus {NOTIFICATIONS_MAX_PAGE_SIZE} entiers'}), 400
+    if up_to_id is not None and not _is_json_id(up_to_id):
+        return jsonify({'message': 'up_to_id doit être un entier'}), 400
+    # Liste vide : rien à marquer (et surtout pas toutes les notifications)
+    if ids == []:
+        return jsonify({'message': 'Notifications marquées comme lues', 'updated': 0}), 200
 
-@app.route('/exercices', methods=['GET'])
-def get_exercises():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(*_mark_notifications_query(user_id, ids, up_to_id))
+    updated = cursor.rowcount
+    conn.commit()
+    conn.close()
+
+    # Les autres appareils de l'utilisateur mettent leur badge à jour
+    if updated:
+        socketio.emit('notificationsRead', {'ids': ids, 'up_to_id': up_to_id}, to=str(user_id))
+    return jsonify({'message': 'Notifications marquées comme lues', 'updated': updated}), 200
+
+# Purge par lots des notifications lues anciennes et de toutes les notifications trop vieilles
+PURGE_NOTIFICATIONS_QUERY = '''
+    DELETE FROM notifications WHERE id IN (
+        SELECT id FROM notifications WHERE created_at < ? AND (is_read = 1 OR created_at < ?) LIMIT ?
+    )
+'''
+
+def purge_notifications():
+    read_cutoff = (datetime.datetime.utcnow() - timedelta(days=NOTIFICATION_RETENTION_DAYS)).strftime(BAN_DATE_FORMAT)
+    cutoff = (datetime.datetime.utcnow() - timedelta(days=NOTIFICATION_MAX_AGE_DAYS)).strftime(BAN_DATE_FORMAT)
+    deleted = 0
+    while True:
+        with db_pool.connection() as conn:
+            removed = conn.execute(PURGE_NOTIFICATIONS_QUERY,
+                                   (read_cutoff, cutoff, NOTIFICATION_RETENTION_BATCH)).rowcount
+        deleted += removed
+        if removed < NOTIFICATION_RETENTION_BATCH:
+            return deleted
+        socketio.sleep(0)
+
+def _notification_retention_loop():
+    while True:
+        try:
+            purge_notifications()
+        except Exception as e:
+            print('Erreur purge notifications:', e)
+        socketio.sleep(NOTIFICATION_RETENTION_INTERVAL)
+
+# Diffusion d'une notification à un public (clients d'un coach, un rôle, tous les utilisateurs) :
+# insertion par lots avec executemany, une transaction par lot, puis envoi dans les rooms.
+# La requête rend la main tout de suite avec un identifiant de tâche à interroger
+BROADCAST_CHUNK_SIZE = int(os.environ.get('BROADCAST_CHUNK_SIZE', 500))
+BROADCAST_JOBS_KEPT = 200
+BROADCAST_AUDIENCES = {
+    'coach_id': 'SELECT id FROM users WHERE coach_id = ? ORDER BY id',
+    'role': 'SELECT id FROM users WHERE role = ? ORDER BY id',
+    'all': 'SELECT id FROM users ORDER BY id',
+}
+
+
+class NotificationBroadcaster:
+    def __init__(self, chunk_size=BROADCAST_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, audience, value, message, date, sender_id=None):
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'audience': audience,
+            'value': value,
+            'sender_id': sender_id,
+            'total': None,
+            'inserted': 0,
+            'pushed': 0,
+            'created_at': datetime.datetime.utcnow().strftime(BAN_DATE_FORMAT),
+            'finished_at': None,
+            'error': None
+        }
+        with self._lock:
+            self._jobs[job['id']] = job
+            while len(self._jobs) > BROADCAST_JOBS_KEPT:
+                self._jobs.popitem(last=False)
+        socketio.start_background_task(self._run, job, message, date)
+        return dict(job)
+
+    def _update(self, job, **changes):
+        with self._lock:
+            job.update(changes)
+
+    def _run(self, job, message, date):
+        try:
+            params = () if job['audience'] == 'all' else (job['value'],)
+            with db_pool.connection() as conn:
+                user_ids = [row['id'] for row in conn.execute(BROADCAST_AUDIENCES[job['audience']], params)]
+            self._update(job, status='running', total=len(user_ids))
+
+            for start in range(0, len(user_ids), self.chunk_size):
+                chunk = user_ids[start:start + self.chunk_size]
+                created_at = datetime.datetime.utcnow().strftime(BAN_DATE_FORMAT)
+                with db_pool.connection() as conn:
+                    conn.executemany('''
+                        INSERT INTO notifications (user_id, message, date, is_read, created_at)
+                        VALUES (?, ?, ?, 0, ?)
+                    ''', [(user_id, message, date, created_at) for user_id in chunk])
+                    # Le verrou d'écriture est tenu jusqu'au commit : les ids du lot se suivent
+                    last_id = conn.execute('SELECT max(id) FROM notifications').fetchone()[0]
+                self._update(job, inserted=job['inserted'] + len(chunk))
+
+                first_id = last_id - len(chunk) + 1
+                for offset, user_id in enumerate(chunk):
+                    push_notification(user_id, {'id': first_id + offset, 'message': message, 'date': date,
+                                                'is_read': False, 'created_at': created_at})
+                self._update(job, pushed=job['pushed'] + len(chunk))
+                socketio.sleep(0)
+
+            self._update(job, status='done', finished_at=datetime.datetime.utcnow().strftime(BAN_DATE_FORMAT))
+        except Exception as e:
+            print('Erreur diffusion notification:', e)
+            self._update(job, status='failed', error=str(e),
+                         finished_at=datetime.datetime.utcnow().strftime(BAN_DATE_FORMAT))
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def stats(self):
+        with self._lock:
+            statuses = [job['status'] for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ('queued', 'running', 'done', 'failed')}
+
+
+notification_broadcaster = NotificationBroadcaster()
+
+@app.route('/notifications/broadcast', methods=['POST'])
+@role_required('admin', 'coach')
+def broadcast_notification():
+    data = request.get_json()
+    message = data.get('message')
+    if not message:
+        return jsonify({'message': 'Le message est requis'}), 400
+    targets = [audience for audience in BROADCAST_AUDIENCES if data.get(audience) not in (None, False)]
+    if len(targets) != 1:
+        return jsonify({'message': 'Indiquer une seule cible : coach_id, role ou all'}), 400
+    audience = targets[0]
+    value = None if audience == 'all' else data[audience]
+
+    # Un coach ne peut écrire qu'à ses propres clients (role_required garantit un appelant authentifié)
+    user = g.user
+    if user['role'] == 'coach' and (audience != 'coach_id' or value != user['id']):
+        return jsonify({'message': 'Accès refusé'}), 403
+
+    date = data.get('date') or datetime.datetime.now().strftime('%Y-%m-%d')
+    job = notification_broadcaster.start(audience, value, message, date, user['id'])
+    response = jsonify(job)
+    response.headers['Location'] = f"/notifications/broadcast/{job['id']}"
+    return response, 202
+
+@app.route('/notifications/broadcast/<job_id>', methods=['GET'])
+@role_required('admin', 'coach')
+def get_broadcast_job(job_id):
+    job = notification_broadcaster.get(job_id)
+    if not job:
+        return jsonify({'message': 'Tâche inconnue'}), 404
+    return jsonify(job), 200
+
+# Cache des catalogues en lecture quasi exclusive (exercices, abonnements, recettes) : JSON
+# déjà sérialisé et compressé, avec ETag. Chaque écriture invalide son catalogue ; la durée de
+# vie borne le retard des autres processus quand le serveur tourne avec plusieurs workers
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', 60))
+CATALOG_GZIP_MIN_SIZE = 1024
+
+
+class CatalogCache:
+    def __init__(self, ttl=CATALOG_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'invalidations': 0}
+
+    def version(self, name):
+        with self._lock:
+            return self._versions.get(name, 0)
+
+    def invalidate(self, *names):
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+                self._entries.pop(name, None)
+                self._stats['invalidations'] += 1
+
+    # Entrée du catalogue : (expiration, corps JSON, corps gzip ou None, ETag)
+    def get(self, name, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry and entry[0] > now:
+                self._stats['hits'] += 1
+                return entry
+            self._stats['misses'] += 1
+            version = self._versions.get(name, 0)
+        body = app.json.dumps(loader()).encode('utf-8')
+        compressed = gzip.compress(body, 6) if len(body) >= CATALOG_GZIP_MIN_SIZE else None
+        entry = (now + self.ttl, body, compressed, hashlib.sha256(body).hexdigest()[:32])
+        with self._lock:
+            # Une écriture pendant le chargement rend ce résultat périmé : on ne le garde pas
+            if self._versions.get(name, 0) == version:
+                self._entries[name] = entry
+        return entry
+
+    def response(self, name, loader):
+        _, body, compressed, etag = self.get(name, loader)
+        use_gzip = compressed is not None and request.accept_encodings['gzip'] > 0
+        if use_gzip:
+            body, etag = compressed, f'{etag}-gzip'
+        if etag in request.if_none_match:
+            with self._lock:
+                self._stats['not_modified'] += 1
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(body, mimetype='application/json')
+            if use_gzip:
+                response.content_encoding = 'gzip'
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.no_cache = True
+        return response
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['catalogs'] = {
+                name: {'version': self._versions.get(name, 0), 'bytes': len(entry[1]),
+                       'gzip_bytes': len(entry[2]) if entry[2] else None}
+                for name, entry in self._entries.items()
+            }
+        return stats
+
+
+catalog_cache = CatalogCache()
+
+def _load_exercises():
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM exercices')
@@ -1032,11 +3873,13 @@ def get_exercises():
             'category': exercise['category'],
             'image': exercise['image']
         })
+    return exercise_list
 
-    return jsonify(exercise_list), 200
+@app.route('/exercices', methods=['GET'])
+def get_exercises():
+    return catalog_cache.response('exercices', _load_exercises)
 
-@app.route('/subscriptions', methods=['GET'])
-def get_subscriptions():
+def _load_subscriptions():
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM subscriptions')
@@ -1052,10 +3895,16 @@ def get_subscriptions():
             'color': subscription['color'],
             'features': subscription['features'].split(',')
         })
+    return subscription_list
+
+@app.route('/subscriptions', methods=['GET'])
+def get_subscriptions():
+    return catalog_cache.response('subscriptions', _load_subscriptions)
 
-    return jsonify(subscription_list), 200
+SUBSCRIPTION_BY_NAME_QUERY = 'SELECT id FROM subscriptions WHERE name = ?'
 
 @app.route('/user/<int:user_id>/subscription', methods=['POST'])
+@user_access_required()
 def update_user_subscription(user_id):
     data = request.get_json()
     subscription_name = data.get('subscription_name')
@@ -1069,7 +3918,7 @@ def update_user_subscription(user_id):
         if not user:
             return jsonify({'message': 'Utilisateur non trouvé'}), 404
 
-        cursor.execute('SELECT id FROM subscriptions WHERE name = ?', (subscription_name,))
+        cursor.execute(SUBSCRIPTION_BY_NAME_QUERY, (subscription_name,))
         subscription = cursor.fetchone()
         if not subscription:
             return jsonify({'message': 'Abonnement non trouvé'}), 404
@@ -1089,6 +3938,7 @@ def update_user_subscription(user_id):
         conn.close()
 
 @app.route('/nutrition', methods=['POST'])
+@role_required('admin')
 def add_nutrition():
     data = request.get_json()
     name = data['name']
@@ -1106,33 +3956,336 @@ def add_nutrition():
     ''', (name, ingredients, preparation_time, calories, category, goal_category))
     conn.commit()
     conn.close()
+    catalog_cache.invalidate('nutrition', 'nutrition_by_goal')
 
     return jsonify({'message': 'Nutrition entry added successfully'}), 201
 
-@app.route('/nutrition', methods=['GET'])
-def get_nutrition():
+def _nutrition_to_dict(entry):
+    return {
+        'id': entry['id'],
+        'name': entry['name'],
+        'ingredients': entry['ingredients'],
+        'preparation_time': entry['preparation_time'],
+        'calories': entry['calories'],
+        'category': entry['category'],
+        'goal_category': entry['goal_category'],
+        'image': entry['image'],
+        'preparation': entry['preparation'],
+    }
+
+def _load_nutrition():
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM nutrition')
     nutrition_entries = cursor.fetchall()
     conn.close()
+    return [_nutrition_to_dict(entry) for entry in nutrition_entries]
+
+# Filtres sur les recettes : intervalles sur calories / temps de préparation, listes de catégories,
+# tri et pagination par clé (colonne de tri, id) ; index composites créés par la migration 12
+NUTRITION_FILTER_ARGS = ('min_calories', 'max_calories', 'min_preparation_time', 'max_preparation_time',
+                         'category', 'goal_category', 'sort', 'limit', 'cursor')
+NUTRITION_SORTS = ('id', 'calories', 'preparation_time')
+NUTRITION_PAGE_SIZE = 50
+NUTRITION_MAX_PAGE_SIZE = 200
+
+def _nutrition_query(ranges, lists, keys, descending, position, limit):
+    query = 'SELECT * FROM nutrition WHERE 1 = 1'
+    params = []
+    for column, (minimum, maximum) in ranges.items():
+        if minimum is not None:
+            query += f' AND {column} >= ?'
+            params.append(minimum)
+        if maximum is not None:
+            query += f' AND {column} <= ?'
+            params.append(maximum)
+    for column, values in lists.items():
+        if values:
+            query += f" AND {column} IN ({', '.join('?' * len(values))})"
+            params += values
+    if position:
+        query += f" AND ({', '.join(keys)}) {'<' if descending else '>'} ({', '.join('?' * len(keys))})"
+        params += position
+    direction = 'DESC' if descending else 'ASC'
+    query += f" ORDER BY {', '.join(f'{key} {direction}' for key in keys)} LIMIT ?"
+    params.append(limit + 1)
+    return query, params
 
-    nutrition_list = []
-    for entry in nutrition_entries:
-        nutrition_list.append({
-            'id': entry['id'],
-            'name': entry['name'],
-            'ingredients': entry['ingredients'],
-            'preparation_time': entry['preparation_time'],
-            'calories': entry['calories'],
-            'category': entry['category'],
-            'goal_category': entry['goal_category'],
-            'image': entry['image'],
-            'preparation': entry['preparation'],
+@app.route('/nutrition', methods=['GET'])
+def get_nutrition():
+    # Sans filtre : catalogue complet servi depuis le cache
+    if not any(arg in request.args for arg in NUTRITION_FILTER_ARGS):
+        return catalog_cache.response('nutrition', _load_nutrition)
+
+    sort = request.args.get('sort', 'id')
+    descending = sort.startswith('-')
+    sort_column = sort.lstrip('-')
+    if sort_column not in NUTRITION_SORTS:
+        return jsonify({'message': f"Tri inconnu: {sort}"}), 400
+
+    ranges = {column: (request.args.get(f'min_{column}', type=int), request.args.get(f'max_{column}', type=int))
+              for column in ('calories', 'preparation_time')}
+    lists = {column: _list_arg(column) for column in ('category', 'goal_category')}
+
+    cursor_token = request.args.get('cursor')
+    limit = _int_arg('limit', NUTRITION_PAGE_SIZE, minimum=1, maximum=NUTRITION_MAX_PAGE_SIZE)
+    keys = ['id'] if sort_column == 'id' else [sort_column, 'id']
+    position = None
+    if cursor_token:
+        position = _decode_cursor(cursor_token)
+        if not isinstance(position, list) or len(position) != len(keys):
+            return jsonify({'message': 'Curseur invalide'}), 400
 
-        })
+    conn = get_db_connection()
+    entries = conn.execute(*_nutrition_query(ranges, lists, keys, descending, position, limit)).fetchall()
+    conn.close()
+
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    last = entries[-1] if entries else None
+    return jsonify({
+        'nutrition': [_nutrition_to_dict(entry) for entry in entries],
+        'next_cursor': _encode_cursor(*(last[key] for key in keys)) if has_more else None,
+        'has_more': has_more
+    }), 200
+
+# Recettes regroupées par objectif, triées par calories, pour l'écran « recettes pour mon objectif »
+NUTRITION_BY_GOAL_QUERY = 'SELECT * FROM nutrition ORDER BY goal_category, calories, id'
+GOAL_NUTRITION_QUERY = 'SELECT * FROM nutrition WHERE goal_category = ? ORDER BY calories, id'
+
+def _load_nutrition_by_goal():
+    conn = get_db_connection()
+    entries = conn.execute(NUTRITION_BY_GOAL_QUERY).fetchall()
+    conn.close()
 
-    return jsonify(nutrition_list), 200
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry['goal_category'], []).append(_nutrition_to_dict(entry))
+    return groups
+
+@app.route('/nutrition/by-goal', methods=['GET'])
+def get_nutrition_by_goal():
+    return catalog_cache.response('nutrition_by_goal', _load_nutrition_by_goal)
+
+# Objectif saisi librement ('prise de masse', 'Déficit calorique ') : comparaison sans casse ni accents
+def _goal_key(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    return ' '.join(''.join(char for char in text if not unicodedata.combining(char)).casefold().split())
+
+@app.route('/user/<int:user_id>/nutrition', methods=['GET'])
+@user_access_required(allow_coach=True)
+def get_user_goal_nutrition(user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT sport_goal FROM users WHERE id = ?', (user_id,))
+    user = cursor.fetchone()
+    if not user:
+        conn.close()
+        return jsonify({'message': 'Utilisateur non trouvé'}), 404
+
+    cursor.execute('SELECT DISTINCT goal_category FROM nutrition')
+    goals = {_goal_key(row['goal_category']): row['goal_category'] for row in cursor.fetchall()}
+    goal_category = goals.get(_goal_key(user['sport_goal']))
+    entries = []
+    if goal_category is not None:
+        cursor.execute(GOAL_NUTRITION_QUERY, (goal_category,))
+        entries = cursor.fetchall()
+    conn.close()
+
+    return jsonify({
+        'sport_goal': user['sport_goal'],
+        'goal_category': goal_category,
+        'nutrition': [_nutrition_to_dict(entry) for entry in entries]
+    }), 200
+
+# Plan de repas journalier : besoin calorique (Mifflin-St Jeor, sexe inconnu : moyenne des deux
+# constantes) ajusté par l'activité récente et l'objectif, puis un plat par créneau choisi par
+# programmation dynamique sur des tranches de calories
+MEAL_PLAN_SLOTS = [
+    ('Petit déjeuner', ('Petit déjeuner',), 0.25),
+    ('Déjeuner', ('Déjeuner', 'Dîner', 'Diner'), 0.35),
+    ('Collation', ('Collation',), 0.10),
+    ('Dîner', ('Dîner', 'Diner'), 0.30),
+]
+MEAL_PLAN_BUCKET = 10  # repris dans l'expression de idx_nutrition_meal_plan (migration 19)
+MEAL_PLAN_SLOT_TOLERANCE = 0.5
+MEAL_PLAN_SLOT_WEIGHT = 1.0
+MEAL_PLAN_TOTAL_WEIGHT = 10.0
+MEAL_PLAN_CACHE_SIZE = int(os.environ.get('MEAL_PLAN_CACHE_SIZE', 1024))
+MEAL_PLAN_BULK_WORDS = ('masse', 'muscle', 'prendre')
+MEAL_PLAN_CUT_WORDS = ('deficit', 'seche', 'perte', 'perdre', 'maigrir', 'mincir')
+
+_meal_plan_cache = OrderedDict()
+_meal_plan_cache_lock = threading.Lock()
+
+# Sens de l'objectif : +1 prise de masse, -1 déficit, 0 maintien ; un poids cible ('80 kg') compte aussi
+def _goal_direction(sport_goal, weight):
+    key = _goal_key(sport_goal)
+    if any(word in key for word in MEAL_PLAN_BULK_WORDS):
+        return 1
+    if any(word in key for word in MEAL_PLAN_CUT_WORDS):
+        return -1
+    target = re.match(r'^(\d+(?:[.,]\d+)?)\s*(?:kg|kilos?)?$', key)
+    if target and weight:
+        target_weight = float(target.group(1).replace(',', '.'))
+        if target_weight > weight + 1:
+            return 1
+        if target_weight < weight - 1:
+            return -1
+    return 0
+
+def daily_calorie_target(weight, height, age, weekly_workouts, direction):
+    bmr = 10 * weight + 6.25 * height - 5 * age - 78
+    activity = 1.2 + 0.1 * min(weekly_workouts, 5)
+    adjustment = {1: 1.15, -1: 0.8}.get(direction, 1.0)
+    return round(bmr * activity * adjustment)
+
+# Un seul plat par tranche de calories et par créneau (le mieux noté) : une centaine de candidats
+# au lieu de toute la table. Calculé par catégorie par SQLite, qui parcourt l'index
+# idx_nutrition_meal_plan tranche par tranche, et gardé pour la version courante du catalogue,
+# commun à tous les utilisateurs de même objectif ; les créneaux à plusieurs catégories fusionnent
+_meal_plan_candidates_cache = {}
+_meal_plan_candidates_lock = threading.Lock()
+
+def _meal_plan_candidates_query(category, goal_categories):
+    goals = list(goal_categories) or ['']
+    query = f'''
+        SELECT n.id, n.name, n.calories, n.preparation_time, n.category, n.goal_category, n.image
+        FROM (
+            SELECT id AS best_id, max((goal_category IN ({', '.join('?' * len(goals))})) * 1000 - preparation_time)
+            FROM nutrition WHERE category = ? GROUP BY calories / {MEAL_PLAN_BUCKET}
+        ) CROSS JOIN nutrition n ON n.id = best_id
+    '''
+    return query, (*goals, category)
+
+def _meal_plan_category_candidates(cursor, category, goal_categories):
+    key = (catalog_cache.version('nutrition'), category, tuple(goal_categories))
+    now = time.monotonic()
+    with _meal_plan_candidates_lock:
+        cached = _meal_plan_candidates_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+    rows = cursor.execute(*_meal_plan_candidates_query(category, goal_categories)).fetchall()
+    candidates = [dict(row, goal_match=row['goal_category'] in goal_categories) for row in rows]
+    with _meal_plan_candidates_lock:
+        # Les entrées des versions précédentes du catalogue ne servent plus
+        for stale in [entry for entry in _meal_plan_candidates_cache if entry[0] != key[0]]:
+            del _meal_plan_candidates_cache[stale]
+        _meal_plan_candidates_cache[key] = (now + CATALOG_CACHE_TTL, candidates)
+    return candidates
+
+def _meal_plan_candidates(cursor, categories, goal_categories):
+    best = {}
+    for category in categories:
+        for candidate in _meal_plan_category_candidates(cursor, category, goal_categories):
+            bucket = candidate['calories'] // MEAL_PLAN_BUCKET
+            score = candidate['goal_match'] * 1000 - candidate['preparation_time']
+            if bucket not in best or best[bucket][0] < score:
+                best[bucket] = (score, candidate)
+    return sorted((candidate for _, candidate in best.values()), key=lambda candidate: candidate['calories'])
+
+# Programmation dynamique : état = total de calories (en tranches) -> meilleur score et plats choisis.
+# Le gain de chaque plat est calculé une fois par créneau ; le contrôle des doublons ne concerne
+# que les plats proposés dans plusieurs créneaux (déjeuner et dîner)
+def solve_meal_plan(slots, target):
+    states = {0: (0.0, (), ())}
+    seen = set()
+    for slot_target, candidates in slots:
+        options = [(candidate['calories'] // MEAL_PLAN_BUCKET,
+                    candidate['goal_match'] - candidate['preparation_time'] / 600
+                    - MEAL_PLAN_SLOT_WEIGHT * abs(candidate['calories'] - slot_target) / slot_target,
+                    candidate, candidate['id'], candidate['id'] in seen)
+                   for candidate in candidates]
+        seen.update(candidate['id'] for candidate in candidates)
+        next_states = {}
+        for total, (score, picks, ids) in states.items():
+            for bucket, gain, candidate, candidate_id, shared in options:
+                if shared and candidate_id in ids:
+                    continue
+                new_total = total + bucket
+                new_score = score + gain
+                current = next_states.get(new_total)
+                if current is None or current[0] < new_score:
+                    next_states[new_total] = (new_score, picks + (candidate,), ids + (candidate_id,))
+        # Créneau impossible à remplir sans doublon : laissé vide
+        states = next_states or {total: (score, picks + (None,), ids) for total, (score, picks, ids) in states.items()}
+    best = max(states.values(), key=lambda state: state[0] - MEAL_PLAN_TOTAL_WEIGHT * abs(
+        sum(pick['calories'] for pick in state[1] if pick) - target) / target)
+    return best[1]
+
+@app.route('/user/<int:user_id>/meal-plan', methods=['GET'])
+@user_access_required(allow_coach=True)
+def get_meal_plan(user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT weight, height, age, sport_goal FROM users WHERE id = ?', (user_id,))
+    user = cursor.fetchone()
+    if not user:
+        conn.close()
+        return jsonify({'message': 'Utilisateur non trouvé'}), 404
+
+    direction = _goal_direction(user['sport_goal'], user['weight'])
+    target = request.args.get('calories', type=int)
+    if target is None:
+        if not (30 <= (user['weight'] or 0) <= 300 and 120 <= (user['height'] or 0) <= 230
+                and 10 <= (user['age'] or 0) <= 100):
+            conn.close()
+            return jsonify({'message': 'Profil incomplet : poids, taille et âge requis (ou paramètre calories)'}), 400
+        since = (datetime.date.today() - timedelta(days=28)).strftime(STATS_PERIOD_FORMATS['week'])
+        cursor.execute('''
+            SELECT coalesce(sum(workouts), 0) FROM user_stats_periods
+            WHERE user_id = ? AND granularity = 'week' AND period >= ?
+        ''', (user_id, since))
+        weekly_workouts = cursor.fetchone()[0] / 4
+        target = daily_calorie_target(user['weight'], user['height'], user['age'], weekly_workouts, direction)
+    target = min(max(target, 1000), 6000)
+
+    key = (catalog_cache.version('nutrition'), target, direction)
+    now = time.monotonic()
+    with _meal_plan_cache_lock:
+        cached = _meal_plan_cache.get(user_id)
+        if cached and cached[0] == key and cached[1] > now:
+            _meal_plan_cache.move_to_end(user_id)
+            conn.close()
+            return jsonify(cached[2]), 200
+
+    cursor.execute('SELECT DISTINCT goal_category FROM nutrition')
+    words = MEAL_PLAN_BULK_WORDS if direction > 0 else MEAL_PLAN_CUT_WORDS if direction < 0 else ()
+    goal_categories = [row['goal_category'] for row in cursor.fetchall()
+                       if any(word in _goal_key(row['goal_category']) for word in words)]
+
+    slots = []
+    for name, categories, share in MEAL_PLAN_SLOTS:
+        slot_target = target * share
+        low, high = slot_target * (1 - MEAL_PLAN_SLOT_TOLERANCE), slot_target * (1 + MEAL_PLAN_SLOT_TOLERANCE)
+        candidates = [candidate for candidate in _meal_plan_candidates(cursor, categories, goal_categories)
+                      if low <= candidate['calories'] <= high]
+        if candidates:
+            slots.append((name, slot_target, candidates))
+    conn.close()
+
+    picks = solve_meal_plan([(slot_target, candidates) for _, slot_target, candidates in slots], target)
+    meals = []
+    for (name, slot_target, _), pick in zip(slots, picks):
+        if pick is None:
+            continue
+        recipe = {field: pick[field] for field in ('id', 'name', 'calories', 'preparation_time', 'category',
+                                                   'goal_category', 'image')}
+        meals.append({'slot': name, 'target_calories': round(slot_target), 'recipe': recipe})
+
+    plan = {
+        'user_id': user_id,
+        'target_calories': target,
+        'total_calories': sum(meal['recipe']['calories'] for meal in meals),
+        'goal_categories': goal_categories,
+        'meals': meals
+    }
+    with _meal_plan_cache_lock:
+        _meal_plan_cache[user_id] = (key, now + CATALOG_CACHE_TTL, plan)
+        _meal_plan_cache.move_to_end(user_id)
+        while len(_meal_plan_cache) > MEAL_PLAN_CACHE_SIZE:
+            _meal_plan_cache.popitem(last=False)
+    return jsonify(plan), 200
 
 @app.route('/nutrition/<int:nutrition_id>', methods=['GET'])
 def get_nutrition_entry(nutrition_id):
@@ -1160,6 +4313,7 @@ def get_nutrition_entry(nutrition_id):
         return jsonify({'message': 'Nutrition entry not found'}), 404
 
 @app.route('/nutrition/<int:nutrition_id>', methods=['PUT'])
+@role_required('admin')
 def update_nutrition(nutrition_id):
     data = request.get_json()
     name = data['name']
@@ -1179,24 +4333,144 @@ def update_nutrition(nutrition_id):
     ''', (name, ingredients, preparation_time, calories, category, goal_category, nutrition_id))
     conn.commit()
     conn.close()
+    catalog_cache.invalidate('nutrition', 'nutrition_by_goal')
 
     return jsonify({'message': 'Nutrition entry updated successfully'}), 200
 
 @app.route('/nutrition/<int:nutrition_id>', methods=['DELETE'])
+@role_required('admin')
 def delete_nutrition(nutrition_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('DELETE FROM nutrition WHERE id = ?', (nutrition_id,))
     conn.commit()
     conn.close()
+    catalog_cache.invalidate('nutrition', 'nutrition_by_goal')
 
     return jsonify({'message': 'Nutrition entry deleted successfully'}), 200
+
+# Recherche plein texte (FTS5) sur les recettes et les exercices : préfixes, classement BM25,
+# surlignage des termes trouvés
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_MAX_OFFSET = 1000
+SEARCH_MAX_TERMS = 8
+SEARCH_TYPES = ('nutrition', 'exercices')
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', 256))
+# BM25 coûte quelques microsecondes par ligne trouvée et toutes les lignes trouvées sont classées.
+# SEARCH_MAX_CANDIDATES > 0 limite le classement aux N correspondances les plus récentes (repérées par
+# rowid décroissant, sans calcul de score) : plus rapide sur les termes courants, mais une ancienne
+# recette au nom exact peut disparaître des résultats. Désactivé par défaut
+SEARCH_MAX_CANDIDATES = int(os.environ.get('SEARCH_MAX_CANDIDATES', 0))
+
+# Les termes courants (saisie au fil de l'eau) correspondent à une grande partie des lignes et
+# BM25 doit toutes les noter : les pages récentes sont gardées, liées à la version des catalogues
+_search_cache = OrderedDict()
+_search_cache_lock = threading.Lock()
+
+# FTS5 encadre les termes trouvés de caractères de contrôle : le texte saisi par les utilisateurs
+# est échappé avant qu'ils deviennent des balises <b>
+def highlight_html(text):
+    if text is None:
+        return None
+    return html.escape(text).replace('\x02', '<b>').replace('\x03', '</b>')
+
+# Chaque mot devient un préfixe entre guillemets : pas d'opérateurs FTS5 venant du client
+def fts_query(text):
+    terms = re.findall(r'\w+', text or '')[:SEARCH_MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+SEARCH_QUERIES = {
+    'nutrition': '''
+        SELECT n.id, n.name, n.calories, n.preparation_time, n.category, n.goal_category, n.image,
+               highlight(nutrition_fts, 0, char(2), char(3)) AS highlight,
+               snippet(nutrition_fts, 1, char(2), char(3), '…', 12) AS excerpt,
+               bm25(nutrition_fts, 10.0, 2.0, 1.0, 1.0) AS rank
+        FROM nutrition_fts JOIN nutrition n ON n.id = nutrition_fts.rowid
+        WHERE nutrition_fts MATCH ?1
+    ''',
+    'exercices': '''
+        SELECT e.id, e.name, e.category, e.image,
+               highlight(exercices_fts, 0, char(2), char(3)) AS highlight,
+               snippet(exercices_fts, 1, char(2), char(3), '…', 12) AS excerpt,
+               bm25(exercices_fts, 10.0, 2.0, 1.0) AS rank
+        FROM exercices_fts JOIN exercices e ON e.id = exercices_fts.rowid
+        WHERE exercices_fts MATCH ?1
+    ''',
+}
+
+# Meilleurs résultats d'une table ; candidates > 0 borne le classement aux correspondances récentes
+def _search_query(search_type, match, limit, candidates=0):
+    query, params = SEARCH_QUERIES[search_type], [match]
+    if candidates:
+        table = f'{search_type}_fts'
+        query += f'''
+        AND {table}.rowid >= coalesce((
+            SELECT rowid FROM {table} WHERE {table} MATCH ?1 ORDER BY rowid DESC LIMIT 1 OFFSET ?2
+        ), 0)'''
+        params.append(candidates)
+    query += f' ORDER BY rank LIMIT ?{len(params) + 1}'
+    params.append(limit)
+    return query, params
+
+@app.route('/search', methods=['GET'])
+def search():
+    match = fts_query(request.args.get('q'))
+    if not match:
+        return jsonify({'message': 'Le paramètre q est requis'}), 400
+    types = _list_arg('type') or list(SEARCH_TYPES)
+    unknown = [search_type for search_type in types if search_type not in SEARCH_TYPES]
+    if unknown:
+        return jsonify({'message': f"Types inconnus: {', '.join(unknown)}"}), 400
+    limit = _int_arg('limit', SEARCH_PAGE_SIZE, minimum=1, maximum=SEARCH_MAX_PAGE_SIZE)
+    offset = _int_arg('offset', 0, minimum=0, maximum=SEARCH_MAX_OFFSET)
+
+    key = (match, tuple(types), limit, offset, tuple(catalog_cache.version(search_type) for search_type in types))
+    now = time.monotonic()
+    with _search_cache_lock:
+        cached = _search_cache.get(key)
+        if cached and cached[0] > now:
+            _search_cache.move_to_end(key)
+            return jsonify(cached[1]), 200
+
+    # Chaque table fournit ses meilleurs résultats, fusionnés ensuite par score
+    conn = get_db_connection()
+    results = []
+    candidates = max(SEARCH_MAX_CANDIDATES, offset + limit + 1) if SEARCH_MAX_CANDIDATES else 0
+    for search_type in types:
+        for row in conn.execute(*_search_query(search_type, match, offset + limit + 1, candidates)):
+            result = dict(row)
+            result['type'] = search_type
+            result['highlight'] = highlight_html(result['highlight'])
+            result['excerpt'] = highlight_html(result['excerpt'])
+            results.append(result)
+    conn.close()
+    results.sort(key=lambda result: result['rank'])
+
+    response = {
+        'results': results[offset:offset + limit],
+        'offset': offset,
+        'limit': limit,
+        'has_more': len(results) > offset + limit
+    }
+    with _search_cache_lock:
+        _search_cache[key] = (now + CATALOG_CACHE_TTL, response)
+        while len(_search_cache) > SEARCH_CACHE_SIZE:
+            _search_cache.popitem(last=False)
+    return jsonify(response), 200
+
 # Routes pour les actualités
 @app.route('/actualites', methods=['POST'])
 def creer_actualite():
     data = request.get_json()
     description = data.get('description')
     auteur_id = data.get('auteur_id')
+    # L'auteur est l'utilisateur du jeton par défaut ; un autre auteur exige l'accès à son compte
+    if auteur_id is None and g.get('user') is not None:
+        auteur_id = g.user['id']
+    error = user_access_error(auteur_id)
+    if error:
+        return error
     
     if not description:
         return jsonify({'message': 'La description est requise'}), 400
@@ -1215,8 +4489,146 @@ def creer_actualite():
         'id': actualite_id
     }), 201
 
+# Requêtes des routes dont le plan doit passer par un index (commande check-indexes)
+# Requêtes exécutées par les routes : les mêmes constantes et constructeurs que les routes,
+# avec des paramètres représentatifs pour les requêtes construites dynamiquement
+ROUTE_QUERIES = [
+    ('check_ban', USER_AUTH_QUERY, (1,)),
+    ('ban_scheduler', PENDING_BANS_QUERY, ()),
+    ('get_banned_users', BANNED_USERS_QUERY, ()),
+    ('get_user_workouts', *_workouts_query(1, WORKOUT_FIELDS)),
+    ('get_user_workouts_page', *_workouts_query(1, ('id', 'date', 'type'), '2025-01-01', None,
+                                                {'type': ['Course']}, ['2025-06-01', 100], 50)),
+    ('get_user_workouts_page_no_filter', *_workouts_query(1, WORKOUT_FIELDS, position=['2025-06-01', 100], limit=50)),
+    ('get_user_workouts_page_undated', *_workouts_query(1, WORKOUT_FIELDS, position=[None, 100], limit=50)),
+    ('admin_users_prefix', *_user_directory_query(
+        ['id'], ["(username LIKE ? ESCAPE '\\' OR name LIKE ? ESCAPE '\\')"], ['ab%', 'ab%'], ['id'], False, None, 50)),
+    ('admin_users_by_username', *_user_directory_query(
+        ['id'], ['role IN (?)'], ['user'], USER_DIRECTORY_SORTS['username'] + ['id'], False, ['m', 0], 50)),
+    ('admin_users_by_name', *_user_directory_query(
+        ['id'], [], [], USER_DIRECTORY_SORTS['name'] + ['id'], True, None, 50)),
+    ('admin_users_by_name_page', *_user_directory_query(
+        ['id'], [], [], USER_DIRECTORY_SORTS['name'] + ['id'], False, ['', 10], 50)),
+    ('admin_banned_users', *_user_directory_query(['id'], ["status = 'ban'"], [], ['id'], False, [10], 50)),
+    ('get_coach_clients', COACH_CLIENTS_QUERY, (1,)),
+    ('get_all_workouts', *_admin_workouts_query(None, '2030-01-01')),
+    ('get_all_workouts_coach', *_admin_workouts_query('2025-01-01', None, 2)),
+    ('get_coach_dashboard', COACH_DASHBOARD_QUERY, {'coach_id': 2}),
+    ('get_admin_user', ADMIN_USER_QUERY, ()),
+    ('get_coaches', COACHES_QUERY, ()),
+    ('mark_messages_as_read', MARK_MESSAGES_READ_QUERY, (1, 2)),
+    ('get_messages', CONVERSATION_QUERY + ' ORDER BY id ASC', (1, 2)),
+    ('get_messages_after', CONVERSATION_QUERY + ' AND id > ? ORDER BY id ASC LIMIT ?', (1, 2, 100, 51)),
+    ('get_messages_page', CONVERSATION_QUERY + ' AND id < ? ORDER BY id DESC LIMIT ?', (1, 2, 100, 51)),
+    ('get_conversations', INBOX_QUERY, (1, 1, 1)),
+    ('login', LOGIN_QUERY, ('admin',)),
+    ('get_exercise_stats', EXERCISE_STATS_QUERY, (1,)),
+    ('get_exercise_records', EXERCISE_RECORDS_QUERY, (1,)),
+    ('get_goal', GOAL_QUERY, (1,)),
+    ('get_stats', STATS_TOTALS_QUERY, (1,)),
+    ('get_stats_series', *_stats_series_query(1, 'month', '2025-01-01', '2025-12-31')),
+    ('broadcast_coach_clients', BROADCAST_AUDIENCES['coach_id'], (1,)),
+    ('broadcast_role', BROADCAST_AUDIENCES['role'], ('user',)),
+    ('get_notifications', *_notifications_query(1)),
+    ('get_notifications_since', *_notifications_query(1, 10, True, 100)),
+    ('unread_notifications', UNREAD_NOTIFICATIONS_QUERY, (1,)),
+    ('mark_notifications_as_read', *_mark_notifications_query(1, up_to_id=10)),
+    ('mark_notifications_ids', *_mark_notifications_query(1, ids=[3, 4])),
+    ('purge_notifications', PURGE_NOTIFICATIONS_QUERY, ('2025-01-01 00:00:00', '2024-06-01 00:00:00', 1000)),
+    ('update_user_subscription', SUBSCRIPTION_BY_NAME_QUERY, ('Premium',)),
+    ('get_nutrition_filtered', *_nutrition_query({'calories': (None, 500)}, {'goal_category': ['Sèche', 'Déficit calorique']},
+                                                 ['calories', 'id'], False, [0, 0], 50)),
+    ('get_nutrition_by_goal', NUTRITION_BY_GOAL_QUERY, ()),
+    ('get_user_goal_nutrition', GOAL_NUTRITION_QUERY, ('Sèche',)),
+    ('get_meal_plan', *_meal_plan_candidates_query('Dîner', ('Sèche',))),
+    ('create_upload_session', CREATE_UPLOAD_SESSION_QUERY, ('a', 'f', 1, None, 1, 't', 1, 3)),
+    ('upload_session_progress', UPLOAD_SESSION_PROGRESS_QUERY, (10, 'a', 0)),
+    ('purge_upload_sessions', EXPIRED_UPLOAD_SESSIONS_QUERY, ('2025-01-01 00:00:00', 100)),
+    ('get_media', MEDIA_QUERY, ('0' * 64,)),
+    ('get_media_variants', MEDIA_VARIANTS_QUERY, ('0' * 64,)),
+    ('search_nutrition', *_search_query('nutrition', 'squat*', 21)),
+    ('search_nutrition_bounded', *_search_query('nutrition', 'squat*', 21, 1000)),
+    ('search_exercices', *_search_query('exercices', 'squat*', 21)),
+]
+
+# Vérifie avec EXPLAIN QUERY PLAN qu'aucune requête de route ne parcourt une table entière
+# (les tables FTS5 sont lues par leur propre index : « VIRTUAL TABLE INDEX » ; « SCAN (subquery-N) »
+# relit le résultat déjà borné d'une sous-requête ; « SCAN CONSTANT ROW » est la ligne unique d'un SELECT sans FROM)
+def check_query_plans(conn):
+    problems = []
+    for name, query, params in ROUTE_QUERIES:
+        plan = conn.execute('EXPLAIN QUERY PLAN ' + query, params).fetchall()
+        details = [row['detail'] for row in plan]
+        for detail in details:
+            if (detail.startswith('SCAN') and 'USING' not in detail and 'VIRTUAL TABLE INDEX' not in detail
+                    and not detail.startswith('SCAN (subquery-') and detail != 'SCAN CONSTANT ROW'):
+                problems.append((name, detail))
+    return problems
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    init_db()
+    with db_pool.connection() as conn:
+        problems = check_query_plans(conn)
+    for name, detail in problems:
+        print(f'{name}: {detail}')
+    if problems:
+        raise SystemExit(1)
+    print(f'{len(ROUTE_QUERIES)} requêtes vérifiées, toutes indexées')
+
+
+# Broker ZeroMQ minimal pour les déploiements locaux multi-workers sans Redis
+# (SOCKETIO_MESSAGE_QUEUE=zmq+tcp://localhost:5555+5556, nécessite pyzmq et eventlet)
+def run_zmq_broker(pull_port=5555, pub_port=5556):
+    import zmq
+    context = zmq.Context()
+    receiver = context.socket(zmq.PULL)
+    receiver.bind(f'tcp://*:{pull_port}')
+    publisher = context.socket(zmq.PUB)
+    publisher.bind(f'tcp://*:{pub_port}')
+    print(f'Broker Socket.IO : PULL {pull_port} -> PUB {pub_port}')
+    while True:
+        publisher.send(receiver.recv())
+
+def run_worker(host, port, debug=False):
+    print(f'Worker {os.getpid()} sur {host}:{port}')
+    socketio.run(app, host=host, port=port, debug=debug, use_reloader=False, allow_unsafe_werkzeug=True)
+
+# Lance N workers sur des ports consécutifs. Le répartiteur de charge placé devant
+# doit garder chaque client sur le même worker (sessions collantes, ex. ip_hash
+# avec nginx) ; la file de messages relaie les emit() entre les workers
+def run_workers(host, port, workers):
+    if not SOCKETIO_MESSAGE_QUEUE:
+        raise SystemExit('SOCKETIO_MESSAGE_QUEUE doit être défini pour lancer plusieurs workers')
+    # init_db() laisse une connexion SQLite au repos dans le pool : un processus forké ne doit
+    # jamais réutiliser celle du parent, chaque worker ouvre les siennes
+    db_pool.close_all()
+    processes = []
+    for index in range(workers):
+        process = multiprocessing.Process(target=run_worker, args=(host, port + index))
+        process.start()
+        processes.append(process)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
 
 
 if __name__ == '__main__':
-    init_db()
-    app.run(debug=True, host="0.0.0.0")
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--zmq-broker', action='store_true')
+    args = parser.parse_args()
+
+    if args.zmq_broker:
+        run_zmq_broker()
+    else:
+        init_db()
+        if args.workers > 1:
+            run_workers(args.host, args.port, args.workers)
+        else:
+            socketio.run(app, debug=True, host=args.host, port=args.port, allow_unsafe_werkzeug=True)
\ No newline at end of file
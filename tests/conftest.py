@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+# Base et dossier d'upload jetables : server.py les lit à l'import
+WORKDIR = tempfile.mkdtemp(prefix='fitness-tests-')
+os.environ.setdefault('FITNESS_DB', os.path.join(WORKDIR, 'fitness.db'))
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(WORKDIR)
+
+import server  # noqa: E402
+
+server.init_db()
+
+
+@pytest.fixture
+def app():
+    return server.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# Connexion hors du pool : la fin de chaque requête du client de test libère la connexion du thread
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(server.DATABASE)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def make_user(db):
+    created = []
+
+    def make(role='user', coach_id=None, name=None, status='active'):
+        cursor = db.execute('''
+            INSERT INTO users (username, password_hash, name, role, coach_id, status)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (f'user-{len(created)}-{os.urandom(4).hex()}', 'x', name, role, coach_id, status))
+        db.commit()
+        created.append(cursor.lastrowid)
+        return cursor.lastrowid
+
+    yield make
+    server.user_counts.invalidate()
+
+
+def auth_headers(user_id):
+    return {'Authorization': f'Bearer {server.issue_session_token(user_id)}'}
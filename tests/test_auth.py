@@ -0,0 +1,144 @@
+import os
+
+import server
+from conftest import auth_headers
+
+
+def test_role_required_rejects_anonymous_callers(client, make_user):
+    user_id, admin_id = make_user(), make_user(role='admin')
+    assert client.get('/admin/users').status_code == 401
+    assert client.get('/admin/users', headers=auth_headers(user_id)).status_code == 403
+    assert client.get('/admin/users', headers=auth_headers(admin_id)).status_code == 200
+
+
+def test_role_required_ignores_legacy_flag(client, monkeypatch):
+    monkeypatch.setattr(server, 'LEGACY_CLIENT_IDS', True)
+    assert client.get('/admin/users').status_code == 401
+
+
+def test_user_routes_check_url_user_id(client, make_user):
+    coach_id, other_coach_id, admin_id = make_user(role='coach'), make_user(role='coach'), make_user(role='admin')
+    user_id, other_id = make_user(coach_id=coach_id), make_user()
+    url = f'/workouts/{user_id}'
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers=auth_headers(user_id)).status_code == 200
+    assert client.get(url, headers=auth_headers(other_id)).status_code == 403
+    assert client.get(url, headers=auth_headers(coach_id)).status_code == 200
+    assert client.get(url, headers=auth_headers(other_coach_id)).status_code == 403
+    assert client.get(url, headers=auth_headers(admin_id)).status_code == 200
+
+
+def test_private_routes_exclude_the_coach(client, make_user):
+    coach_id = make_user(role='coach')
+    user_id = make_user(coach_id=coach_id)
+    assert client.get(f'/conversations/{user_id}', headers=auth_headers(coach_id)).status_code == 403
+    assert client.put(f'/user/{user_id}/change-password', headers=auth_headers(coach_id),
+                      json={'old_password': 'x', 'new_password': 'y'}).status_code == 403
+
+
+def test_conversation_readable_by_its_participants(client, make_user):
+    alice, bob, eve = make_user(), make_user(), make_user()
+    url = f'/messages/{alice}/{bob}'
+    assert client.get(url, headers=auth_headers(alice)).status_code == 200
+    assert client.get(url, headers=auth_headers(bob)).status_code == 200
+    assert client.get(url, headers=auth_headers(eve)).status_code == 403
+
+
+def test_coach_dashboard_is_limited_to_its_coach(client, make_user):
+    coach_id, other_coach_id = make_user(role='coach'), make_user(role='coach')
+    url = f'/coach/{coach_id}/dashboard'
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers=auth_headers(coach_id)).status_code == 200
+    assert client.get(url, headers=auth_headers(other_coach_id)).status_code == 403
+
+
+def test_legacy_clients_flag(client, make_user, monkeypatch):
+    user_id = make_user()
+    monkeypatch.setattr(server, 'LEGACY_CLIENT_IDS', True)
+    assert client.get(f'/workouts/{user_id}').status_code == 200
+    assert client.get(f'/workouts/{user_id}', headers=auth_headers(make_user())).status_code == 403
+
+
+def test_user_directory_pages_through_missing_names(client, make_user, db):
+    admin_id = make_user(role='admin')
+    prefix = f'dir{os.urandom(3).hex()}'
+    names = [None, 'bruno', None, 'Alice', '', 'carla', None, 'alice', 'Zoé', None, 'bruno']
+    ids = [db.execute("INSERT INTO users (username, password_hash, name) VALUES (?, 'x', ?)",
+                      (f'{prefix}-{index}', name)).lastrowid for index, name in enumerate(names)]
+    db.commit()
+    server.user_counts.invalidate()
+    for sort in ('name', '-name'):
+        seen, cursor = [], None
+        while True:
+            url = f'/admin/users?q={prefix}&sort={sort}&limit=1' + (f'&cursor={cursor}' if cursor else '')
+            page = client.get(url, headers=auth_headers(admin_id)).get_json()
+            seen += [user['id'] for user in page['users']]
+            cursor = page['next_cursor']
+            if not page['has_more']:
+                break
+        assert sorted(seen) == sorted(ids)
+        ordered = [(names[ids.index(user_id)] or '').lower() for user_id in seen]
+        assert ordered == sorted(ordered, reverse=sort.startswith('-'))
+
+
+def test_coach_dashboard_reserved_to_its_coach(client, make_user, monkeypatch):
+    monkeypatch.setattr(server, 'LEGACY_CLIENT_IDS', True)
+    coach_id, other_coach_id, admin_id = make_user(role='coach'), make_user(role='coach'), make_user(role='admin')
+    client_id = make_user(coach_id=coach_id)
+    url = f'/coach/{coach_id}/dashboard'
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers=auth_headers(client_id)).status_code == 403
+    assert client.get(url, headers=auth_headers(other_coach_id)).status_code == 403
+    response = client.get(url, headers=auth_headers(coach_id))
+    assert response.status_code == 200
+    assert [entry['id'] for entry in response.get_json()['clients']] == [client_id]
+    assert client.get(url, headers=auth_headers(admin_id)).status_code == 200
+
+
+def test_write_routes_check_the_body_user_id(client, make_user):
+    coach_id = make_user(role='coach')
+    user_id, other_id = make_user(coach_id=coach_id), make_user()
+    workout = {'user_id': user_id, 'date': '2025-06-01', 'type': 'Course', 'duration': 1800, 'exercises': ''}
+    goal = {'user_id': user_id, 'goal_type': 'Distance', 'target_date': '2025-12-01', 'current_progress': 0}
+    for url, body in (('/workout', workout), ('/goal', goal),
+                      ('/messages/mark-read', {'user_id': user_id, 'sender_id': coach_id}),
+                      ('/actualites', {'description': 'Nouveau record', 'auteur_id': user_id})):
+        assert client.post(url, json=body).status_code == 401, url
+        assert client.post(url, headers=auth_headers(other_id), json=body).status_code == 403, url
+        assert client.post(url, headers=auth_headers(user_id), json=body).status_code in (200, 201), url
+    assert client.post('/workout', headers=auth_headers(coach_id), json=workout).status_code == 201
+    news = {'description': 'Info', 'auteur_id': user_id}
+    assert client.post('/actualites', headers=auth_headers(coach_id), json=news).status_code == 403
+
+
+def test_write_routes_check_the_stored_owner(client, db, make_user):
+    user_id, other_id, admin_id = make_user(), make_user(), make_user(role='admin')
+    workout_id = db.execute('''
+        INSERT INTO workouts (user_id, date, type, duration, exercises) VALUES (?, '2025-06-01', 'Course', 600, '')
+    ''', (user_id,)).lastrowid
+    message_id = db.execute("INSERT INTO messages (sender_id, receiver_id, message) VALUES (?, ?, 'Salut')",
+                            (user_id, other_id)).lastrowid
+    db.commit()
+    workout = {'date': '2025-06-02', 'type': 'Course', 'duration': 900, 'exercises': ''}
+    requests = [(client.put, f'/workout/{workout_id}', workout), (client.delete, f'/workout/{workout_id}', None),
+                (client.put, f'/messages/{message_id}', {'message': 'Modifié'}),
+                (client.delete, f'/messages/{message_id}', None)]
+    for method, url, body in requests:
+        assert method(url, json=body).status_code == 401, url
+        # Le destinataire d'un message n'en est pas l'auteur
+        assert method(url, headers=auth_headers(other_id), json=body).status_code == 403, url
+    assert db.execute('SELECT duration FROM workouts WHERE id = ?', (workout_id,)).fetchone()[0] == 600
+    assert db.execute('SELECT message FROM messages WHERE id = ?', (message_id,)).fetchone()[0] == 'Salut'
+    for method, url, body in requests:
+        owner_id = user_id if url.startswith('/workout') else admin_id
+        assert method(url, headers=auth_headers(owner_id), json=body).status_code == 200, url
+
+
+def test_recipe_catalog_writes_are_reserved_to_admins(client, make_user):
+    user_id, admin_id = make_user(), make_user(role='admin')
+    recipe = {'name': 'Bowl test', 'ingredients': 'riz', 'preparation_time': 10, 'calories': 400,
+              'category': 'Déjeuner', 'goal_category': 'Maintien'}
+    for method, url in ((client.post, '/nutrition'), (client.put, '/nutrition/1'), (client.delete, '/nutrition/1')):
+        assert method(url, json=recipe).status_code == 401, url
+        assert method(url, headers=auth_headers(user_id), json=recipe).status_code == 403, url
+    assert client.post('/nutrition', headers=auth_headers(admin_id), json=recipe).status_code == 201
@@ -0,0 +1,40 @@
+import pytest
+
+import server
+from conftest import auth_headers
+
+
+@pytest.mark.parametrize('duration', ['abc', 'nan', 'inf', -5, 0, [1]])
+def test_ban_rejects_invalid_duration(client, make_user, duration):
+    admin_id, user_id = make_user(role='admin'), make_user()
+    response = client.put(f'/admin/ban-user/{user_id}', headers=auth_headers(admin_id),
+                          json={'reason': 'spam', 'duration_minutes': duration})
+    assert response.status_code == 400
+
+
+def test_ban_with_duration_is_temporary(client, make_user):
+    admin_id, user_id = make_user(role='admin'), make_user()
+    response = client.put(f'/admin/ban-user/{user_id}', headers=auth_headers(admin_id),
+                          json={'reason': 'spam', 'duration_minutes': '30'})
+    assert response.status_code == 200
+    assert response.get_json()['permanent'] is False
+
+
+def test_ban_loop_retries_load(monkeypatch):
+    calls = []
+
+    def load():
+        calls.append('load')
+        if len(calls) == 1:
+            raise server.sqlite3.OperationalError('database is locked')
+
+    def sleep(seconds):
+        if len(calls) >= 3:
+            raise SystemExit
+
+    monkeypatch.setattr(server.ban_scheduler, 'load', load)
+    monkeypatch.setattr(server.ban_scheduler, 'lift_expired', lambda: calls.append('lift'))
+    monkeypatch.setattr(server.socketio, 'sleep', sleep)
+    with pytest.raises(SystemExit):
+        server._ban_loop()
+    assert calls == ['load', 'load', 'lift']
@@ -0,0 +1,71 @@
+import gzip
+import json
+
+import pytest
+
+import server
+from conftest import auth_headers
+
+
+@pytest.fixture(autouse=True)
+def fresh_catalog():
+    server.catalog_cache.invalidate('nutrition', 'nutrition_by_goal')
+
+
+def test_if_none_match_returns_304(client):
+    response = client.get('/nutrition')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    not_modified = server.catalog_cache.stats()['not_modified']
+    response = client.get('/nutrition', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert server.catalog_cache.stats()['not_modified'] == not_modified + 1
+    assert client.get('/nutrition', headers={'If-None-Match': '"autre"'}).status_code == 200
+
+
+def test_gzip_is_negotiated(client, monkeypatch):
+    monkeypatch.setattr(server, 'CATALOG_GZIP_MIN_SIZE', 0)
+    plain = client.get('/nutrition')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    compressed = client.get('/nutrition', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    # Représentations différentes : un ETag chacune
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+    assert client.get('/nutrition', headers={'Accept-Encoding': 'gzip',
+                                             'If-None-Match': plain.headers['ETag']}).status_code == 200
+    assert client.get('/nutrition', headers={'Accept-Encoding': 'gzip',
+                                             'If-None-Match': compressed.headers['ETag']}).status_code == 304
+
+
+def test_nutrition_writes_invalidate_the_catalog(client, make_user):
+    headers = auth_headers(make_user(role='admin'))
+    etag = client.get('/nutrition').headers['ETag']
+    recipe = {'name': 'Bowl du cache', 'ingredients': 'riz', 'preparation_time': 10, 'calories': 400,
+              'category': 'Déjeuner', 'goal_category': 'Maintien'}
+    assert client.post('/nutrition', headers=headers, json=recipe).status_code == 201
+
+    response = client.get('/nutrition', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    entry = next(entry for entry in json.loads(response.data) if entry['name'] == 'Bowl du cache')
+    by_goal = client.get('/nutrition/by-goal').get_json()
+    assert entry['id'] in [item['id'] for item in by_goal['Maintien']]
+
+    etag = response.headers['ETag']
+    assert client.put(f"/nutrition/{entry['id']}", headers=headers,
+                      json={**recipe, 'name': 'Bowl modifié'}).status_code == 200
+    response = client.get('/nutrition', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Bowl modifié' in [item['name'] for item in json.loads(response.data)]
+
+    etag = response.headers['ETag']
+    assert client.delete(f"/nutrition/{entry['id']}", headers=headers).status_code == 200
+    response = client.get('/nutrition', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert entry['id'] not in [item['id'] for item in json.loads(response.data)]
@@ -0,0 +1,35 @@
+import server
+
+
+def test_decimal_comma_load():
+    assert server.parse_exercises('Squat 4x8 @ 62,5kg') == [
+        {'name': 'Squat', 'sets': 4, 'reps': 8, 'load': 62.5}]
+
+
+def test_entries_separated_by_commas_and_semicolons():
+    assert server.parse_exercises('Squat 4x8 @ 62,5kg, Tractions 3x10; Développé couché 5x5 à 70.5 kg\nGainage') == [
+        {'name': 'Squat', 'sets': 4, 'reps': 8, 'load': 62.5},
+        {'name': 'Tractions', 'sets': 3, 'reps': 10, 'load': None},
+        {'name': 'Développé couché', 'sets': 5, 'reps': 5, 'load': 70.5},
+        {'name': 'Gainage', 'sets': None, 'reps': None, 'load': None},
+    ]
+
+
+def test_json_entries():
+    assert server.parse_exercises('[{"name": "Squat", "sets": "4", "reps": 8, "load": "62,5"}, {"name": ""}]') == [
+        {'name': 'Squat', 'sets': 4, 'reps': 8, 'load': 62.5}]
+
+
+def test_migration_reparses_decimal_loads(db, make_user):
+    user_id = make_user()
+    workout_id = db.execute('INSERT INTO workouts (user_id, date, type, duration, exercises) VALUES (?, ?, ?, ?, ?)',
+                            (user_id, '2025-01-01', 'Musculation', 60, 'Squat 4x8 @ 62,5kg')).lastrowid
+    # Lignes produites par l'ancien découpage sur toutes les virgules
+    db.execute("INSERT INTO workout_exercises (workout_id, user_id, name, position, sets, reps) VALUES (?, ?, 'Squat', 0, 4, 8)",
+               (workout_id, user_id))
+    db.execute("INSERT INTO workout_exercises (workout_id, user_id, name, position) VALUES (?, ?, '5kg', 1)",
+               (workout_id, user_id))
+    server._migration_reparse_decimal_loads(db.cursor())
+    rows = db.execute('SELECT name, sets, reps, load FROM workout_exercises WHERE workout_id = ?', (workout_id,)).fetchall()
+    db.commit()
+    assert [tuple(row) for row in rows] == [('Squat', 4, 8, 62.5)]
@@ -0,0 +1,25 @@
+import server
+from conftest import auth_headers
+
+
+def test_meal_plan_merges_slot_categories(client, make_user, db):
+    db.executemany('''
+        INSERT INTO nutrition (name, ingredients, preparation_time, calories, category, goal_category)
+        VALUES (?, 'x', ?, ?, ?, ?)
+    ''', [('Porridge', 10, 500, 'Petit déjeuner', 'Sèche'),
+          ('Bowl lent', 60, 700, 'Déjeuner', 'Maintien'),
+          ('Bowl sèche', 30, 705, 'Dîner', 'Sèche'),
+          ('Pomme', 2, 200, 'Collation', 'Maintien'),
+          ('Soupe', 15, 600, 'Dîner', 'Sèche')])
+    db.commit()
+    server.catalog_cache.invalidate('nutrition')
+    user_id = make_user()
+    db.execute("UPDATE users SET sport_goal = 'Sèche' WHERE id = ?", (user_id,))
+    db.commit()
+
+    candidates = server._meal_plan_candidates(db.cursor(), ('Déjeuner', 'Dîner', 'Diner'), ['Sèche'])
+    assert [candidate['name'] for candidate in candidates if candidate['calories'] // 10 == 70] == ['Bowl sèche']
+
+    response = client.get(f'/user/{user_id}/meal-plan?calories=2000', headers=auth_headers(user_id))
+    assert response.status_code == 200
+    assert {meal['slot'] for meal in response.get_json()['meals']} == {'Petit déjeuner', 'Déjeuner', 'Collation', 'Dîner'}
@@ -0,0 +1,21 @@
+import os
+
+import server
+
+
+def test_legacy_route_serves_only_flat_files(client):
+    os.makedirs(server.UPLOAD_TMP_FOLDER, exist_ok=True)
+    with open(os.path.join(server.UPLOAD_FOLDER, 'photo.jpg'), 'wb') as target:
+        target.write(b'jpeg')
+    with open(os.path.join(server.UPLOAD_TMP_FOLDER, 'session-secret'), 'wb') as target:
+        target.write(b'partial')
+    sha256 = server.hashlib.sha256(b'blob').hexdigest()
+    os.makedirs(os.path.dirname(server.blob_path(sha256)), exist_ok=True)
+    with open(server.blob_path(sha256), 'wb') as target:
+        target.write(b'blob')
+
+    assert client.get('/uploads/photo.jpg').data == b'jpeg'
+    assert client.get('/uploads/tmp/session-secret').status_code == 404
+    assert client.get('/uploads/tmp%2Fsession-secret').status_code == 404
+    assert client.get(f'/uploads/objects/{sha256[:2]}/{sha256[2:4]}/{sha256}').status_code == 404
+    assert client.get('/uploads/tmp').status_code == 404
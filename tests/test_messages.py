@@ -0,0 +1,76 @@
+import server
+from conftest import auth_headers
+
+
+def send(client, sender_id, receiver_id, text):
+    response = client.post('/messages', headers=auth_headers(sender_id),
+                           json={'sender_id': sender_id, 'receiver_id': receiver_id, 'message': text})
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def conversation(db, a, b):
+    row = db.execute('''
+        SELECT last_message_id, last_sender_id, last_message, unread_low, unread_high
+        FROM conversations WHERE user_low = ? AND user_high = ?
+    ''', (min(a, b), max(a, b))).fetchone()
+    return tuple(row) if row else None
+
+
+# Compteurs recalculés depuis les messages, comme la reconstruction de la migration 4
+def rebuilt_conversation(db, a, b):
+    db.execute('SAVEPOINT rebuild')
+    try:
+        server._migration_conversations(db.cursor())
+        return conversation(db, a, b)
+    finally:
+        db.execute('ROLLBACK TO rebuild')
+        db.execute('RELEASE rebuild')
+
+
+def test_conversation_counters_follow_send_read_and_delete(client, db, make_user):
+    alice, bob = make_user(), make_user()
+    unread = lambda: dict(zip((min(alice, bob), max(alice, bob)), conversation(db, alice, bob)[3:]))
+
+    first = send(client, alice, bob, 'Salut')
+    second = send(client, alice, bob, 'Séance demain ?')
+    last = send(client, bob, alice, 'Oui, 18h')
+    assert unread() == {alice: 1, bob: 2}
+    assert conversation(db, alice, bob)[:3] == (last, bob, 'Oui, 18h')
+    assert conversation(db, alice, bob) == rebuilt_conversation(db, alice, bob)
+
+    response = client.post('/messages/mark-read', headers=auth_headers(bob), json={'user_id': bob, 'sender_id': alice})
+    assert response.status_code == 200
+    assert unread() == {alice: 1, bob: 0}
+    assert conversation(db, alice, bob) == rebuilt_conversation(db, alice, bob)
+
+    # Dernier message non lu supprimé : compteur décrémenté et aperçu remonté au précédent
+    assert client.delete(f'/messages/{last}', headers=auth_headers(bob)).status_code == 200
+    assert unread() == {alice: 0, bob: 0}
+    assert conversation(db, alice, bob)[:3] == (second, alice, 'Séance demain ?')
+    assert conversation(db, alice, bob) == rebuilt_conversation(db, alice, bob)
+
+    client.delete(f'/messages/{first}', headers=auth_headers(alice))
+    client.delete(f'/messages/{second}', headers=auth_headers(alice))
+    assert conversation(db, alice, bob) is None
+
+
+def test_mark_read_rejects_invalid_ids(client, make_user):
+    user_id = make_user()
+    for body in ({}, {'user_id': user_id}, {'user_id': str(user_id), 'sender_id': 1},
+                 {'user_id': user_id, 'sender_id': [1]}, {'user_id': True, 'sender_id': user_id}):
+        response = client.post('/messages/mark-read', headers=auth_headers(user_id), json=body)
+        assert response.status_code == 400, body
+
+
+def test_http_sender_comes_from_the_token(client, db, make_user, monkeypatch):
+    alice, bob = make_user(), make_user()
+    body = {'receiver_id': alice, 'message': 'Salut'}
+    assert client.post('/messages', json={**body, 'sender_id': bob}).status_code == 401
+    assert client.post('/messages', headers=auth_headers(alice), json={**body, 'sender_id': bob}).status_code == 403
+
+    message_id = client.post('/messages', headers=auth_headers(bob), json=body).get_json()['id']
+    assert db.execute('SELECT sender_id FROM messages WHERE id = ?', (message_id,)).fetchone()[0] == bob
+
+    monkeypatch.setattr(server, 'LEGACY_CLIENT_IDS', True)
+    assert client.post('/messages', json={**body, 'sender_id': bob}).status_code == 201
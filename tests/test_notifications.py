@@ -0,0 +1,76 @@
+import server
+from conftest import auth_headers
+
+
+def test_broadcast_requires_an_admin_or_coach(client, make_user, monkeypatch):
+    monkeypatch.setattr(server, 'LEGACY_CLIENT_IDS', True)
+    user_id = make_user()
+    body = {'message': 'Salle fermée demain', 'all': True}
+    assert client.post('/notifications/broadcast', json=body).status_code == 401
+    assert client.post('/notifications/broadcast', json=dict(body, sender_id=user_id)).status_code == 401
+    assert client.post('/notifications/broadcast', headers=auth_headers(user_id), json=body).status_code == 403
+    assert client.get('/notifications/broadcast/unknown').status_code == 401
+
+
+def test_coach_broadcasts_only_to_own_clients(client, make_user):
+    coach_id, other_coach_id = make_user(role='coach'), make_user(role='coach')
+    make_user(coach_id=coach_id)
+    headers = auth_headers(coach_id)
+    assert client.post('/notifications/broadcast', headers=headers,
+                       json={'message': 'Bravo', 'all': True}).status_code == 403
+    assert client.post('/notifications/broadcast', headers=headers,
+                       json={'message': 'Bravo', 'coach_id': other_coach_id}).status_code == 403
+    response = client.post('/notifications/broadcast', headers=headers, json={'message': 'Bravo', 'coach_id': coach_id})
+    assert response.status_code == 202
+    assert client.get(response.headers['Location'], headers=headers).status_code == 200
+
+
+def notify(client, headers, user_id, message):
+    return client.post('/notification', headers=headers,
+                       json={'user_id': user_id, 'message': message, 'date': '2025-06-01'})
+
+
+def test_add_notification_requires_an_admin_or_the_coach(client, make_user):
+    coach_id, other_coach_id, admin_id = make_user(role='coach'), make_user(role='coach'), make_user(role='admin')
+    user_id = make_user(coach_id=coach_id)
+    assert notify(client, {}, user_id, 'Rappel').status_code == 401
+    assert notify(client, auth_headers(user_id), user_id, 'Rappel').status_code == 403
+    assert notify(client, auth_headers(other_coach_id), user_id, 'Rappel').status_code == 403
+    assert notify(client, auth_headers(coach_id), str(user_id), 'Rappel').status_code == 403
+    assert notify(client, auth_headers(coach_id), user_id, 'Rappel').status_code == 201
+    assert notify(client, auth_headers(admin_id), user_id, 'Rappel').status_code == 201
+
+
+def test_mark_read_and_since_id_delta(client, make_user):
+    admin_headers = auth_headers(make_user(role='admin'))
+    user_id = make_user()
+    headers = auth_headers(user_id)
+    ids = [notify(client, admin_headers, user_id, f'Notification {index}').get_json()['id'] for index in range(4)]
+    url = f'/notifications/{user_id}'
+
+    page = client.get(f'{url}?since_id={ids[1]}', headers=headers).get_json()
+    assert [notification['id'] for notification in page['notifications']] == ids[2:]
+    assert page['last_id'] == ids[3] and page['unread_count'] == 4
+    # Rien de nouveau depuis le dernier id reçu
+    page = client.get(f"{url}?since_id={page['last_id']}", headers=headers).get_json()
+    assert page['notifications'] == [] and page['last_id'] == ids[3]
+
+    response = client.post(f'{url}/mark-read', headers=headers, json={'ids': [ids[3]]})
+    assert response.get_json()['updated'] == 1
+    response = client.post(f'{url}/mark-read', headers=headers, json={'up_to_id': ids[1]})
+    assert response.get_json()['updated'] == 2
+    assert client.post(f'{url}/mark-read', headers=headers, json={'ids': []}).get_json()['updated'] == 0
+    page = client.get(f'{url}?since_id=0&unread=1', headers=headers).get_json()
+    assert [notification['id'] for notification in page['notifications']] == [ids[2]]
+    assert page['unread_count'] == 1
+
+    assert client.post(f'{url}/mark-read', headers=headers, json={}).get_json()['updated'] == 1
+    assert client.get(f'{url}?since_id=0', headers=headers).get_json()['unread_count'] == 0
+
+
+def test_mark_read_rejects_invalid_ids(client, make_user):
+    user_id = make_user()
+    url = f'/notifications/{user_id}/mark-read'
+    for body in ({'ids': 'all'}, {'ids': [1, '2']}, {'ids': [True]}, {'ids': list(range(1000))},
+                 {'up_to_id': '5'}, {'up_to_id': 1.5}):
+        assert client.post(url, headers=auth_headers(user_id), json=body).status_code == 400, body
@@ -0,0 +1,27 @@
+import server
+
+
+def test_hash_and_check_in_worker_processes():
+    hasher = server.PasswordHasher(workers=1)
+    password_hash = hasher.hash('secret')
+    assert hasher.check(password_hash, 'secret')
+    assert not hasher.check(password_hash, 'wrong')
+    assert hasher._executor._mp_context.get_start_method() in ('forkserver', 'spawn')
+
+
+def test_busy_hasher_returns_429(client, monkeypatch):
+    monkeypatch.setattr(server.password_hasher, 'max_pending', 0)
+    response = client.post('/register', json={'username': 'busy', 'password': 'secret', 'name': 'Busy',
+                                              'age': 30, 'weight': 70, 'height': 175, 'sport_goal': ''})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == str(server.PASSWORD_HASH_RETRY_AFTER)
+
+
+def test_login_rehashes_when_cost_changes(client, db, monkeypatch):
+    response = client.post('/register', json={'username': 'rehash', 'password': 'secret', 'name': 'Rehash',
+                                              'age': 30, 'weight': 70, 'height': 175, 'sport_goal': ''})
+    assert response.status_code == 201
+    monkeypatch.setitem(server.app.config, 'BCRYPT_LOG_ROUNDS', 5)
+    assert client.post('/login', json={'username': 'rehash', 'password': 'secret'}).status_code == 200
+    password_hash = db.execute("SELECT password_hash FROM users WHERE username = 'rehash'").fetchone()[0]
+    assert password_hash.split('$')[2] == '05'
@@ -0,0 +1,84 @@
+import contextvars
+import threading
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def pool():
+    pool = server.ConnectionPool(server.DATABASE, max_size=1, timeout=0.2)
+    yield pool
+    pool.close_all()
+
+
+def test_close_returns_connection_to_pool(pool):
+    conn = pool.acquire()
+    conn.close()
+    assert pool.current() is None
+    assert pool._idle == [conn]
+    # La connexion n'est pas fermée : elle sert encore au prochain emprunt
+    assert pool.acquire() is conn
+    assert conn.execute('SELECT 1').fetchone()[0] == 1
+    conn.close()
+    assert pool.stats()['created'] == 1
+
+
+def test_nested_acquire_reuses_connection(pool):
+    with pool.connection() as outer:
+        with pool.connection() as inner:
+            assert inner is outer
+            assert outer.depth == 2
+        # La sortie du bloc imbriqué ne rend pas la connexion
+        assert pool.current() is outer
+        assert outer.depth == 1
+    assert pool.current() is None
+    assert pool.stats()['reentrant_checkouts'] == 1
+
+
+def test_uncommitted_transaction_rolled_back_on_release(pool, db):
+    conn = pool.acquire()
+    conn.execute("INSERT INTO users (username, password_hash) VALUES ('pool-rollback', 'x')")
+    conn.close()
+    assert not conn.in_transaction
+    assert db.execute("SELECT 1 FROM users WHERE username = 'pool-rollback'").fetchone() is None
+
+
+def test_exhausted_pool_times_out(pool):
+    held = pool.acquire()
+    errors = []
+
+    def borrow():
+        try:
+            pool.acquire()
+        except server.DatabasePoolTimeout as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=borrow)
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
+    assert pool.stats()['timeouts'] == 1
+    held.close()
+
+
+def test_waiting_thread_gets_released_connection(pool):
+    held = pool.acquire()
+    borrowed = []
+    thread = threading.Thread(target=lambda: borrowed.append(pool.acquire()))
+    pool.timeout = 5
+    thread.start()
+    held.close()
+    thread.join()
+    assert borrowed == [held]
+    borrowed[0].close()
+
+
+# Un contexte distinct (celui d'un autre greenlet) ne voit pas la connexion détenue par le premier
+def test_connection_is_keyed_by_context(pool):
+    held = pool.acquire()
+    pool.timeout = 0.05
+    with pytest.raises(server.DatabasePoolTimeout):
+        contextvars.Context().run(pool.acquire)
+    held.close()
@@ -0,0 +1,53 @@
+import server
+
+
+def make_registry(ttl=-1):
+    # TTL négatif : tout socket ayant déjà envoyé un heartbeat est échu
+    return server.PresenceRegistry(server.LocalPresenceBackend(), ttl=ttl)
+
+
+def test_connect_and_disconnect():
+    presence = make_registry()
+    presence.connect(1, 'sid-a', 'Alice')
+    presence.connect(1, 'sid-b', 'Alice')
+    assert presence.online_users() == [{'id': 1, 'name': 'Alice'}]
+    assert presence.user_for_sid('sid-a') == 1
+
+    presence.disconnect('sid-a')
+    assert presence.online_users() == [{'id': 1, 'name': 'Alice'}]
+    presence.disconnect('sid-b')
+    assert presence.online_users() == []
+
+
+def test_sockets_without_heartbeat_do_not_expire():
+    presence = make_registry()
+    presence.connect(1, 'sid-a', 'Alice')
+    assert presence.expire() == []
+    assert presence.online_users() == [{'id': 1, 'name': 'Alice'}]
+
+
+def test_heartbeat_sockets_expire_after_ttl():
+    presence = make_registry()
+    presence.connect(1, 'sid-a', 'Alice')
+    presence.connect(2, 'sid-b', 'Bob')
+    assert presence.heartbeat('sid-b') == 2
+
+    assert presence.expire() == [(2, 'sid-b')]
+    assert presence.online_users() == [{'id': 1, 'name': 'Alice'}]
+    assert presence.user_for_sid('sid-b') is None
+
+
+def test_heartbeat_keeps_socket_within_ttl():
+    presence = make_registry(ttl=60)
+    presence.connect(1, 'sid-a', 'Alice')
+    presence.heartbeat('sid-a')
+    assert presence.expire() == []
+    assert presence.online_users() == [{'id': 1, 'name': 'Alice'}]
+
+
+def test_socket_switching_user():
+    presence = make_registry()
+    presence.connect(1, 'sid-a', 'Alice')
+    presence.connect(2, 'sid-a', 'Bob')
+    assert presence.online_users() == [{'id': 2, 'name': 'Bob'}]
+    assert presence.heartbeat('unknown') is None
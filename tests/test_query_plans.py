@@ -0,0 +1,18 @@
+import server
+
+
+def test_route_queries_use_indexes(db):
+    assert server.check_query_plans(db) == []
+
+
+def test_messages_pair_index_dropped(db):
+    indexes = {row['name'] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'idx_messages_pair' not in indexes
+    assert 'idx_messages_conversation' in indexes
+
+
+def test_meal_plan_candidates_read_the_index_in_bucket_order(db):
+    plan = [row['detail'] for row in db.execute('EXPLAIN QUERY PLAN ' + server._meal_plan_candidates_query(
+        'Dîner', ['Sèche'])[0], ('Sèche', 'Dîner'))]
+    assert 'SEARCH nutrition USING COVERING INDEX idx_nutrition_meal_plan (category=?)' in plan
+    assert not any('TEMP B-TREE' in detail for detail in plan)
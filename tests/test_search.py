@@ -0,0 +1,37 @@
+import server
+
+
+def test_search_escapes_highlighted_text(client, db):
+    db.execute('''
+        INSERT INTO nutrition (name, ingredients, preparation_time, calories, category, goal_category)
+        VALUES ('Zebrasalade <img src=x onerror=alert(1)>', 'zebrasalade & <script>alert(1)</script>', 5, 300,
+                'Déjeuner', 'Sèche')
+    ''')
+    db.commit()
+    server.catalog_cache.invalidate('nutrition')
+    response = client.get('/search?q=zebrasal&type=nutrition')
+    assert response.status_code == 200
+    result = response.get_json()['results'][0]
+    assert result['highlight'] == '<b>Zebrasalade</b> &lt;img src=x onerror=alert(1)&gt;'
+    assert '<script>' not in result['excerpt'] and '&lt;script&gt;' in result['excerpt']
+    assert result['excerpt'].startswith('<b>zebrasalade</b> &amp;')
+
+
+def test_old_name_match_outranks_recent_ingredient_matches(client, db, monkeypatch):
+    monkeypatch.setattr(server, 'SEARCH_CACHE_SIZE', 0)
+    rows = [('Quokkabowl', 'riz', 10, 400, 'Déjeuner', 'Maintien')]
+    rows += [(f'Salade {index}', 'quokkabowl, tomate', 10, 300, 'Déjeuner', 'Maintien') for index in range(60)]
+    db.executemany('''
+        INSERT INTO nutrition (name, ingredients, preparation_time, calories, category, goal_category)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    db.commit()
+    server.catalog_cache.invalidate('nutrition')
+    # Toutes les correspondances sont classées : la plus ancienne, trouvée dans le nom, reste en tête
+    results = client.get('/search?q=quokkabowl&type=nutrition&limit=5').get_json()['results']
+    assert results[0]['name'] == 'Quokkabowl'
+
+    # Classement borné (opt-in) aux 20 correspondances les plus récentes
+    monkeypatch.setattr(server, 'SEARCH_MAX_CANDIDATES', 20)
+    results = client.get('/search?q=quokkabowl&type=nutrition&limit=5').get_json()['results']
+    assert 'Quokkabowl' not in [result['name'] for result in results]
@@ -0,0 +1,59 @@
+import server
+
+
+def online_ids():
+    return [user['id'] for user in server.presence.online_users()]
+
+
+def connect(user_id=None):
+    auth = {'token': server.issue_session_token(user_id)} if user_id is not None else None
+    return server.socketio.test_client(server.app, auth=auth)
+
+
+def test_anonymous_socket_is_refused():
+    assert not connect().is_connected()
+
+
+# Transition LEGACY_CLIENT_IDS : le socket sans jeton est accepté et annonce son identifiant
+def test_legacy_socket_announces_its_user(make_user, monkeypatch):
+    monkeypatch.setattr(server, 'LEGACY_CLIENT_IDS', True)
+    user_id = make_user(name='Alice')
+    client = connect()
+    assert client.is_connected()
+    client.emit('userConnected', user_id)
+    assert user_id in online_ids()
+    client.disconnect()
+    assert user_id not in online_ids()
+
+
+def test_socket_joins_only_its_own_room(make_user):
+    alice, bob = make_user(name='Alice'), make_user(name='Bob')
+    client = connect(alice)
+    assert client.emit('userConnected', bob, callback=True) == {'error': 'Accès refusé'}
+    assert bob not in online_ids()
+    client.emit('userConnected', alice)
+    assert alice in online_ids()
+    client.disconnect()
+
+
+def test_private_messages_reach_only_the_receiver(make_user):
+    alice, bob, eve = make_user(name='Alice'), make_user(name='Bob'), make_user(name='Eve')
+    sender, receiver, intruder = connect(alice), connect(bob), connect(eve)
+    sender.emit('userConnected', alice, callback=True)
+    receiver.emit('userConnected', bob, callback=True)
+    intruder.emit('userConnected', bob, callback=True)
+
+    ack = sender.emit('sendMessage', {'sender_id': alice, 'receiver_id': bob, 'message': 'Salut'}, callback=True)
+    assert ack['status'] == 'ok'
+    assert [event['name'] for event in receiver.get_received() if event['name'] == 'newMessage'] == ['newMessage']
+    assert [event for event in intruder.get_received() if event['name'] == 'newMessage'] == []
+    for client in (sender, receiver, intruder):
+        client.disconnect()
+
+
+def test_send_message_rejects_forged_sender(make_user):
+    alice, bob = make_user(name='Alice'), make_user(name='Bob')
+    client = connect(alice)
+    ack = client.emit('sendMessage', {'sender_id': bob, 'receiver_id': alice, 'message': 'Faux'}, callback=True)
+    assert ack == {'status': 'error', 'error': 'Expéditeur invalide'}
+    client.disconnect()
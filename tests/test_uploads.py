@@ -0,0 +1,92 @@
+import io
+import os
+import time
+
+import server
+from conftest import auth_headers
+
+
+def create_session(client, user_id, size=10):
+    return client.post('/upload/sessions', headers=auth_headers(user_id), json={'filename': 'video.mp4', 'size': size})
+
+
+def test_upload_session_requires_a_token(client):
+    assert client.post('/upload/sessions', json={'filename': 'video.mp4', 'size': 10, 'user_id': 1}).status_code == 401
+
+
+def test_upload_sessions_are_limited_per_user(client, make_user, monkeypatch):
+    monkeypatch.setattr(server, 'UPLOAD_MAX_OPEN_SESSIONS', 2)
+    user_id, other_id = make_user(), make_user()
+    assert create_session(client, user_id).status_code == 201
+    assert create_session(client, user_id).status_code == 201
+    assert create_session(client, user_id).status_code == 429
+    assert create_session(client, other_id).status_code == 201
+    assert len([name for name in os.listdir(server.UPLOAD_TMP_FOLDER) if name.startswith('session-')]) >= 3
+
+
+def test_upload_session_belongs_to_its_uploader(client, make_user):
+    user_id, other_id = make_user(), make_user()
+    upload_id = create_session(client, user_id).get_json()['upload_id']
+    assert client.get(f'/upload/sessions/{upload_id}', headers=auth_headers(other_id)).status_code == 403
+    assert client.put(f'/upload/sessions/{upload_id}', headers=auth_headers(other_id), data=b'x').status_code == 403
+
+
+class Body(io.BytesIO):
+    # Note si une connexion du pool est détenue pendant la réception du corps
+    held = []
+
+    def read(self, *args):
+        self.held.append(server.db_pool.current() is not None)
+        return super().read(*args)
+
+    def readinto(self, buffer):
+        self.held.append(server.db_pool.current() is not None)
+        return super().readinto(buffer)
+
+
+def test_upload_chunk_streams_without_a_pooled_connection(client, make_user):
+    user_id = make_user()
+    upload_id = create_session(client, user_id, size=6).get_json()['upload_id']
+    url = f'/upload/sessions/{upload_id}'
+    response = client.put(url, headers=auth_headers(user_id), input_stream=Body(b'abc'), content_length=3)
+    assert response.get_json()['received'] == 3
+    assert client.put(url + '?offset=0', headers=auth_headers(user_id), data=b'def').status_code == 409
+    response = client.put(url, headers=auth_headers(user_id), input_stream=Body(b'def'), content_length=3)
+    assert response.status_code == 201
+    assert Body.held and not any(Body.held)
+    assert client.get(url, headers=auth_headers(user_id)).status_code == 404
+
+
+def test_purge_removes_stale_sessions_and_orphans(client, make_user, db):
+    user_id = make_user()
+    stale = create_session(client, user_id).get_json()['upload_id']
+    fresh = create_session(client, user_id).get_json()['upload_id']
+    db.execute("UPDATE upload_sessions SET updated_at = '2000-01-01 00:00:00' WHERE id = ?", (stale,))
+    db.commit()
+    orphan = os.path.join(server.UPLOAD_TMP_FOLDER, 'session-orphan')
+    open(orphan, 'wb').close()
+    old = time.time() - 48 * 3600
+    os.utime(orphan, (old, old))
+
+    server.purge_upload_sessions()
+    remaining = {row['id'] for row in db.execute('SELECT id FROM upload_sessions WHERE uploader_id = ?', (user_id,))}
+    assert remaining == {fresh}
+    assert not os.path.exists(os.path.join(server.UPLOAD_TMP_FOLDER, f'session-{stale}'))
+    assert os.path.exists(os.path.join(server.UPLOAD_TMP_FOLDER, f'session-{fresh}'))
+    assert not os.path.exists(orphan)
+
+
+def test_upload_file_records_the_token_user(client, db, make_user, monkeypatch):
+    user_id, other_id = make_user(), make_user()
+    form = lambda: {'file': (io.BytesIO(b'photo'), 'photo.jpg'), 'user_id': str(other_id)}
+    assert client.post('/upload', data=form()).status_code == 401
+
+    response = client.post('/upload', headers=auth_headers(user_id), data=form())
+    assert response.status_code == 200
+    row = db.execute('SELECT uploader_id FROM uploaded_files WHERE id = ?', (response.get_json()['id'],)).fetchone()
+    assert row['uploader_id'] == user_id
+
+    monkeypatch.setattr(server, 'LEGACY_CLIENT_IDS', True)
+    response = client.post('/upload', data=form())
+    row = db.execute('SELECT uploader_id FROM uploaded_files WHERE id = ?', (response.get_json()['id'],)).fetchone()
+    assert row['uploader_id'] == other_id
@@ -0,0 +1,188 @@
+import json
+import multiprocessing
+import socket
+import threading
+import time
+import urllib.request
+
+import socketio
+from itsdangerous import URLSafeTimedSerializer
+
+import server
+
+
+# Courtier de remplacement : relaie chaque ligne reçue à tous les processus connectés,
+# comme le PUB/SUB du broker ZeroMQ (run_zmq_broker)
+class LineBroker:
+    def __init__(self, path):
+        self.path = path
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen()
+        self.connections = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            with self.lock:
+                self.connections.append(conn)
+            threading.Thread(target=self._relay, args=(conn,), daemon=True).start()
+
+    def _relay(self, conn):
+        try:
+            for line in conn.makefile('rb'):
+                with self.lock:
+                    for other in self.connections:
+                        other.sendall(line)
+        except OSError:
+            pass
+
+    def close(self):
+        self.listener.close()
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+
+
+class LineBrokerManager(socketio.PubSubManager):
+    name = 'line-broker'
+
+    def __init__(self, path, channel='flask-socketio'):
+        super().__init__(channel=channel)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.send_lock = threading.Lock()
+
+    def _publish(self, data):
+        with self.send_lock:
+            self.sock.sendall(json.dumps(data).encode('utf-8') + b'\n')
+
+    def _listen(self):
+        for line in self.sock.makefile('rb'):
+            yield line.decode('utf-8')
+
+
+# Client Socket.IO minimal (long-polling engine.io v4) pour parler à un vrai worker
+class PollingClient:
+    def __init__(self, base_url):
+        self.url = base_url + '/socket.io/?EIO=4&transport=polling'
+        handshake = json.loads(self._get()[0][1:])
+        self.url += '&sid=' + handshake['sid']
+
+    def _get(self):
+        with urllib.request.urlopen(self.url, timeout=30) as response:
+            return response.read().decode('utf-8').split('\x1e')
+
+    def _post(self, packet):
+        request = urllib.request.Request(self.url, data=packet.encode('utf-8'), method='POST',
+                                         headers={'Content-Type': 'text/plain;charset=UTF-8'})
+        urllib.request.urlopen(request, timeout=30).close()
+
+    def connect(self, auth):
+        self._post('40' + json.dumps(auth))
+        return [packet for packet in self._get() if packet.startswith('40')]
+
+    def emit(self, event, *args):
+        self._post('42' + json.dumps([event, *args]))
+
+    def wait_for(self, event, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for packet in self._get():
+                if packet == '2':
+                    self._post('3')
+                elif packet.startswith('42'):
+                    name, *args = json.loads(packet[2:])
+                    if name == event:
+                        return args
+        return None
+
+
+def _serve(broker_path, port):
+    # Équivalent de SOCKETIO_MESSAGE_QUEUE, avec le courtier de remplacement
+    manager = LineBrokerManager(broker_path)
+    manager.set_server(server.socketio.server)
+    server.socketio.server.manager = manager
+    server.run_worker('127.0.0.1', port)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(port)
+
+
+def test_emit_reaches_client_on_another_worker(tmp_path, monkeypatch, make_user):
+    user_id, admin_id = make_user(name='Alice'), make_user(role='admin')
+    # Même clé sur tous les workers : un jeton émis ici est accepté par chacun d'eux
+    monkeypatch.setenv('SECRET_KEY', 'fanout-test-secret')
+    tokens = URLSafeTimedSerializer('fanout-test-secret', salt='session')
+    broker = LineBroker(str(tmp_path / 'broker.sock'))
+    context = multiprocessing.get_context('spawn')
+    ports = [_free_port(), _free_port()]
+    workers = [context.Process(target=_serve, args=(broker.path, port), daemon=True) for port in ports]
+    try:
+        for worker in workers:
+            worker.start()
+        for port in ports:
+            _wait_for_port(port)
+
+        # Client connecté au premier worker, notification créée sur le second
+        client = PollingClient(f'http://127.0.0.1:{ports[0]}')
+        assert client.connect({'token': tokens.dumps({'user_id': user_id})})
+        client.emit('userConnected', user_id)
+        time.sleep(0.2)
+        request = urllib.request.Request(
+            f'http://127.0.0.1:{ports[1]}/notification', method='POST',
+            data=json.dumps({'user_id': user_id, 'message': 'Séance annulée', 'date': '2025-06-01'}).encode('utf-8'),
+            headers={'Content-Type': 'application/json',
+                     'Authorization': f"Bearer {tokens.dumps({'user_id': admin_id})}"})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            assert response.status == 201
+
+        received = client.wait_for('notification')
+        assert received is not None
+        assert received[0]['message'] == 'Séance annulée'
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join(5)
+        broker.close()
+
+
+def test_run_workers_forks_without_pooled_connections(monkeypatch):
+    idle_at_start = []
+
+    class RecordingProcess:
+        def __init__(self, target, args):
+            pass
+
+        def start(self):
+            idle_at_start.append(server.db_pool.stats()['idle'])
+
+        def join(self):
+            pass
+
+    monkeypatch.setattr(server, 'SOCKETIO_MESSAGE_QUEUE', 'zmq+tcp://localhost:5555+5556')
+    monkeypatch.setattr(server.multiprocessing, 'Process', RecordingProcess)
+    with server.db_pool.connection():
+        pass
+    assert server.db_pool.stats()['idle'] >= 1
+    server.run_workers('127.0.0.1', 5000, 2)
+    assert idle_at_start == [0, 0]
@@ -0,0 +1,43 @@
+import server
+from conftest import auth_headers
+
+
+def add_workouts(db, user_id, dates):
+    ids = []
+    for date in dates:
+        cursor = db.execute('INSERT INTO workouts (user_id, date, type, duration, exercises) VALUES (?, ?, ?, ?, ?)',
+                            (user_id, date, 'Course', 30, ''))
+        ids.append(cursor.lastrowid)
+    db.commit()
+    return ids
+
+
+def all_pages(client, user_id, **params):
+    url = f'/workouts/{user_id}?' + '&'.join(f'{key}={value}' for key, value in params.items())
+    workouts, cursor = [], None
+    while True:
+        response = client.get(url + (f'&cursor={cursor}' if cursor else ''), headers=auth_headers(user_id))
+        assert response.status_code == 200
+        page = response.get_json()
+        workouts += page['workouts']
+        cursor = page['next_cursor']
+        if not page['has_more']:
+            return workouts
+
+
+def test_keyset_pagination_keeps_undated_workouts(client, db, make_user):
+    user_id = make_user()
+    add_workouts(db, user_id, ['2025-01-01', None, '2025-03-01', '2025-02-01', None])
+    unpaginated = client.get(f'/workouts/{user_id}', headers=auth_headers(user_id)).get_json()
+
+    for limit in (1, 2, 3, 10):
+        workouts = all_pages(client, user_id, limit=limit)
+        assert [workout['id'] for workout in workouts] == [workout['id'] for workout in unpaginated]
+    assert [workout['date'] for workout in unpaginated] == ['2025-03-01', '2025-02-01', '2025-01-01', None, None]
+
+
+def test_date_window_pagination(client, db, make_user):
+    user_id = make_user()
+    add_workouts(db, user_id, ['2025-01-01', None, '2025-03-01', '2025-02-01', '2024-12-01'])
+    workouts = all_pages(client, user_id, limit=1, **{'from': '2025-01-01'})
+    assert [workout['date'] for workout in workouts] == ['2025-03-01', '2025-02-01', '2025-01-01']